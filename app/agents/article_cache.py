@@ -0,0 +1,223 @@
+"""
+Per-article summary cache in the `articles` table.
+
+Endpoints serve a stored full-article summary instead of re-summarizing as
+long as it was checked against Wikipedia within ARTICLE_CACHE_MAX_AGE_SECONDS;
+the freshness refresher keeps hot entries checked and re-summarizes the ones
+whose article changed. Entries up to ARTICLE_CACHE_STALE_SECONDS older are
+served while they are re-checked in the background (stale-while-revalidate),
+and entries of any age when Wikipedia or the LLM is unavailable.
+
+Endpoints, batches and prefetches all go through `get_cached_summary` and
+`summarize_article`, so an article is summarized once and reused everywhere.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.metrics import record_cache_lookup, track_stage
+from app.core.resilience import CircuitOpenError
+from app.core.shared_state import get_shared_state
+from app.core.usage import persist_usage, start_tracking
+from app.db import models
+from app.db.database import SessionLocal
+from app.agents.summarizer import Summary
+from app.agents.wikipedia_search import WikipediaArticle, parse_sections, select_sections
+
+logger = logging.getLogger(__name__)
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+def as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # SQLite drops the timezone of stored datetimes
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+def is_fresh(article: models.Article, max_age: float) -> bool:
+    """Whether the article was checked or re-summarized within the last `max_age` seconds."""
+    seen = [as_utc(t) for t in (article.checked_at, article.refreshed_at) if t is not None]
+    return bool(seen) and max(seen) >= utcnow() - timedelta(seconds=max_age)
+
+def summarized_sections(article: models.Article) -> List[str]:
+    return [section.title for section in select_sections(parse_sections(article.content or ""))]
+
+def get_cached_article(db: Session, url: str, max_age: Optional[float] = None) -> Optional[models.Article]:
+    """
+    Return the cached article if its summary was checked within `max_age`
+    seconds (ARTICLE_CACHE_MAX_AGE_SECONDS by default), counting the access.
+    """
+    if not settings.ARTICLE_CACHE_ENABLED:
+        return None
+    if max_age is None:
+        max_age = settings.ARTICLE_CACHE_MAX_AGE_SECONDS
+    article = db.query(models.Article).filter(models.Article.url == url).first()
+    hit = bool(article and article.summary and is_fresh(article, max_age))
+    record_cache_lookup("article", hit)
+    if not hit:
+        return None
+
+    article.access_count = (article.access_count or 0) + 1
+    article.last_accessed_at = utcnow()
+    db.commit()
+    return article
+
+def get_stale_article(db: Session, url: str) -> Optional[models.Article]:
+    """Return the cached article whatever its age, for when it can't be fetched or summarized now."""
+    if not settings.ARTICLE_CACHE_ENABLED:
+        return None
+    article = db.query(models.Article).filter(models.Article.url == url, models.Article.summary.isnot(None)).first()
+    record_cache_lookup("article_stale", article is not None)
+    return article
+
+def store_article(db: Session, article: WikipediaArticle, summary: str, count_access: bool = True) -> None:
+    """Save a freshly generated full-article summary."""
+    if not settings.ARTICLE_CACHE_ENABLED:
+        return
+    now = utcnow()
+    cached = db.query(models.Article).filter(models.Article.url == article.url).first()
+    if cached is None:
+        cached = models.Article(url=article.url, access_count=0)
+        db.add(cached)
+    if cached.revision_id != article.revision_id:
+        # The size is only known once the refresher checks this revision
+        cached.revision_size = None
+    cached.title = article.title
+    cached.content = article.content
+    cached.summary = summary
+    cached.revision_id = article.revision_id
+    if count_access:
+        cached.access_count = (cached.access_count or 0) + 1
+        cached.last_accessed_at = now
+    cached.checked_at = now
+    cached.refreshed_at = now
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another request cached the same article first
+        db.rollback()
+        logger.info(f"Article {article.url} was cached concurrently")
+
+def as_summary(article: models.Article) -> Tuple[str, str, Summary]:
+    return article.title, article.content, Summary(summary=article.summary, sections=summarized_sections(article))
+
+def get_cached_summary(db: Session, url: str, wikipedia_searcher, summarizer) -> Optional[Tuple[str, str, Summary]]:
+    """
+    Title, content and summary of the cached article at `url` if it is current,
+    or stale within ARTICLE_CACHE_STALE_SECONDS (it is then re-checked in the
+    background).
+    """
+    cached = get_cached_article(db, url, settings.ARTICLE_CACHE_MAX_AGE_SECONDS + settings.ARTICLE_CACHE_STALE_SECONDS)
+    result = None
+    if cached:
+        if not is_fresh(cached, settings.ARTICLE_CACHE_MAX_AGE_SECONDS):
+            schedule_revalidation(url, wikipedia_searcher, summarizer)
+        result = as_summary(cached)
+    # Callers go on to fetch and summarize, which takes seconds; don't hold a pooled connection meanwhile
+    db.commit()
+    return result
+
+async def summarize_article(
+    db: Session,
+    url: str,
+    sections: Optional[List[str]],
+    wikipedia_searcher,
+    summarizer,
+    on_token: Optional[Callable[[str], Awaitable[None]]] = None
+) -> Optional[Tuple[str, str, Summary]]:
+    """
+    Return the title, content and summary of the article at `url`, or None if
+    it can't be fetched and nothing is cached. Full-article summaries come from
+    the cache when current and are cached when new; whatever is cached is
+    served when Wikipedia or the LLM is unavailable.
+    """
+    if not sections:
+        cached = get_cached_summary(db, url, wikipedia_searcher, summarizer)
+        if cached:
+            return cached
+    
+    try:
+        with track_stage("content_fetch"):
+            article = await wikipedia_searcher.get_article(url)
+    except CircuitOpenError:
+        # Wikipedia is down: serve what we have, or let the caller report it as unavailable
+        stale = None if sections else get_stale_article(db, url)
+        if stale:
+            logger.warning(f"Serving a stale summary of {url}: Wikipedia is unavailable")
+            return as_summary(stale)
+        raise
+    if not article:
+        stale = None if sections else get_stale_article(db, url)
+        if stale:
+            logger.warning(f"Serving a stale summary of {url}: the article could not be fetched")
+            return as_summary(stale)
+        return None
+    
+    summary = await summarizer.summarize(article.content, sections, on_token=on_token)
+    if sections:
+        return article.title, article.content, summary
+    if summary.degraded:
+        # An older LLM summary beats an extractive one
+        stale = get_stale_article(db, url)
+        if stale:
+            logger.warning(f"Serving a stale summary of {url}: the LLM is unavailable or over budget")
+            return as_summary(stale)
+    else:
+        with track_stage("db_write"):
+            store_article(db, article, summary.summary)
+    return article.title, article.content, summary
+
+# url -> revalidation running in this worker
+_revalidations: Dict[str, asyncio.Task] = {}
+
+def schedule_revalidation(url: str, wikipedia_searcher, summarizer, session_factory=SessionLocal) -> None:
+    """Re-check a stale cached article in the background while it is being served."""
+    if url in _revalidations:
+        return
+    task = asyncio.create_task(revalidate_article(url, wikipedia_searcher, summarizer, session_factory))
+    _revalidations[url] = task
+    task.add_done_callback(lambda _: _revalidations.pop(url, None))
+
+async def revalidate_article(url: str, wikipedia_searcher, summarizer, session_factory=SessionLocal) -> None:
+    """Mark the cached article checked if it is unchanged, otherwise re-summarize it."""
+    # Only one worker revalidates a given article at a time
+    if not await get_shared_state().add(f"article:revalidate:{url}", True, ttl=300):
+        return
+    # Background work is tracked on its own, not billed to the request that triggered it
+    tracker = start_tracking(max_tokens=0)
+    try:
+        article = await wikipedia_searcher.get_article(url)
+        if article is None:
+            return
+        
+        def mark_checked_if_unchanged() -> bool:
+            with session_factory() as db:
+                cached = db.query(models.Article).filter(models.Article.url == url).first()
+                if cached is None or article.revision_id is None or cached.revision_id != article.revision_id:
+                    return False
+                cached.checked_at = utcnow()
+                db.commit()
+                return True
+        
+        if await asyncio.to_thread(mark_checked_if_unchanged):
+            return
+        
+        logger.info(f"Revalidating {url}: the article changed, re-summarizing")
+        summary = await summarizer.summarize(article.content)
+        await persist_usage(tracker, None, article.title, session_factory)
+        if summary.degraded:
+            return
+        
+        def store():
+            with session_factory() as db:
+                store_article(db, article, summary.summary, count_access=False)
+        
+        await asyncio.to_thread(store)
+    except Exception as e:
+        logger.warning(f"Revalidating {url} failed: {str(e)}")
+    finally:
+        await get_shared_state().delete(f"article:revalidate:{url}")
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from app.core.metrics import current_request_id, record_cache_lookup, track_stage
+from app.core.usage import start_tracking
+from app.db.database import SessionLocal
+from app.agents.article_cache import summarize_article
+
+logger = logging.getLogger(__name__)
+
+class BatchSummarizer:
+    """
+    Run the summarize pipeline for many queries at once.
+
+    Work is shared across the batch: duplicate queries extract their topic once,
+    queries with the same topic search once, and queries that land on the same
+    article fetch and summarize it once, or reuse its cached summary. A
+    semaphore bounds how many topic extractions, searches and article
+    summarizations run at once. A summarization fans out over the article's
+    chunks with up to SUMMARY_MAX_CONCURRENCY LLM calls in flight, so a batch
+    has at most `concurrency` x SUMMARY_MAX_CONCURRENCY LLM calls going out.
+    """
+
+    def __init__(
+        self,
+        topic_extractor,
+        wikipedia_searcher,
+        summarizer,
+        concurrency: int,
+        sections: Optional[List[str]] = None,
+        session_factory=SessionLocal
+    ):
+        self.topic_extractor = topic_extractor
+        self.wikipedia_searcher = wikipedia_searcher
+        self.summarizer = summarizer
+        self.sections = sections
+        self.session_factory = session_factory
+        self._semaphore = asyncio.Semaphore(concurrency)
+        # (kind, key) -> the single in-flight task for that piece of work
+        self._flights: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    def _once(self, kind: str, key: str, factory: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        task = self._flights.get((kind, key))
+        record_cache_lookup(f"batch_{kind}", task is not None)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._flights[(kind, key)] = task
+        return task
+
+    async def _limited(self, stage: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        async with self._semaphore:
+            with track_stage(stage):
+                return await call()
+
+    async def _topic(self, query: str) -> str:
+        extraction = await self._once(
+            "topic", query.strip().lower(),
+            lambda: self._limited("topic_extraction", lambda: self.topic_extractor.extract_topic(query))
+        )
+        return extraction.topic
+
+    async def _search(self, topic: str):
+        return await self._once(
+            "search", topic.strip().lower(),
+            lambda: self._limited("search", lambda: self.wikipedia_searcher.search(topic))
+        )
+
+    async def _article(self, url: str) -> Tuple[str, Any]:
+        async def fetch_and_summarize():
+            # summarize_article and the summarizer track their own stages
+            async with self._semaphore:
+                with self.session_factory() as db:
+                    article = await summarize_article(
+                        db, url, self.sections, self.wikipedia_searcher, self.summarizer
+                    )
+            if article is None:
+                raise ValueError("Could not retrieve article content")
+            _, content, summary = article
+            return content, summary
+
+        return await self._once("article", url, fetch_and_summarize)
+
+    async def _process(self, index: int, query: str) -> Dict[str, Any]:
+        # Each query gets its own token budget; shared work counts against the query that started it
+        tracker = start_tracking()
+        try:
+            topic = await self._topic(query)
+            search_results = await self._search(topic)
+            if not search_results:
+                raise ValueError("No Wikipedia articles found for the query")
+            best_result = search_results[0] if isinstance(search_results, list) else search_results
+            content, summary = await self._article(best_result.url)
+            return {
+                "index": index,
+                "query": query,
+                "status": "success",
+                "topic": topic,
+                "title": best_result.title,
+                "source_url": best_result.url,
+                "summary": summary.summary,
+                "sections": summary.sections,
+                "degraded": summary.degraded,
+                "content": content,
+                "usage": tracker
+            }
+        except Exception as e:
+            logger.error(f"[{current_request_id()}] Batch query {index} failed: {str(e)}")
+            return {"index": index, "query": query, "status": "error", "detail": str(e), "usage": tracker}
+
+    async def run(self, queries: List[str]) -> AsyncIterator[Dict[str, Any]]:
+        """Yield one result per query, in the order they complete."""
+        tasks = [asyncio.ensure_future(self._process(index, query)) for index, query in enumerate(queries)]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield await next_result
+        finally:
+            # The client may disconnect before the batch is done
+            for task in list(tasks) + list(self._flights.values()):
+                task.cancel()
@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+from pydantic import BaseModel, Field
+from app.core.config import settings
+from app.core.metrics import record_cache_lookup
+from app.core.shared_state import SharedStateStore, get_shared_state
+from app.core.usage import persist_usage, start_tracking
+from app.db.database import SessionLocal
+from app.agents.article_cache import get_cached_summary, store_article
+
+logger = logging.getLogger(__name__)
+
+class PrefetchedSummary(BaseModel):
+    url: str = Field(description="The URL of the prefetched Wikipedia article")
+    title: str = Field(description="The title of the prefetched Wikipedia article")
+    content: str = Field(description="The full content of the article")
+    summary: str = Field(description="The speculatively generated summary")
+    sections: List[str] = Field(default_factory=list, description="Titles of the sections that were summarized")
+    degraded: bool = Field(default=False, description="Extractive summary because the LLM was over budget or unavailable")
+
+class SpeculativePrefetcher:
+    """
+    Fetch and summarize the top-ranked candidate while the user is still choosing.
+
+    Finished prefetches are published to the shared state store, so the confirm
+    request can be served by a different worker than the one that prefetched.
+    Articles with a cached summary are not summarized again, and new summaries
+    are added to the article cache.
+    """
+
+    def __init__(
+        self,
+        wikipedia_searcher,
+        summarizer,
+        state: Optional[SharedStateStore] = None,
+        session_factory=SessionLocal
+    ):
+        self.wikipedia_searcher = wikipedia_searcher
+        self.summarizer = summarizer
+        self.state = state or get_shared_state()
+        self.session_factory = session_factory
+        # query_id -> (url, started_at, task) of prefetches still running
+        self._tasks: Dict[int, Tuple[str, float, asyncio.Task]] = {}
+
+    async def schedule(self, query_id: int, url: str, title: str) -> bool:
+        """Start prefetching `url` for a query. Only one candidate is prefetched per query."""
+        if not settings.SPECULATIVE_PREFETCH_ENABLED:
+            return False
+
+        self._evict_expired()
+        # A refined search replaces whatever was being prefetched for this query
+        self._cancel_local(query_id)
+        await self.state.delete(self._cancelled_key(query_id))
+
+        pending = sum(1 for _, _, task in self._tasks.values() if not task.done())
+        if pending >= settings.SPECULATIVE_MAX_PENDING:
+            logger.info(f"Skipping speculative prefetch for query {query_id}: too many pending prefetches")
+            return False
+
+        logger.info(f"Starting speculative prefetch for query {query_id}: {url}")
+        task = asyncio.create_task(self._run(query_id, url, title))
+        self._tasks[query_id] = (url, time.monotonic(), task)
+        # A finished result is in the shared state store, where any worker's claim finds it
+        task.add_done_callback(lambda _: self._forget(query_id, task))
+        return True
+
+    async def claim(self, query_id: int, url: str) -> Optional[PrefetchedSummary]:
+        """
+        Return the prefetched summary if the user picked the prefetched candidate.
+        Cancels the prefetch otherwise.
+        """
+        if not settings.SPECULATIVE_PREFETCH_ENABLED:
+            return None
+
+        entry = self._tasks.pop(query_id, None)
+        if entry is None:
+            # The prefetch may have run on another worker
+            prefetched = await self._claim_shared(query_id, url)
+            record_cache_lookup("speculative", hit=prefetched is not None)
+            return prefetched
+
+        prefetched_url, _, task = entry
+        if prefetched_url != url:
+            logger.info(f"User picked a different article for query {query_id}, cancelling prefetch")
+            task.cancel()
+            record_cache_lookup("speculative", hit=False)
+            return None
+
+        logger.info(f"Using speculative prefetch for query {query_id} (done: {task.done()})")
+        prefetched = await task
+        await self.state.delete(self._result_key(query_id))
+        record_cache_lookup("speculative", hit=prefetched is not None)
+        return prefetched
+
+    async def cancel(self, query_id: int) -> None:
+        """Cancel a pending prefetch for a query, on this or any other worker."""
+        self._cancel_local(query_id)
+        await self.state.set(self._cancelled_key(query_id), True, ttl=settings.SPECULATIVE_RESULT_TTL_SECONDS)
+
+    async def _claim_shared(self, query_id: int, url: str) -> Optional[PrefetchedSummary]:
+        shared = await self.state.get(self._result_key(query_id))
+        if shared is not None and shared["url"] == url:
+            logger.info(f"Using speculative prefetch for query {query_id} from another worker")
+            await self.state.delete(self._result_key(query_id))
+            return PrefetchedSummary(**shared)
+
+        # Stop a prefetch that may still be running elsewhere
+        await self.cancel(query_id)
+        return None
+
+    def _forget(self, query_id: int, task: asyncio.Task) -> None:
+        entry = self._tasks.get(query_id)
+        if entry is not None and entry[2] is task:
+            del self._tasks[query_id]
+
+    def _cancel_local(self, query_id: int) -> None:
+        entry = self._tasks.pop(query_id, None)
+        if entry is not None:
+            entry[2].cancel()
+
+    @staticmethod
+    def _result_key(query_id: int) -> str:
+        return f"speculative:{query_id}"
+
+    @staticmethod
+    def _cancelled_key(query_id: int) -> str:
+        return f"speculative:{query_id}:cancelled"
+
+    def _evict_expired(self) -> None:
+        now = time.monotonic()
+        for query_id, (_, started_at, task) in list(self._tasks.items()):
+            if now - started_at > settings.SPECULATIVE_RESULT_TTL_SECONDS:
+                logger.info(f"Discarding expired speculative prefetch for query {query_id}")
+                task.cancel()
+                del self._tasks[query_id]
+
+    async def _run(self, query_id: int, url: str, title: str) -> Optional[PrefetchedSummary]:
+        # Speculative work is billed to the query, whether or not the user picks it
+        tracker = start_tracking()
+        try:
+            with self.session_factory() as db:
+                cached = get_cached_summary(db, url, self.wikipedia_searcher, self.summarizer)
+                if cached:
+                    _, content, summary = cached
+                else:
+                    article = await self.wikipedia_searcher.get_article(url)
+                    if not article:
+                        return None
+                    content = article.content
+
+                    # Cost cap: never spend more than one capped summarization per query speculatively.
+                    # The length is only known once the whole article has been fetched, so this
+                    # caps the summarization, not the fetch
+                    if len(content) > settings.SPECULATIVE_MAX_CONTENT_LENGTH:
+                        logger.info(
+                            f"Skipping speculative summary for query {query_id}: content length "
+                            f"{len(content)} exceeds {settings.SPECULATIVE_MAX_CONTENT_LENGTH}"
+                        )
+                        return None
+
+                    if await self.state.get(self._cancelled_key(query_id)):
+                        logger.info(f"Speculative prefetch for query {query_id} was cancelled by another worker")
+                        return None
+
+                    try:
+                        summary = await self.summarizer.summarize(content)
+                    finally:
+                        await persist_usage(tracker, query_id, title, self.session_factory)
+                    if summary.degraded:
+                        # Leave it to the confirm request, which may still get an LLM or cached summary
+                        logger.info(f"Discarding degraded speculative summary for query {query_id}")
+                        return None
+                    store_article(db, article, summary.summary)
+            logger.info(f"Speculative prefetch for query {query_id} completed")
+            prefetched = PrefetchedSummary(
+                url=url,
+                title=title,
+                content=content,
+                summary=summary.summary,
+                sections=summary.sections,
+                degraded=summary.degraded
+            )
+            if not await self.state.get(self._cancelled_key(query_id)):
+                await self.state.set(
+                    self._result_key(query_id),
+                    prefetched.model_dump(),
+                    ttl=settings.SPECULATIVE_RESULT_TTL_SECONDS
+                )
+            return prefetched
+        except asyncio.CancelledError:
+            logger.info(f"Speculative prefetch for query {query_id} cancelled")
+            raise
+        except Exception as e:
+            logger.warning(f"Speculative prefetch for query {query_id} failed: {str(e)}")
+            return None
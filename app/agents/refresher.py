@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+from pydantic import BaseModel
+from app.core.config import settings
+from app.core.shared_state import SharedStateStore, get_shared_state
+from app.core.usage import persist_usage, start_tracking
+from app.db import models
+from app.db.database import SessionLocal
+from app.agents.article_cache import utcnow
+
+logger = logging.getLogger(__name__)
+
+class RefreshCandidate(BaseModel):
+    id: int
+    url: str
+    title: str
+    revision_id: Optional[int]
+    revision_size: Optional[int]
+    access_count: int
+
+class FreshnessRefresher:
+    """
+    Keep cached article summaries current in the background.
+
+    Each cycle checks the latest revision of the most accessed articles in
+    batched MediaWiki requests, then re-summarizes the ones whose size changed
+    by at least REFRESH_MIN_DIFF_BYTES since they were summarized, most
+    accessed first, until the hourly token budget is spent. Only one worker
+    runs a given cycle.
+    """
+
+    def __init__(self, wikipedia_searcher, summarizer, session_factory=SessionLocal, state: Optional[SharedStateStore] = None):
+        self.wikipedia_searcher = wikipedia_searcher
+        self.summarizer = summarizer
+        self.session_factory = session_factory
+        self.state = state or get_shared_state()
+        self._token = uuid.uuid4().hex
+
+    async def run_forever(self) -> None:
+        logger.info(f"Freshness refresher started (every {settings.REFRESH_INTERVAL_SECONDS}s)")
+        while True:
+            try:
+                await self.refresh_once()
+            except Exception as e:
+                logger.error(f"Freshness refresh failed: {str(e)}")
+            await asyncio.sleep(settings.REFRESH_INTERVAL_SECONDS)
+
+    async def refresh_once(self) -> Dict[str, int]:
+        """Run one refresh cycle and return what it did."""
+        stats = {"checked": 0, "changed": 0, "refreshed": 0, "over_budget": 0}
+        # Leave a little slack so the next cycle of whichever worker gets there first isn't skipped
+        if not await self.state.add("refresher:cycle", self._token, ttl=settings.REFRESH_INTERVAL_SECONDS * 0.9):
+            return stats
+
+        candidates = await asyncio.to_thread(self._load_candidates)
+        changed: List[Tuple[RefreshCandidate, Dict[str, int]]] = []
+        for start in range(0, len(candidates), settings.REFRESH_BATCH_SIZE):
+            batch = candidates[start:start + settings.REFRESH_BATCH_SIZE]
+            revisions = await self.wikipedia_searcher.get_revisions([c.title for c in batch])
+            checked = [(c, revisions[c.title]) for c in batch if c.title in revisions]
+            stats["checked"] += len(checked)
+            changed.extend((c, revision) for c, revision in checked if self._changed_meaningfully(c, revision))
+            # Changed articles only count as checked once re-summarized (in _store); until then
+            # they stay stale, so a budget-skipped or failed one is revalidated when served
+            unchanged = [(c, revision) for c, revision in checked if not self._changed_meaningfully(c, revision)]
+            await asyncio.to_thread(self._mark_checked, unchanged)
+        stats["changed"] = len(changed)
+
+        # Candidates are ordered by access count, so the budget goes to the hottest articles
+        for index, (candidate, revision) in enumerate(changed):
+            # Wikitext bytes overestimate the plain text, which keeps the estimate conservative
+            if not await self._reserve_tokens(revision["size"] // 4):
+                stats["over_budget"] = len(changed) - index
+                logger.info(f"Refresh token budget spent, {stats['over_budget']} changed articles left for later")
+                break
+            article = await self.wikipedia_searcher.get_article(candidate.url)
+            if not article:
+                continue
+            # The refresher has its own hourly budget rather than a per-request one
+            tracker = start_tracking(max_tokens=0)
+            summary = await self.summarizer.summarize(article.content)
+            await persist_usage(tracker, None, candidate.title, self.session_factory)
+            if summary.degraded:
+                # Keep the LLM summary we have rather than replace it with an extractive one
+                continue
+            await asyncio.to_thread(self._store, candidate, article, revision, summary.summary)
+            stats["refreshed"] += 1
+
+        logger.info(
+            f"Freshness refresh: checked {stats['checked']}, changed {stats['changed']}, "
+            f"refreshed {stats['refreshed']}"
+        )
+        return stats
+
+    @staticmethod
+    def _changed_meaningfully(candidate: RefreshCandidate, revision: Dict[str, int]) -> bool:
+        if revision["revision_id"] == candidate.revision_id:
+            return False
+        if candidate.revision_size is None:
+            # No size to compare against, so any new revision counts
+            return True
+        return abs(revision["size"] - candidate.revision_size) >= settings.REFRESH_MIN_DIFF_BYTES
+
+    async def _reserve_tokens(self, tokens: int) -> bool:
+        key = f"refresher:tokens:{int(time.time() // 3600)}"
+        spent = await self.state.incr(key, tokens, ttl=3600)
+        if spent > settings.REFRESH_TOKEN_BUDGET_PER_HOUR:
+            await self.state.incr(key, -tokens, ttl=3600)
+            return False
+        return True
+
+    def _load_candidates(self) -> List[RefreshCandidate]:
+        with self.session_factory() as db:
+            rows = (
+                db.query(models.Article)
+                .filter(models.Article.summary.isnot(None))
+                .order_by(models.Article.access_count.desc(), models.Article.id)
+                .limit(settings.REFRESH_MAX_ARTICLES)
+                .all()
+            )
+            return [
+                RefreshCandidate(
+                    id=row.id,
+                    url=row.url,
+                    title=row.title,
+                    revision_id=row.revision_id,
+                    revision_size=row.revision_size,
+                    access_count=row.access_count or 0
+                ) for row in rows if row.title
+            ]
+
+    def _mark_checked(self, checked: List[Tuple[RefreshCandidate, Dict[str, int]]]) -> None:
+        if not checked:
+            return
+        now = utcnow()
+        with self.session_factory() as db:
+            for candidate, revision in checked:
+                row = db.get(models.Article, candidate.id)
+                if row is None:
+                    continue
+                row.checked_at = now
+                if row.revision_id == revision["revision_id"] and row.revision_size is None:
+                    row.revision_size = revision["size"]
+            db.commit()
+
+    def _store(self, candidate: RefreshCandidate, article, revision: Dict[str, int], summary: str) -> None:
+        now = utcnow()
+        with self.session_factory() as db:
+            row = db.get(models.Article, candidate.id)
+            if row is None:
+                return
+            row.content = article.content
+            row.summary = summary
+            row.revision_id = article.revision_id or revision["revision_id"]
+            row.revision_size = revision["size"] if row.revision_id == revision["revision_id"] else None
+            row.checked_at = now
+            row.refreshed_at = now
+            db.commit()
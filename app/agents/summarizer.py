@@ -1,30 +1,37 @@
-from langchain.chat_models import ChatOpenAI
-from langchain.prompts import PromptTemplate
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.chains.summarize import load_summarize_chain
-from langchain.docstore.document import Document
 from pydantic import BaseModel, Field
+from typing import Awaitable, Callable, List, Optional
 import logging
 from app.core.config import settings
+from app.core.extractive import extractive_summary
+from app.core.metrics import track_stage
+from app.core.usage import TokenBudgetExceeded, can_spend
+from app.agents.wikipedia_search import ArticleSection, LEAD_SECTION, parse_sections, select_sections
 
 logger = logging.getLogger(__name__)
 
 class Summary(BaseModel):
     summary: str = Field(description="A concise summary of the content")
+    sections: List[str] = Field(default_factory=list, description="Titles of the sections that were summarized")
+    degraded: bool = Field(default=False, description="Whether this is an extractive fallback (token budget or LLM unavailable)")
 
 class Summarizer:
     def __init__(self):
+        # LangChain is slow to import, defer it until the agent is first built
+        from langchain_core.prompts import PromptTemplate
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+        from app.core.llm import get_llm_gateway
+        
         logger.info("Initializing Summarizer agent")
-        self.llm = ChatOpenAI(
-            model=settings.OPENAI_MODEL,
-            temperature=0.7,
-            api_key=settings.OPENAI_API_KEY
-        )
+        # Map runs once per chunk and can use a cheaper model than combine
+        gateway = get_llm_gateway()
+        self.map_llm = gateway.chat_model("map", temperature=0.7)
+        self.combine_llm = gateway.chat_model("combine", temperature=0.7)
         
         # Initialize text splitter with smaller chunks
         logger.info("Configuring text splitter with chunk_size=2000, chunk_overlap=100")
+        self.chunk_size = 2000
         self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=2000,  # Reduced from 4000 to 2000
+            chunk_size=self.chunk_size,  # Reduced from 4000 to 2000
             chunk_overlap=100,  # Reduced overlap
             length_function=len,
             separators=["\n\n", "\n", ".", "!", "?"]
@@ -46,6 +53,21 @@ class Summarizer:
             input_variables=["text"]
         )
         
+        # Intermediate reduce prompt, used when the map summaries don't fit one combine call
+        self.reduce_prompt = PromptTemplate(
+            template="""The following are summaries of consecutive parts of one article.
+            Merge them into a single summary that:
+            1. Is at most 150 words
+            2. Keeps the main points and key information from every part
+            3. Is written in a neutral, informative tone
+
+            Text to summarize:
+            {text}
+
+            Summary:""",
+            input_variables=["text"]
+        )
+        
         # Create combine prompt template
         self.combine_prompt = PromptTemplate(
             template="""Write a concise summary of the following text. The summary should:
@@ -64,49 +86,152 @@ class Summarizer:
         
         logger.info("Summarizer initialization complete")
 
-    async def summarize(self, content: str) -> Summary:
-        """Generate a concise summary of the given content."""
+    @staticmethod
+    def count_tokens(text: str) -> int:
+        """Estimate tokens without a tokenizer (~4 characters per token for English)."""
+        return len(text) // 4 + 1
+
+    def estimate_tokens(self, chunks: List[str]) -> int:
+        """
+        Rough tokens a summarization will use: each chunk plus the map prompt
+        (~100 tokens) in, a map summary (~130 tokens) out and back in to
+        combine, and the final summary (~400 tokens) out.
+        """
+        return sum(self.count_tokens(chunk) for chunk in chunks) + len(chunks) * (100 + 2 * 130) + 400
+
+    async def over_budget(
+        self,
+        selected: List[ArticleSection],
+        reason: str,
+        on_token: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> Summary:
+        """Degrade to an extractive summary, or reject if LLM_BUDGET_MODE is "reject"."""
+        if settings.LLM_BUDGET_MODE != "degrade":
+            raise TokenBudgetExceeded(reason)
+        return await self.extractive_fallback(selected, reason, on_token)
+
+    async def extractive_fallback(
+        self,
+        selected: List[ArticleSection],
+        reason: str,
+        on_token: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> Summary:
+        """Summarize without the LLM, when it is over budget or unavailable."""
+        logger.warning(f"Using an extractive summary instead of the LLM: {reason}")
+        summary_text = extractive_summary("\n\n".join(section.text for section in selected), 300)
+        if on_token is not None:
+            await on_token(summary_text)
+        return Summary(summary=summary_text, sections=[section.title for section in selected], degraded=True)
+
+    def batch_summaries(self, summaries: List[str], max_tokens: int) -> List[List[str]]:
+        """Group consecutive summaries into batches whose combined size stays under `max_tokens`."""
+        batches: List[List[str]] = []
+        current: List[str] = []
+        current_tokens = 0
+        for summary in summaries:
+            tokens = self.count_tokens(summary)
+            # Always pair up at least two summaries so every level shrinks the list
+            if current and current_tokens + tokens > max_tokens and len(current) > 1:
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(summary)
+            current_tokens += tokens
+        if current:
+            if len(current) == 1 and batches:
+                batches[-1].append(current[0])
+            else:
+                batches.append(current)
+        return batches
+
+    def chunk_sections(self, sections: List[ArticleSection]) -> List[str]:
+        """
+        Pack whole sections into chunks of up to `chunk_size` characters so no
+        chunk straddles a section boundary; only sections larger than a chunk
+        are split, and each of their pieces keeps the section heading.
+        """
+        chunks: List[str] = []
+        current = ""
+        for section in sections:
+            if not section.text:
+                continue
+            heading = "" if section.title == LEAD_SECTION else f"{section.title}\n"
+            block = heading + section.text
+            if len(block) > self.chunk_size:
+                if current:
+                    chunks.append(current)
+                    current = ""
+                chunks.extend(heading + piece for piece in self.text_splitter.split_text(section.text))
+            elif current and len(current) + len(block) + 2 > self.chunk_size:
+                chunks.append(current)
+                current = block
+            else:
+                current = f"{current}\n\n{block}" if current else block
+        if current:
+            chunks.append(current)
+        return chunks
+
+    async def summarize(
+        self,
+        content: str,
+        sections: Optional[List[str]] = None,
+        on_token: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> Summary:
+        """
+        Generate a concise summary of the given content. Low-value sections
+        (References, External links, ...) are skipped; pass `sections` to
+        summarize only those sections (e.g. ["Lead", "History"]). If `on_token`
+        is given, the final summary is streamed to it as it is generated.
+        Over the token budget or when the LLM is unavailable, the summary is
+        extractive (see `extractive_fallback`); if part of the LLM summary was
+        already streamed, the extractive one isn't, it only replaces it in the
+        returned (degraded) Summary. Other errors propagate.
+        """
+        from app.core.llm import is_llm_unavailable
+        
         logger.info(f"Starting summarization of content (length: {len(content)} characters)")
         logger.info(f"Content preview: {content[:100]}...")
         
         try:
             # Split content into documents
             logger.info("Splitting content into chunks...")
-            docs = [Document(page_content=content)]
-            split_docs = self.text_splitter.split_documents(docs)
-            logger.info(f"Content split into {len(split_docs)} chunks")
+            with track_stage("split"):
+                selected = select_sections(parse_sections(content), sections)
+                if not selected:
+                    raise ValueError(f"None of the requested sections were found: {', '.join(sections or [])}")
+                chunks = self.chunk_sections(selected)
+            logger.info(f"Content split into {len(chunks)} chunks from {len(selected)} sections")
             
             # Log chunk sizes
-            for i, doc in enumerate(split_docs):
-                logger.info(f"Chunk {i+1} size: {len(doc.page_content)} characters")
+            for i, chunk in enumerate(chunks):
+                logger.info(f"Chunk {i+1} size: {len(chunk)} characters")
             
-            # when we have too many chunks map reduce can help
-            logger.info("Using map_reduce chain")
-            chain = load_summarize_chain(
-                self.llm,
-                chain_type="map_reduce",
-                verbose=True,  # Enable verbose logging
-                map_prompt=self.map_prompt,
-                combine_prompt=self.combine_prompt,
-                return_intermediate_steps=True,  # Get intermediate summaries
-                combine_document_variable_name="text"  # Specify the variable name for combine prompt
-            )
+            estimated_tokens = self.estimate_tokens(chunks)
+            logger.info(f"Estimated LLM usage: {estimated_tokens} tokens")
+            if not await can_spend(estimated_tokens):
+                return await self.over_budget(
+                    selected, f"an estimated {estimated_tokens} tokens exceed the token budget", on_token
+                )
             
-            # Use ainvoke instead of arun for map_reduce chain
-            result = await chain.ainvoke({"input_documents": split_docs})
+            streamed = False
             
+            async def forward_token(text: str) -> None:
+                nonlocal streamed
+                streamed = True
+                await on_token(text)
             
-            # Extract the summary text from the result
-            if isinstance(result, dict):
-                if 'output_text' in result:
-                    summary_text = result['output_text']
-                elif 'text' in result:
-                    summary_text = result['text']
-                else:
-                    # If we can't find the summary in the expected keys, try to get it from the first key
-                    summary_text = next(iter(result.values()))
-            else:
-                summary_text = str(result)
+            try:
+                summary_text = await self._summarize_chunks(chunks, forward_token if on_token else None)
+            except TokenBudgetExceeded as e:
+                # Estimates are rough, so the budget can still run out part way
+                return await self.over_budget(selected, str(e), None if streamed else on_token)
+            except Exception as e:
+                if not is_llm_unavailable(e):
+                    raise
+                # The LLM is down, slow or its circuit is open: a quick extractive
+                # summary is better than an error or a long wait
+                return await self.extractive_fallback(
+                    selected, f"the LLM failed ({type(e).__name__}: {str(e)})", None if streamed else on_token
+                )
                 
             logger.info(f"Generated summary (length: {len(summary_text)} characters)")
             
@@ -117,22 +242,54 @@ class Summarizer:
                 summary_text = ' '.join(words[:300]) + '...'
             
             logger.info("Summarization completed successfully")
-            return Summary(summary=summary_text)
+            return Summary(summary=summary_text, sections=[section.title for section in selected])
             
         except Exception as e:
             logger.error(f"Error during summarization: {str(e)}")
             logger.error(f"Error type: {type(e).__name__}")
-            
-            if "context_length_exceeded" in str(e):
-                logger.info("Context length exceeded, retrying with smaller chunks")
-                # If we hit context length error, try with even smaller chunks
-                self.text_splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=1000,  # Further reduce chunk size
-                    chunk_overlap=50,  # Reduce overlap
-                    length_function=len,
-                    separators=["\n\n", "\n", ".", "!", "?"]
+            raise
+
+    async def _summarize_chunks(
+        self,
+        chunks: List[str],
+        on_token: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> str:
+        from langchain_core.output_parsers import StrOutputParser
+        
+        # Map and combine run as separate chains so each stage can be timed
+        logger.info("Running map step")
+        with track_stage("map"):
+            map_chain = self.map_prompt | self.map_llm | StrOutputParser()
+            summaries = await map_chain.abatch(
+                [{"text": chunk} for chunk in chunks],
+                config={"max_concurrency": settings.SUMMARY_MAX_CONCURRENCY}
+            )
+        
+        # Tree reduce: merge batches in parallel, level by level, until the
+        # summaries fit one combine call. Depth grows with log(chunks).
+        max_tokens = settings.SUMMARY_REDUCE_MAX_TOKENS
+        batches = self.batch_summaries(summaries, max_tokens)
+        level = 0
+        while len(batches) > 1:
+            level += 1
+            logger.info(f"Reduce level {level}: merging {len(summaries)} summaries in {len(batches)} batches")
+            with track_stage("reduce"):
+                reduce_chain = self.reduce_prompt | self.combine_llm | StrOutputParser()
+                summaries = await reduce_chain.abatch(
+                    [{"text": "\n\n".join(batch)} for batch in batches],
+                    config={"max_concurrency": settings.SUMMARY_MAX_CONCURRENCY}
                 )
-                logger.info("Retrying summarization with smaller chunks")
-                # Retry with smaller chunks
-                return await self.summarize(content)
-            raise 
\ No newline at end of file
+            batches = self.batch_summaries(summaries, max_tokens)
+        
+        logger.info(f"Running combine step over {len(summaries)} summaries")
+        with track_stage("combine"):
+            combine_chain = self.combine_prompt | self.combine_llm | StrOutputParser()
+            if on_token is None:
+                summary_text = await combine_chain.ainvoke({"text": "\n\n".join(summaries)})
+            else:
+                parts = []
+                async for part in combine_chain.astream({"text": "\n\n".join(summaries)}):
+                    parts.append(part)
+                    await on_token(part)
+                summary_text = "".join(parts)
+        return summary_text
@@ -1,20 +1,22 @@
-from langchain.chat_models import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
-from langchain.output_parsers import PydanticOutputParser
 from pydantic import BaseModel, Field
 from typing import Optional
+import logging
 from app.core.config import settings
+from app.core.usage import TokenBudgetExceeded
+
+logger = logging.getLogger(__name__)
 
 class TopicExtraction(BaseModel):
     topic: str = Field(description="The main topic extracted from the query")
 
 class TopicExtractor:
     def __init__(self):
-        self.llm = ChatOpenAI(
-            model=settings.OPENAI_MODEL,
-            temperature=0,
-            api_key=settings.OPENAI_API_KEY
-        )
+        # LangChain is slow to import, defer it until the agent is first built
+        from langchain_core.prompts import ChatPromptTemplate
+        from langchain_core.output_parsers import PydanticOutputParser
+        from app.core.llm import get_llm_gateway
+        
+        self.llm = get_llm_gateway().chat_model("topic", temperature=0)
         self.parser = PydanticOutputParser(pydantic_object=TopicExtraction)
         
         self.prompt = ChatPromptTemplate.from_messages([
@@ -26,13 +28,35 @@ class TopicExtractor:
             ("user", "{query}")
         ])
 
+    @staticmethod
+    def heuristic_topic(query: str) -> TopicExtraction:
+        from app.core.llm import LocalChatModel
+        return TopicExtraction(topic=LocalChatModel.extract_topic(query))
+
     async def extract_topic(self, query: str) -> TopicExtraction:
-        """Extract the main topic from a user query."""
+        """
+        Extract the main topic from a user query, with the offline heuristic
+        when over the token budget or the LLM is unavailable.
+        """
+        from app.core.llm import is_llm_unavailable
+        
         chain = self.prompt | self.llm | self.parser
         
-        result = await chain.ainvoke({
-            "query": query,
-            "format_instructions": self.parser.get_format_instructions()
-        })
+        try:
+            result = await chain.ainvoke({
+                "query": query,
+                "format_instructions": self.parser.get_format_instructions()
+            })
+        except TokenBudgetExceeded:
+            if settings.LLM_BUDGET_MODE != "degrade":
+                raise
+            # Over the token budget, fall back to the offline heuristic
+            return self.heuristic_topic(query)
+        except Exception as e:
+            if not is_llm_unavailable(e):
+                raise
+            # Same when the LLM is down or its circuit is open
+            logger.warning(f"Topic extraction fell back to the heuristic: {str(e)}")
+            return self.heuristic_topic(query)
         
         return result 
\ No newline at end of file
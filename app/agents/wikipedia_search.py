@@ -1,27 +1,149 @@
+import asyncio
+import contextvars
+import functools
+import re
+import threading
+import time
+import requests
 import wikipedia
-from typing import List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
 from pydantic import BaseModel, Field
 from app.core.config import settings
-from langchain.chat_models import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
-from langchain.output_parsers import PydanticOutputParser
+from app.core.resilience import CircuitOpenError, get_breaker
 import logging
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# Lookups that found nothing are answers, not Wikipedia failures
+NOT_FOUND_ERRORS = (wikipedia.exceptions.PageError, wikipedia.exceptions.DisambiguationError)
+
+class WikipediaDeadlineExceeded(Exception):
+    """A search or fetch ran past WIKIPEDIA_TIMEOUT_SECONDS and was stopped between requests."""
+
+# Deadline (time.monotonic()) of the call running on this thread
+_deadline = threading.local()
+
+class _RequestsWithTimeout:
+    """
+    Stands in for `requests` in the wikipedia client, which sends requests
+    without a timeout. Each request gets WIKIPEDIA_REQUEST_TIMEOUT_SECONDS, and
+    no new request starts once the call's deadline has passed.
+    """
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(requests, name)
+
+    def get(self, *args, **kwargs):
+        deadline = getattr(_deadline, "at", None)
+        if deadline is not None and time.monotonic() >= deadline:
+            raise WikipediaDeadlineExceeded(f"Wikipedia call took longer than {settings.WIKIPEDIA_TIMEOUT_SECONDS}s")
+        kwargs.setdefault("timeout", settings.WIKIPEDIA_REQUEST_TIMEOUT_SECONDS)
+        return requests.get(*args, **kwargs)
+
+def _with_deadline(load: Callable[..., T], *args) -> T:
+    # The deadline starts when a worker thread picks the call up, so time spent queued doesn't count
+    _deadline.at = time.monotonic() + settings.WIKIPEDIA_TIMEOUT_SECONDS
+    try:
+        return load(*args)
+    finally:
+        _deadline.at = None
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+def get_wikipedia_executor() -> ThreadPoolExecutor:
+    """
+    Threads for the blocking wikipedia client, so slow Wikipedia calls queue
+    among themselves instead of filling the default executor. Created on first
+    use, so each (forked) worker process gets its own.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.WIKIPEDIA_MAX_CONCURRENCY, thread_name_prefix="wikipedia")
+    return _executor
+
 class WikipediaSearchResult(BaseModel):
     title: str = Field(description="The title of the Wikipedia article")
     summary: str = Field(description="A concise summary of the article")
     url: str = Field(description="The URL of the Wikipedia article")
 
+class WikipediaArticle(BaseModel):
+    title: str = Field(description="The title of the Wikipedia article")
+    url: str = Field(description="The URL of the Wikipedia article")
+    content: str = Field(description="The full article text, with its == Section == headings")
+    revision_id: Optional[int] = Field(default=None, description="The revision the content was read from")
+
+class ArticleSection(BaseModel):
+    title: str = Field(description="The section heading, or LEAD_SECTION for the text before the first heading")
+    level: int = Field(description="Heading level: 1 for the lead, 2 for == Section ==, 3 for === Subsection ===, ...")
+    text: str = Field(description="The section text, without the text of its subsections")
+
+LEAD_SECTION = "Lead"
+
+# Sections that are mostly lists of links and citations, not worth summarizing
+LOW_VALUE_SECTIONS = {
+    "references", "external links", "see also", "further reading", "notes", "bibliography",
+    "sources", "citations", "footnotes", "notes and references", "works cited", "gallery"
+}
+
+_HEADING = re.compile(r"^(={2,6})\s*(.+?)\s*\1\s*$", re.MULTILINE)
+
+def parse_sections(content: str) -> List[ArticleSection]:
+    """Split article text (with MediaWiki `== Heading ==` lines) into its sections."""
+    sections = []
+    position = 0
+    title, level = LEAD_SECTION, 1
+    for match in _HEADING.finditer(content):
+        sections.append(ArticleSection(title=title, level=level, text=content[position:match.start()].strip()))
+        title, level = match.group(2), len(match.group(1))
+        position = match.end()
+    sections.append(ArticleSection(title=title, level=level, text=content[position:].strip()))
+    return sections
+
+def select_sections(sections: List[ArticleSection], wanted: Optional[List[str]] = None) -> List[ArticleSection]:
+    """
+    Drop low-value sections (and their subsections) and, if `wanted` is given,
+    keep only the named sections with their subsections. Names are case-insensitive.
+    """
+    wanted_titles = {title.strip().lower() for title in wanted} if wanted else None
+    selected = []
+    # Level of the enclosing section that is being skipped or kept, if any
+    skip_level: Optional[int] = None
+    keep_level: Optional[int] = None
+    for section in sections:
+        if skip_level is not None and section.level > skip_level:
+            continue
+        skip_level = None
+        if keep_level is not None and section.level <= keep_level:
+            keep_level = None
+        
+        title = section.title.lower()
+        if title in LOW_VALUE_SECTIONS:
+            skip_level = section.level
+            continue
+        if wanted_titles is None or keep_level is not None:
+            selected.append(section)
+        elif title in wanted_titles:
+            selected.append(section)
+            # The lead has no subsections
+            keep_level = section.level if section.title != LEAD_SECTION else None
+    return selected
+
 class WikipediaSearcher:
     def __init__(self):
+        # LangChain is slow to import, defer it until the agent is first built
+        from langchain_core.prompts import ChatPromptTemplate
+        from langchain_core.output_parsers import PydanticOutputParser
+        from app.core.llm import get_llm_gateway
+        
         wikipedia.set_lang(settings.WIKIPEDIA_LANGUAGE)
-        self.llm = ChatOpenAI(
-            model=settings.OPENAI_MODEL,
-            temperature=0.7,
-            api_key=settings.OPENAI_API_KEY
-        )
+        if settings.WIKIPEDIA_API_URL:
+            wikipedia.wikipedia.API_URL = settings.WIKIPEDIA_API_URL
+        wikipedia.wikipedia.requests = _RequestsWithTimeout()
+        self.breaker = get_breaker("wikipedia", ignored_exceptions=NOT_FOUND_ERRORS + (WikipediaDeadlineExceeded,))
+        self.llm = get_llm_gateway().chat_model("search", temperature=0.7)
         self.parser = PydanticOutputParser(pydantic_object=WikipediaSearchResult)
         
         self.prompt = ChatPromptTemplate.from_messages([
@@ -39,83 +161,163 @@ class WikipediaSearcher:
             ("user", "Topic: {topic}")
         ])
 
-    async def search(self, topic: str) -> WikipediaSearchResult:
-        """Search Wikipedia for information about a topic."""
+    async def _call(self, load: Callable[..., T], *args) -> T:
+        """
+        Run a blocking wikipedia client call on the Wikipedia executor, failing
+        fast while Wikipedia's circuit is open. Requests are bounded by their
+        socket timeout and the call by WIKIPEDIA_TIMEOUT_SECONDS from when it starts.
+        """
+        loop = asyncio.get_running_loop()
+        run = functools.partial(contextvars.copy_context().run, _with_deadline, load, *args)
+        return await self.breaker.call(lambda: loop.run_in_executor(get_wikipedia_executor(), run))
+
+    async def search(self, topic: str) -> Optional[WikipediaSearchResult]:
+        """
+        Search Wikipedia for information about a topic. Returns None if no
+        article matches and raises if Wikipedia is unavailable, unless
+        WIKIPEDIA_LLM_FALLBACK_ENABLED lets the LLM suggest an article instead.
+        """
         try:
-            # First try direct Wikipedia search
-            try:
-                page = wikipedia.page(topic, auto_suggest=False)
-                return WikipediaSearchResult(
-                    title=page.title,
-                    summary=page.summary,
-                    url=page.url
-                )
-            except wikipedia.exceptions.DisambiguationError as e:
-                # If disambiguation page, use the first option
-                page = wikipedia.page(e.options[0], auto_suggest=False)
-                return WikipediaSearchResult(
-                    title=page.title,
-                    summary=page.summary,
-                    url=page.url
-                )
-            except wikipedia.exceptions.PageError:
-                # If page not found, try fuzzy search
-                results = await self._fuzzy_search(topic)
-                if results:
-                    return results[0]  # Return the first result
-                raise Exception(f"No Wikipedia article found for topic: {topic}")
-        except Exception as e:
-            # If all else fails, use LLM to generate a response
-            try:
-                chain = self.prompt | self.llm | self.parser
-                result = await chain.ainvoke({
-                    "topic": topic,
-                    "format_instructions": self.parser.get_format_instructions()
-                })
+            result = await self._call(self._search_pages, topic)
+            if result is not None or not settings.WIKIPEDIA_LLM_FALLBACK_ENABLED:
                 return result
-            except Exception as llm_error:
-                raise Exception(f"Failed to search Wikipedia: {str(e)}. LLM fallback also failed: {str(llm_error)}")
+            error = f"No Wikipedia article found for topic: {topic}"
+        except CircuitOpenError as e:
+            if not settings.WIKIPEDIA_LLM_FALLBACK_ENABLED:
+                raise
+            error = str(e)
+        except Exception as e:
+            if not settings.WIKIPEDIA_LLM_FALLBACK_ENABLED:
+                raise Exception(f"Failed to search Wikipedia: {str(e)}")
+            error = str(e)
+        
+        # The LLM may suggest an article that doesn't exist, and it is one more
+        # slow call while things are already failing, so this is opt-in
+        try:
+            chain = self.prompt | self.llm | self.parser
+            result = await chain.ainvoke({
+                "topic": topic,
+                "format_instructions": self.parser.get_format_instructions()
+            })
+            return result
+        except Exception as llm_error:
+            raise Exception(f"Failed to search Wikipedia: {error}. LLM fallback also failed: {str(llm_error)}")
 
-    async def _fuzzy_search(self, topic: str) -> List[WikipediaSearchResult]:
-        """Perform a fuzzy search when exact search fails."""
+    def _search_pages(self, topic: str) -> Optional[WikipediaSearchResult]:
+        # First try direct Wikipedia search
         try:
-            # Try searching with different variations
-            variations = [
-                topic,
-                topic.replace(" ", "_"),
-                topic.lower(),
-                topic.title()
-            ]
-            
+            page = wikipedia.page(topic, auto_suggest=False)
+        except wikipedia.exceptions.DisambiguationError as e:
+            # If disambiguation page, use the first option
+            try:
+                page = wikipedia.page(e.options[0], auto_suggest=False)
+            except NOT_FOUND_ERRORS:
+                # The option is itself ambiguous or missing
+                return self._first_fuzzy_result(topic)
+        except wikipedia.exceptions.PageError:
+            # If page not found, try fuzzy search
+            return self._first_fuzzy_result(topic)
+        return WikipediaSearchResult(
+            title=page.title,
+            summary=page.summary,
+            url=page.url
+        )
+
+    def _first_fuzzy_result(self, topic: str) -> Optional[WikipediaSearchResult]:
+        results = self._fuzzy_search(topic)
+        return results[0] if results else None
+
+    def _fuzzy_search(self, topic: str) -> List[WikipediaSearchResult]:
+        """
+        Perform a fuzzy search when exact search fails. Stops at the first
+        variation with results; network errors propagate so they count
+        against Wikipedia's circuit.
+        """
+        # Try searching with different variations
+        variations = [
+            topic,
+            topic.replace(" ", "_"),
+            topic.lower(),
+            topic.title()
+        ]
+        
+        for variation in variations:
+            try:
+                search_results = wikipedia.search(variation, results=settings.WIKIPEDIA_MAX_RESULTS)
+            except wikipedia.exceptions.WikipediaException:
+                continue
             results = []
-            for variation in variations:
+            for title in search_results:
                 try:
-                    search_results = wikipedia.search(variation, results=settings.WIKIPEDIA_MAX_RESULTS)
-                    for title in search_results:
-                        try:
-                            page = wikipedia.page(title, auto_suggest=False)
-                            results.append(WikipediaSearchResult(
-                                title=page.title,
-                                url=page.url,
-                                summary=page.summary
-                            ))
-                        except:
-                            continue
-                except:
+                    page = wikipedia.page(title, auto_suggest=False)
+                    results.append(WikipediaSearchResult(
+                        title=page.title,
+                        url=page.url,
+                        summary=page.summary
+                    ))
+                except NOT_FOUND_ERRORS:
                     continue
-            
-            return results
-        except Exception as e:
-            raise Exception(f"Fuzzy search failed: {str(e)}")
+            if results:
+                return results
+        return []
 
     async def get_full_content(self, url: str) -> Optional[str]:
         """Retrieve the full content of a Wikipedia page."""
+        article = await self.get_article(url)
+        return article.content if article else None
+
+    async def get_article(self, url: str) -> Optional[WikipediaArticle]:
+        """
+        Retrieve the full content of a Wikipedia page with its title and revision
+        id. Returns None if it can't be loaded, and raises CircuitOpenError while
+        Wikipedia's circuit is open.
+        """
         try:
             # Extract title from URL
             title = url.split("/")[-1]
-            page = wikipedia.page(title, auto_suggest=False)
-            # Return just the content as a string, not a dictionary
-            return str(page.content)
+            # The wikipedia client is blocking, keep it off the event loop so
+            # background prefetches don't stall other requests
+            return await self._call(self._load_article, title, url)
+        except CircuitOpenError:
+            raise
         except Exception as e:
             logger.error(f"Error getting full content: {str(e)}")
-            return None 
\ No newline at end of file
+            return None
+
+    def _load_article(self, title: str, url: str) -> WikipediaArticle:
+        page = wikipedia.page(title, auto_suggest=False)
+        # Return just the content as a string, not a dictionary
+        content = str(page.content)
+        # Loaded together with the content, so this doesn't cost another request
+        return WikipediaArticle(title=page.title, url=url, content=content, revision_id=page.revision_id)
+
+    async def get_revisions(self, titles: List[str]) -> Dict[str, Dict[str, int]]:
+        """
+        Look up the latest revision id and size (in bytes) of up to 50 pages in
+        one MediaWiki request. Returns {title: {"revision_id": ..., "size": ...}}
+        keyed by the titles as given; missing pages are left out.
+        """
+        if not titles:
+            return {}
+        return await self._call(self._load_revisions, titles)
+
+    def _load_revisions(self, titles: List[str]) -> Dict[str, Dict[str, int]]:
+        response = wikipedia.wikipedia._wiki_request({
+            "prop": "revisions",
+            "rvprop": "ids|size",
+            "titles": "|".join(titles)
+        })
+        query = response.get("query", {})
+        normalized = {item["from"]: item["to"] for item in query.get("normalized", [])}
+        latest = {}
+        for page in query.get("pages", {}).values():
+            revisions = page.get("revisions")
+            if revisions:
+                latest[page["title"]] = {"revision_id": revisions[0]["revid"], "size": revisions[0].get("size", 0)}
+        
+        revisions = {}
+        for title in titles:
+            page_title = normalized.get(title, title.replace("_", " "))
+            if page_title in latest:
+                revisions[title] = latest[page_title]
+        return revisions
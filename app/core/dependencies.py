@@ -0,0 +1,71 @@
+"""
+Agents shared by all requests in a worker, built on first use.
+
+Use them in handlers with `Depends(get_summarizer)` etc. The getters are plain
+functions, so FastAPI runs them in the threadpool and a cold first build
+(LangChain import, client setup) doesn't block the event loop.
+"""
+import logging
+import threading
+from typing import Any, Callable, Dict
+from app.agents.topic_extractor import TopicExtractor
+from app.agents.wikipedia_search import WikipediaSearcher
+from app.agents.summarizer import Summarizer
+from app.agents.prefetcher import SpeculativePrefetcher
+from app.agents.refresher import FreshnessRefresher
+
+logger = logging.getLogger(__name__)
+
+_agents: Dict[str, Any] = {}
+_lock = threading.RLock()
+
+def _get_or_create(name: str, factory: Callable[[], Any]) -> Any:
+    agent = _agents.get(name)
+    if agent is None:
+        with _lock:
+            agent = _agents.get(name)
+            if agent is None:
+                logger.info(f"Initializing {name}")
+                agent = factory()
+                _agents[name] = agent
+    return agent
+
+def get_topic_extractor() -> TopicExtractor:
+    return _get_or_create("topic_extractor", TopicExtractor)
+
+def get_wikipedia_searcher() -> WikipediaSearcher:
+    return _get_or_create("wikipedia_searcher", WikipediaSearcher)
+
+def get_summarizer() -> Summarizer:
+    return _get_or_create("summarizer", Summarizer)
+
+def get_prefetcher() -> SpeculativePrefetcher:
+    return _get_or_create(
+        "prefetcher",
+        lambda: SpeculativePrefetcher(get_wikipedia_searcher(), get_summarizer())
+    )
+
+def get_refresher() -> FreshnessRefresher:
+    return _get_or_create(
+        "refresher",
+        lambda: FreshnessRefresher(get_wikipedia_searcher(), get_summarizer())
+    )
+
+async def close_agents() -> None:
+    """
+    Drop the agents and close the LLM gateway's pooled connections (on
+    shutdown). The agents' models are bound to those connections, so both go
+    together; agents are built again on next use.
+    """
+    from app.core.llm import close_llm_gateway
+    
+    with _lock:
+        _agents.clear()
+    await close_llm_gateway()
+
+def warm_up_agents() -> None:
+    """Build every agent ahead of the first request."""
+    get_topic_extractor()
+    get_wikipedia_searcher()
+    get_summarizer()
+    get_prefetcher()
@@ -0,0 +1,219 @@
+"""
+Debug-mode diagnostics for keeping the pipeline non-blocking.
+
+- LoopBlockDetector flags any event loop callback that runs longer than a
+  threshold, with the stack that was executing and the request it belonged to.
+- SamplingProfiler samples the event loop thread while requests to selected
+  endpoints are in flight and writes collapsed stacks that flamegraph.pl,
+  speedscope or inferno can render.
+
+Both hook into the default asyncio event loop; they have no effect under uvloop.
+"""
+import asyncio
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+class LoopBlockDetector:
+    """Report callbacks that hold the event loop longer than `threshold` seconds."""
+
+    def __init__(self, threshold: float, max_events: int = 100):
+        self.threshold = threshold
+        self.events: Deque[Dict] = deque(maxlen=max_events)
+        self._loop_thread_id: Optional[int] = None
+        self._original_run = None
+        # (sequence number, start time) of the callback currently running on the loop
+        self._current: Optional[Tuple[int, float]] = None
+        self._sequence = 0
+        self._stacks: Dict[int, str] = {}
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def install(self) -> None:
+        """Start watching the event loop of the calling thread."""
+        if self._original_run is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._original_run = asyncio.events.Handle._run
+        detector = self
+        original_run = self._original_run
+
+        def _run(handle):
+            if threading.get_ident() != detector._loop_thread_id:
+                return original_run(handle)
+            sequence = detector._begin()
+            try:
+                return original_run(handle)
+            finally:
+                detector._end(sequence, handle)
+
+        asyncio.events.Handle._run = _run
+        self._stop.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-block-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(f"Event loop block detector installed (threshold: {self.threshold * 1000:.0f}ms)")
+
+    def uninstall(self) -> None:
+        if self._original_run is None:
+            return
+        asyncio.events.Handle._run = self._original_run
+        self._original_run = None
+        self._stop.set()
+        if self._watchdog is not None:
+            self._watchdog.join()
+
+    def _begin(self) -> int:
+        self._sequence += 1
+        self._current = (self._sequence, time.perf_counter())
+        return self._sequence
+
+    def _end(self, sequence: int, handle) -> None:
+        current = self._current
+        self._current = None
+        if current is None:
+            return
+        _, started = current
+        duration = time.perf_counter() - started
+        stack = self._stacks.pop(sequence, None)
+        if duration < self.threshold:
+            return
+
+        request_id = metrics.request_id_from_context(getattr(handle, "_context", None))
+        event = {
+            "callback": repr(handle),
+            "duration_ms": round(duration * 1000, 1),
+            "request_id": request_id,
+            "stack": stack,
+            "timestamp": time.time()
+        }
+        self.events.append(event)
+        metrics.EVENT_LOOP_BLOCKS.inc()
+        logger.warning(
+            f"[{request_id}] Event loop blocked for {event['duration_ms']}ms by {event['callback']}"
+            + (f"\n{stack}" if stack else "")
+        )
+
+    def _watch(self) -> None:
+        # Capture the stack while the callback is still running, it is gone once it returns
+        interval = max(self.threshold / 4, 0.005)
+        while not self._stop.wait(interval):
+            current = self._current
+            if current is None:
+                continue
+            sequence, started = current
+            if time.perf_counter() - started < self.threshold or sequence in self._stacks:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                self._stacks[sequence] = "".join(traceback.format_stack(frame))
+            # Drop stacks of callbacks that finished before _end could claim them
+            for stale in [s for s in self._stacks if s < sequence]:
+                self._stacks.pop(stale, None)
+
+class SamplingProfiler:
+    """Sample the event loop thread while profiled requests are in flight."""
+
+    def __init__(self, interval: float, output_dir: str):
+        self.interval = interval
+        self.output_dir = output_dir
+        self._thread_id: Optional[int] = None
+        self._profiles: Dict[str, Counter] = {}
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def _ensure_sampler(self) -> None:
+        if self._sampler is None:
+            self._thread_id = threading.get_ident()
+            self._sampler = threading.Thread(target=self._sample, name="loop-sampler", daemon=True)
+            self._sampler.start()
+
+    @contextmanager
+    def profile(self, name: str) -> Iterator[None]:
+        """Collect samples for `name` until the block exits, then write them to disk."""
+        self._ensure_sampler()
+        with self._lock:
+            self._profiles[name] = Counter()
+            self._active.set()
+        try:
+            yield
+        finally:
+            with self._lock:
+                samples = self._profiles.pop(name)
+                if not self._profiles:
+                    self._active.clear()
+            self._write(name, samples)
+
+    def _sample(self) -> None:
+        while True:
+            self._active.wait()
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            folded = self._fold(frame)
+            with self._lock:
+                # Concurrent requests share the loop thread, so each gets every sample
+                for samples in self._profiles.values():
+                    samples[folded] += 1
+
+    @staticmethod
+    def _fold(frame) -> str:
+        frames: List[str] = []
+        while frame is not None:
+            code = frame.f_code
+            module = os.path.splitext(os.path.basename(code.co_filename))[0]
+            frames.append(f"{module}:{code.co_name}")
+            frame = frame.f_back
+        return ";".join(reversed(frames))
+
+    def _write(self, name: str, samples: Counter) -> None:
+        if not samples:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"{name}.folded")
+        with open(path, "w") as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        logger.info(f"Wrote {sum(samples.values())} profile samples to {path}")
+
+loop_block_detector: Optional[LoopBlockDetector] = None
+profiler: Optional[SamplingProfiler] = None
+_profiled_prefixes: List[str] = []
+
+def enable_loop_block_detector(threshold_ms: float) -> LoopBlockDetector:
+    """Install the block detector on the running event loop's thread."""
+    global loop_block_detector
+    if loop_block_detector is None:
+        loop_block_detector = LoopBlockDetector(threshold_ms / 1000)
+        loop_block_detector.install()
+    return loop_block_detector
+
+def enable_profiler(endpoints: str, interval_ms: float, output_dir: str) -> Optional[SamplingProfiler]:
+    """Profile requests whose path starts with one of the comma separated `endpoints`."""
+    global profiler, _profiled_prefixes
+    _profiled_prefixes = [endpoint.strip() for endpoint in endpoints.split(",") if endpoint.strip()]
+    if _profiled_prefixes and profiler is None:
+        profiler = SamplingProfiler(interval_ms / 1000, output_dir)
+        logger.info(f"Sampling profiler enabled for: {', '.join(_profiled_prefixes)}")
+    return profiler
+
+@contextmanager
+def profile_request(path: str, request_id: str) -> Iterator[None]:
+    """Profile the request if its path is one of the configured hot endpoints."""
+    if profiler is None or not any(path.startswith(prefix) for prefix in _profiled_prefixes):
+        yield
+        return
+    name = re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_") + f"-{request_id}"
+    with profiler.profile(name):
+        yield
@@ -0,0 +1,72 @@
+"""
+Extractive summarization: picks the most representative sentences of a text
+instead of generating new ones. Deterministic and free, so it backs the local
+LLM backend and serves as a fallback when the LLM can't be used.
+"""
+import re
+from collections import Counter
+from typing import List
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before
+being below between both but by can could did do does doing down during each few for from
+further had has have having he her here hers herself him himself his how i if in into is it
+its itself just me more most my myself no nor not now of off on once only or other our ours
+ourselves out over own same she should so some such than that the their theirs them
+themselves then there these they this those through to too under until up very was we were
+what when where which while who whom why will with would you your yours yourself yourselves
+""".split())
+
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])")
+_WORD = re.compile(r"[A-Za-z0-9']+")
+_HEADING = re.compile(r"^\s*=+[^=]+=+\s*$")
+
+def split_sentences(text: str) -> List[str]:
+    """Split text into sentences, skipping section headings and blank lines."""
+    sentences = []
+    for paragraph in text.split("\n"):
+        if not paragraph.strip() or _HEADING.match(paragraph):
+            continue
+        sentences.extend(s.strip() for s in _SENTENCE_BOUNDARY.split(paragraph) if s.strip())
+    return sentences
+
+def _content_words(text: str) -> List[str]:
+    return [w for w in (m.lower() for m in _WORD.findall(text)) if w not in STOPWORDS and len(w) > 1]
+
+def extractive_summary(text: str, max_words: int = 100) -> str:
+    """
+    Return up to `max_words` words made of the highest scoring sentences, in
+    their original order. Sentences score by the average frequency of their
+    content words across the whole text, with a bonus for leading sentences.
+    """
+    sentences = split_sentences(text)
+    if not sentences:
+        return ""
+
+    frequencies = Counter(_content_words(text))
+    top = max(frequencies.values(), default=1)
+
+    def score(index: int) -> float:
+        words = _content_words(sentences[index])
+        if not words:
+            return 0.0
+        position_bonus = 1.0 / (index + 1) ** 0.5
+        return sum(frequencies[w] for w in words) / (top * len(words)) + 0.5 * position_bonus
+
+    # Ties go to the earlier sentence so the output is stable
+    ranked = sorted(range(len(sentences)), key=lambda i: (-score(i), i))
+    chosen = []
+    budget = max_words
+    for index in ranked:
+        length = len(sentences[index].split())
+        if length > budget:
+            continue
+        chosen.append(index)
+        budget -= length
+        if budget <= 0:
+            break
+
+    if not chosen:
+        # Every sentence is longer than the budget, cut the best one
+        return " ".join(sentences[ranked[0]].split()[:max_words])
+    return " ".join(sentences[i] for i in sorted(chosen))
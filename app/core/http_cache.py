@@ -0,0 +1,144 @@
+"""
+Conditional GET support for read endpoints.
+
+Handlers compute a cheap validator (ETag, and Last-Modified where rows carry
+timestamps) from row ids, counts and versions and only build the response body
+when the client's copy is out of date; otherwise they answer
+`304 Not Modified` with no body. Rendered bodies are kept per validator, so
+clients that don't revalidate don't cost a rebuild either, and large bodies
+are compressed once with gzip (or brotli, if the `brotli` package is installed).
+"""
+import gzip
+import hashlib
+import json
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Callable, Optional, Tuple
+from fastapi.encoders import jsonable_encoder
+from fastapi.requests import Request
+from fastapi.responses import Response
+from app.core.config import settings
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip is used without it
+    brotli = None
+
+# Clients may keep responses but must revalidate them before each use
+REVALIDATE = "private, no-cache"
+
+# (path, etag, accepted encoding) -> (rendered body, its encoding), least recently used first
+_bodies: "OrderedDict[Tuple[str, str, Optional[str]], Tuple[bytes, Optional[str]]]" = OrderedDict()
+
+def make_etag(*parts: Any) -> str:
+    """
+    ETag from the given validator parts (ids, timestamps, paging params).
+    It is weak: it tracks the data, not the bytes, which vary with the content encoding.
+    """
+    digest = hashlib.sha1(json.dumps(jsonable_encoder(parts), sort_keys=True).encode()).hexdigest()
+    return f'W/"{digest[:32]}"'
+
+def _opaque_tag(tag: str) -> str:
+    return tag.strip().removeprefix("W/")
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match already names `etag`."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    return _opaque_tag(etag) in {_opaque_tag(tag) for tag in header.split(",")}
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite drops the timezone of stored datetimes
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+def as_http_date(value: datetime) -> str:
+    return format_datetime(_as_utc(value), usegmt=True)
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """Evaluate If-None-Match, or If-Modified-Since when the client sent no ETag."""
+    if request.headers.get("if-none-match") is not None:
+        return etag_matches(request, etag)
+    since = request.headers.get("if-modified-since")
+    if not since or last_modified is None:
+        return False
+    try:
+        since_date = parsedate_to_datetime(since)
+    except (TypeError, ValueError):
+        return False
+    # HTTP dates have one second resolution
+    return _as_utc(last_modified).replace(microsecond=0) <= _as_utc(since_date)
+
+def default_cache_control() -> str:
+    if settings.HTTP_CACHE_MAX_AGE_SECONDS > 0:
+        return f"private, max-age={settings.HTTP_CACHE_MAX_AGE_SECONDS}"
+    return REVALIDATE
+
+def choose_encoding(request: Request) -> Optional[str]:
+    """Best content encoding the client accepts: brotli if available, then gzip."""
+    if not settings.HTTP_COMPRESSION_ENABLED:
+        return None
+    accepted = {}
+    for item in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = item.partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, 0) > 0:
+            return encoding
+    return None
+
+def _render(request: Request, etag: str, build_content: Callable[[], Any]) -> Tuple[bytes, Optional[str]]:
+    encoding = choose_encoding(request)
+    key = (request.url.path, etag, encoding)
+    if key in _bodies:
+        _bodies.move_to_end(key)
+        return _bodies[key]
+
+    body = json.dumps(jsonable_encoder(build_content()), ensure_ascii=False, separators=(",", ":")).encode()
+    if encoding and len(body) >= settings.HTTP_COMPRESSION_MIN_BYTES:
+        body = brotli.compress(body, quality=5) if encoding == "br" else gzip.compress(body, compresslevel=6)
+    else:
+        encoding = None
+
+    if settings.HTTP_BODY_CACHE_SIZE > 0:
+        _bodies[key] = (body, encoding)
+        while len(_bodies) > settings.HTTP_BODY_CACHE_SIZE:
+            _bodies.popitem(last=False)
+    return body, encoding
+
+def conditional_response(
+    request: Request,
+    etag: str,
+    build_content: Callable[[], Any],
+    last_modified: Optional[datetime] = None,
+    cache_control: Optional[str] = None
+) -> Response:
+    """Return 304 if the client's copy is current, otherwise the JSON built by `build_content`."""
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control or default_cache_control(),
+        "Vary": "Accept-Encoding"
+    }
+    if last_modified is not None:
+        headers["Last-Modified"] = as_http_date(last_modified)
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    body, encoding = _render(request, etag, build_content)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,439 @@
+"""
+LLM gateway shared by all agents.
+
+Every agent gets its chat models from `get_llm_gateway().chat_model(stage)`,
+so they share one pooled HTTP client, the same timeout and retry policy and
+the LLM circuit breaker, and each pipeline stage can use its own model
+(LLM_MODEL_TOPIC, ...).
+
+Backends (LLM_BACKEND):
+- "openai": OpenAI or any OpenAI-compatible server (OPENAI_BASE_URL)
+- "local": LocalChatModel, deterministic and offline; summaries are extractive
+"""
+import asyncio
+import json
+import logging
+import re
+import time
+import uuid
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+from urllib.parse import quote
+import httpx
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult, LLMResult
+from pydantic import PrivateAttr
+from app.core import usage
+from app.core.config import settings
+from app.core.extractive import extractive_summary
+from app.core.llm_callbacks import (
+    estimate_prompt_tokens, llm_metrics_callback, llm_usage_callback, response_model, token_usage
+)
+from app.core.metrics import LLM_HEDGES, current_stage
+from app.core.resilience import CircuitBreaker, CircuitOpenError, get_breaker
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("topic", "search", "map", "combine")
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """
+    Whether an LLM call failed because of the provider (timeout, connection
+    error, 5xx, 429) rather than because of the request or our own code.
+    """
+    import openai
+    
+    if isinstance(error, (asyncio.TimeoutError, httpx.TransportError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        status = error.status_code
+    elif isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+    else:
+        return False
+    return status == 429 or status >= 500
+
+def is_llm_unavailable(error: BaseException) -> bool:
+    """Whether agents should degrade (extractive summary, heuristic topic) rather than fail on `error`."""
+    return isinstance(error, CircuitOpenError) or is_upstream_failure(error)
+
+class HedgedChatModel(BaseChatModel):
+    """
+    Wrap a chat model with hedged requests: if a call is still running after
+    the recent `quantile` latency of this stage, send a duplicate and use
+    whichever finishes first. Bounds tail latency at the cost of a few extra calls.
+
+    The callbacks account for the call as one; the duplicate is reserved against
+    the token budgets before it is sent, and whichever attempt loses is recorded
+    on the current UsageTracker as a call of its own.
+    """
+
+    model: BaseChatModel
+    stage: str
+    quantile: float = 0.95
+    min_delay: float = 2.0
+    min_samples: int = 20
+
+    _latencies: Deque[float] = PrivateAttr(default_factory=lambda: deque(maxlen=200))
+
+    @property
+    def _llm_type(self) -> str:
+        return f"hedged-{self.model._llm_type}"
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None until enough latencies are known."""
+        if len(self._latencies) < self.min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(self.quantile * len(ordered)))
+        return max(self.min_delay, ordered[index])
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        return self.model._generate(messages, stop=stop, **kwargs)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        started = time.perf_counter()
+        attempts = [asyncio.create_task(self.model._agenerate(messages, stop=stop, **kwargs))]
+        winner: Optional[asyncio.Task] = None
+        hedge_run_id: Optional[uuid.UUID] = None
+        try:
+            delay = self.hedge_delay()
+            if delay is not None:
+                done, _ = await asyncio.wait(attempts, timeout=delay)
+                if not done:
+                    hedge_run_id = await self._reserve_hedge(messages)
+                if hedge_run_id is not None:
+                    LLM_HEDGES.inc(stage=self.stage, result="sent")
+                    attempts.append(asyncio.create_task(self.model._agenerate(messages, stop=stop, **kwargs)))
+
+            pending = set(attempts)
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Prefer a successful attempt; only fail once every attempt has failed
+                for task in done:
+                    if task.exception() is None:
+                        if len(attempts) > 1 and task is attempts[1]:
+                            LLM_HEDGES.inc(stage=self.stage, result="won")
+                        self._latencies.append(time.perf_counter() - started)
+                        winner = task
+                        return task.result()
+                if not pending:
+                    raise next(iter(done)).exception()
+        finally:
+            for task in attempts:
+                task.cancel()
+            if hedge_run_id is not None:
+                loser = next((task for task in attempts if task is not winner), None)
+                await self._settle_loser(hedge_run_id, loser)
+
+    async def _reserve_hedge(self, messages: List[BaseMessage]) -> Optional[uuid.UUID]:
+        """Reserve the duplicate call's prompt tokens; None (don't hedge) if they don't fit the budget."""
+        run_id = uuid.uuid4()
+        try:
+            await usage.reserve(run_id, estimate_prompt_tokens(messages))
+        except usage.TokenBudgetExceeded:
+            LLM_HEDGES.inc(stage=self.stage, result="over_budget")
+            return None
+        return run_id
+
+    async def _settle_loser(self, run_id: uuid.UUID, loser: Optional[asyncio.Task]) -> None:
+        """
+        Record the attempt that lost the race: its reported usage if it finished,
+        or its reserved prompt tokens if it was cancelled in flight (the provider
+        may bill those). Attempts that failed cost nothing, like any failed call.
+        """
+        if loser is None or (loser.done() and not loser.cancelled() and loser.exception() is not None):
+            await usage.settle(run_id)
+            return
+        prompt_tokens, completion_tokens = usage.reserved_tokens(run_id), 0
+        model = getattr(self.model, "model_name", None) or self.model._llm_type
+        if loser.done() and not loser.cancelled():
+            result = loser.result()
+            response = LLMResult(generations=[result.generations], llm_output=result.llm_output)
+            reported = token_usage(response)
+            if any(reported):
+                prompt_tokens, completion_tokens = reported
+            if response_model(response) != "unknown":
+                model = response_model(response)
+        await usage.settle(run_id, usage.LLMCallUsage(
+            stage=current_stage() or "unknown",
+            model=model,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cost=usage.estimate_cost(model, prompt_tokens, completion_tokens)
+        ))
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        # A stream can't be swapped mid-way, so streamed calls are not hedged
+        async for chunk in self.model._astream(messages, stop=stop, **kwargs):
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    def _combine_llm_outputs(self, llm_outputs: List[Optional[dict]]) -> dict:
+        return self.model._combine_llm_outputs(llm_outputs)
+
+class CircuitBreakerChatModel(BaseChatModel):
+    """
+    Wrap a chat model with a circuit breaker: while the circuit is open, calls
+    fail with CircuitOpenError before anything is sent. Only provider failures
+    (see `is_upstream_failure`) count against the circuit; a request the
+    provider rejects (e.g. too long for the context) says nothing about its
+    health, and must not open the circuit for everyone.
+    """
+
+    model: BaseChatModel
+    breaker_name: str = "llm"
+
+    @property
+    def _llm_type(self) -> str:
+        return f"circuit-{self.model._llm_type}"
+
+    def _should_stream(self, *, async_api: bool, run_manager=None, **kwargs: Any) -> bool:
+        # Stream only if the wrapped model can
+        return self.model._should_stream(async_api=async_api, run_manager=run_manager, **kwargs)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        breaker = get_breaker(self.breaker_name)
+        breaker.check()
+        try:
+            result = self.model._generate(messages, stop=stop, **kwargs)
+        except Exception as e:
+            self._record_error(breaker, e)
+            raise
+        breaker.record_success()
+        return result
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        breaker = get_breaker(self.breaker_name)
+        breaker.check()
+        try:
+            result = await self.model._agenerate(messages, stop=stop, **kwargs)
+        except Exception as e:
+            self._record_error(breaker, e)
+            raise
+        breaker.record_success()
+        return result
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        breaker = get_breaker(self.breaker_name)
+        breaker.check()
+        try:
+            async for chunk in self.model._astream(messages, stop=stop, **kwargs):
+                if run_manager:
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+        except Exception as e:
+            self._record_error(breaker, e)
+            raise
+        breaker.record_success()
+
+    @staticmethod
+    def _record_error(breaker: CircuitBreaker, error: Exception) -> None:
+        if is_upstream_failure(error):
+            breaker.record_failure(error)
+
+    def _combine_llm_outputs(self, llm_outputs: List[Optional[dict]]) -> dict:
+        return self.model._combine_llm_outputs(llm_outputs)
+
+_QUESTION_PREFIX = re.compile(
+    r"^(please\s+)?(can you\s+)?(tell me (more )?about|what (is|are|was|were)|who (is|are|was|were)|"
+    r"where (is|are|was|were)|explain|describe|summari[sz]e|how (does|do|did)|why (is|are|does|do|did)|"
+    r"i want to (know|learn) about|information (on|about))\s+",
+    re.IGNORECASE
+)
+_ARTICLE = re.compile(r"^(the|a|an)\s+", re.IGNORECASE)
+_TEXT_TO_SUMMARIZE = re.compile(r"Text to summarize:\s*(.*?)\s*Summary:\s*$", re.DOTALL)
+_WORD_LIMIT = re.compile(r"at most (\d+) words")
+
+class LocalChatModel(BaseChatModel):
+    """
+    Deterministic offline stand-in for the OpenAI models, one per stage:
+    heuristic topic extraction, a Wikipedia URL guess for search, and
+    extractive summaries for map and combine.
+    """
+
+    stage: str
+
+    @property
+    def _llm_type(self) -> str:
+        return "local-extractive"
+
+    @staticmethod
+    def extract_topic(query: str) -> str:
+        topic = _QUESTION_PREFIX.sub("", query.strip())
+        topic = _ARTICLE.sub("", topic.strip(" ?!.")).strip()
+        return topic[:1].upper() + topic[1:] if topic else query.strip()
+
+    def _respond(self, prompt: str) -> str:
+        if self.stage == "topic":
+            return json.dumps({"topic": self.extract_topic(prompt)})
+        if self.stage == "search":
+            title = self.extract_topic(prompt.split("Topic:", 1)[-1])
+            return json.dumps({
+                "title": title,
+                "summary": "",
+                "url": f"https://{settings.WIKIPEDIA_LANGUAGE}.wikipedia.org/wiki/{quote(title.replace(' ', '_'))}"
+            })
+
+        match = _TEXT_TO_SUMMARIZE.search(prompt)
+        text = match.group(1) if match else prompt
+        limit = _WORD_LIMIT.search(prompt)
+        return extractive_summary(text, int(limit.group(1)) if limit else 100)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        prompt = str(messages[-1].content)
+        content = self._respond(prompt)
+        # Rough token counts (~4 characters per token) so usage metrics still mean something
+        prompt_tokens = sum(len(str(m.content)) for m in messages) // 4
+        completion_tokens = len(content) // 4
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=content))],
+            llm_output={
+                "model_name": "local",
+                "token_usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens
+                }
+            }
+        )
+
+class LLMGateway:
+    """Builds and caches the chat model for each pipeline stage."""
+
+    def __init__(self):
+        self.backend = settings.LLM_BACKEND
+        if self.backend not in ("openai", "local"):
+            raise ValueError(f"Unknown LLM_BACKEND: {self.backend}")
+        self._models: Dict[Tuple[str, float], BaseChatModel] = {}
+        self._http_client: Optional[httpx.Client] = None
+        self._http_async_client: Optional[httpx.AsyncClient] = None
+
+    def model_name(self, stage: str) -> str:
+        """The model configured for `stage`, falling back to OPENAI_MODEL."""
+        if stage not in STAGES:
+            raise ValueError(f"Unknown LLM stage: {stage}")
+        return getattr(settings, f"LLM_MODEL_{stage.upper()}") or settings.OPENAI_MODEL
+
+    def chat_model(self, stage: str, temperature: float = 0.7) -> BaseChatModel:
+        key = (stage, temperature)
+        if key not in self._models:
+            self._models[key] = CircuitBreakerChatModel(
+                model=self._build(stage, temperature),
+                callbacks=[llm_metrics_callback, llm_usage_callback]
+            )
+        return self._models[key]
+
+    def _build(self, stage: str, temperature: float) -> BaseChatModel:
+        if self.backend == "local":
+            logger.info(f"Using the local extractive backend for the {stage} stage")
+            return LocalChatModel(stage=stage)
+
+        from langchain_openai import ChatOpenAI
+
+        model_name = self.model_name(stage)
+        logger.info(f"Using {model_name} for the {stage} stage")
+        model = ChatOpenAI(
+            model=model_name,
+            temperature=temperature,
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL,
+            timeout=settings.LLM_TIMEOUT_SECONDS,
+            max_retries=settings.LLM_MAX_RETRIES,
+            # Report token usage for streamed calls too
+            stream_usage=True,
+            http_client=self._sync_client(),
+            http_async_client=self._async_client()
+        )
+        if not settings.LLM_HEDGE_ENABLED:
+            return model
+        return HedgedChatModel(
+            model=model,
+            stage=stage,
+            quantile=settings.LLM_HEDGE_QUANTILE,
+            min_delay=settings.LLM_HEDGE_MIN_DELAY_SECONDS
+        )
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_MAX_CONNECTIONS
+        )
+
+    def _sync_client(self) -> httpx.Client:
+        if self._http_client is None:
+            self._http_client = httpx.Client(limits=self._limits(), timeout=settings.LLM_TIMEOUT_SECONDS)
+        return self._http_client
+
+    def _async_client(self) -> httpx.AsyncClient:
+        if self._http_async_client is None:
+            self._http_async_client = httpx.AsyncClient(limits=self._limits(), timeout=settings.LLM_TIMEOUT_SECONDS)
+        return self._http_async_client
+
+    async def aclose(self) -> None:
+        """Close the pooled HTTP clients; models built by this gateway can't be used afterwards."""
+        if self._http_async_client is not None:
+            await self._http_async_client.aclose()
+        if self._http_client is not None:
+            self._http_client.close()
+
+_gateway: Optional[LLMGateway] = None
+
+def get_llm_gateway() -> LLMGateway:
+    """Return the process-wide gateway for the configured LLM_BACKEND."""
+    global _gateway
+    if _gateway is None:
+        _gateway = LLMGateway()
+    return _gateway
+
+async def close_llm_gateway() -> None:
+    """Close the process-wide gateway, if one was built; the next `get_llm_gateway()` builds a new one."""
+    global _gateway
+    gateway, _gateway = _gateway, None
+    if gateway is not None:
+        await gateway.aclose()
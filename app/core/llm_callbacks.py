@@ -0,0 +1,79 @@
+"""
+LangChain callback handlers. Kept apart from app.core.metrics so importing
+metrics doesn't pull in LangChain.
+"""
+from typing import List, Tuple
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.messages import BaseMessage
+from app.core import usage
+from app.core.metrics import LLM_CALLS, LLM_TOKENS, current_stage
+
+def estimate_prompt_tokens(messages: List[BaseMessage]) -> int:
+    """Rough prompt size (~4 characters per token); the actual count is settled on completion."""
+    return sum(len(str(message.content)) for message in messages) // 4 + 1
+
+def token_usage(response) -> Tuple[int, int]:
+    """(prompt, completion) tokens of an LLM result, streamed or not."""
+    usage = (response.llm_output or {}).get("token_usage")
+    if usage:
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    # Streamed responses report usage on the message instead
+    prompt_tokens = completion_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+            prompt_tokens += metadata.get("input_tokens", 0)
+            completion_tokens += metadata.get("output_tokens", 0)
+    return prompt_tokens, completion_tokens
+
+def response_model(response) -> str:
+    """Name of the model that produced an LLM result, as reported by the provider."""
+    model = (response.llm_output or {}).get("model_name")
+    if model:
+        return model
+    for generations in response.generations:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "response_metadata", None) or {}
+            if metadata.get("model_name"):
+                return metadata["model_name"]
+    return "unknown"
+
+class LLMMetricsCallback(AsyncCallbackHandler):
+    """Count LLM calls and token usage per pipeline stage."""
+
+    async def on_llm_end(self, response, **kwargs) -> None:
+        stage = current_stage() or "unknown"
+        LLM_CALLS.inc(stage=stage)
+        prompt_tokens, completion_tokens = token_usage(response)
+        LLM_TOKENS.inc(prompt_tokens, stage=stage, type="prompt")
+        LLM_TOKENS.inc(completion_tokens, stage=stage, type="completion")
+
+class LLMUsageCallback(AsyncCallbackHandler):
+    """Enforce token budgets before each LLM call and record its usage and cost after it."""
+
+    # Budget errors must abort the call rather than be logged and ignored
+    raise_error = True
+
+    async def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs) -> None:
+        await usage.reserve(run_id, estimate_prompt_tokens([message for batch in messages for message in batch]))
+
+    async def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        prompt_tokens, completion_tokens = token_usage(response)
+        if not prompt_tokens and not completion_tokens:
+            # Some OpenAI-compatible servers don't report usage for streamed calls, so estimate it
+            prompt_tokens = usage.reserved_tokens(run_id)
+            completion_tokens = sum(len(g.text) for generations in response.generations for g in generations) // 4
+        model = response_model(response)
+        await usage.settle(run_id, usage.LLMCallUsage(
+            stage=current_stage() or "unknown",
+            model=model,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cost=usage.estimate_cost(model, prompt_tokens, completion_tokens)
+        ))
+
+    async def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        await usage.settle(run_id)
+
+llm_metrics_callback = LLMMetricsCallback()
+llm_usage_callback = LLMUsageCallback()
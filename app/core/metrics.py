@@ -0,0 +1,212 @@
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, wide enough to cover both DB writes and long map phases
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Spans recorded during the current HTTP request, used for the Server-Timing header
+_request_spans: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_spans", default=None)
+# Short id of the HTTP request being handled, used to correlate logs and diagnostics
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+# Pipeline stage currently executing, used to attribute LLM token usage
+_current_stage: ContextVar[Optional[str]] = ContextVar("current_stage", default=None)
+
+def _format_labels(label_names: Sequence[str], label_values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    def __init__(self, name: str, description: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # key -> (bucket counts, sum, count)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float, int]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    labels = _format_labels(self.label_names, key, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+                labels = _format_labels(self.label_names, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+REQUEST_LATENCY = registry.register(Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency",
+    ["method", "path", "status"]
+))
+STAGE_LATENCY = registry.register(Histogram(
+    "pipeline_stage_duration_seconds",
+    "Latency of each agent pipeline stage",
+    ["stage"]
+))
+STAGE_ERRORS = registry.register(Counter(
+    "pipeline_stage_errors_total",
+    "Number of pipeline stages that raised an error",
+    ["stage"]
+))
+LLM_CALLS = registry.register(Counter(
+    "llm_calls_total",
+    "Number of LLM calls",
+    ["stage"]
+))
+LLM_TOKENS = registry.register(Counter(
+    "llm_tokens_total",
+    "LLM tokens used",
+    ["stage", "type"]
+))
+LLM_COST = registry.register(Counter(
+    "llm_cost_usd_total",
+    "Estimated LLM cost in USD, from LLM_PRICING",
+    ["stage", "model"]
+))
+LLM_HEDGES = registry.register(Counter(
+    "llm_hedged_requests_total",
+    "Duplicate LLM calls sent for slow requests (sent) and how often the duplicate finished first (won)",
+    ["stage", "result"]
+))
+CIRCUIT_OPENED = registry.register(Counter(
+    "circuit_breaker_opened_total",
+    "Times a dependency's circuit breaker opened",
+    ["dependency"]
+))
+CIRCUIT_REJECTED = registry.register(Counter(
+    "circuit_breaker_rejected_calls_total",
+    "Calls failed fast because the dependency's circuit was open",
+    ["dependency"]
+))
+EVENT_LOOP_LAG = registry.register(Histogram(
+    "event_loop_lag_seconds",
+    "Delay between when the event loop should have woken up and when it did",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+))
+EVENT_LOOP_BLOCKS = registry.register(Counter(
+    "event_loop_blocked_callbacks_total",
+    "Callbacks that held the event loop longer than the diagnostics threshold"
+))
+CACHE_REQUESTS = registry.register(Counter(
+    "cache_requests_total",
+    "Cache lookups by cache and result (hit/miss)",
+    ["cache", "result"]
+))
+
+def start_request(request_id: str) -> List[Tuple[str, float]]:
+    """Start collecting stage spans for the current request."""
+    spans: List[Tuple[str, float]] = []
+    _request_spans.set(spans)
+    _request_id.set(request_id)
+    return spans
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+def request_id_from_context(context) -> Optional[str]:
+    """Read the request id from a captured contextvars.Context."""
+    return context.get(_request_id) if context is not None else None
+
+def current_stage() -> Optional[str]:
+    return _current_stage.get()
+
+@contextmanager
+def track_stage(stage: str) -> Iterator[None]:
+    """Time a pipeline stage and attribute LLM usage inside it to the stage."""
+    token = _current_stage.set(stage)
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        _current_stage.reset(token)
+        STAGE_LATENCY.observe(duration, stage=stage)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((stage, duration))
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+async def monitor_event_loop_lag(interval: float) -> None:
+    """Sample event loop lag forever; any blocking call in a handler shows up here."""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - expected))
+
+def server_timing_header(spans: List[Tuple[str, float]], total: float) -> str:
+    """Build a Server-Timing header value, merging repeated stages."""
+    durations: Dict[str, float] = {}
+    for stage, duration in spans:
+        durations[stage] = durations.get(stage, 0.0) + duration
+    entries = [f"{stage};dur={duration * 1000:.1f}" for stage, duration in durations.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
@@ -0,0 +1,133 @@
+"""
+Circuit breakers for upstream dependencies (Wikipedia, the LLM).
+
+After CIRCUIT_FAILURE_THRESHOLD consecutive failures a dependency's circuit
+opens and calls fail fast with CircuitOpenError for CIRCUIT_RESET_SECONDS,
+so callers can degrade right away (stale cache, extractive summary) instead
+of waiting on an upstream that is down. Then one trial call is let through:
+success closes the circuit, failure keeps it open for another period.
+Breakers are per worker process.
+
+Only the upstream's own errors count, including its socket timeouts. Callers
+that give up on a call (a request deadline, a cancelled task) don't open the
+circuit: waiting for a local thread or a stalled event loop says nothing
+about the upstream.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Type, TypeVar
+from app.core.config import settings
+from app.core.metrics import CIRCUIT_OPENED, CIRCUIT_REJECTED
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class CircuitOpenError(Exception):
+    """The dependency's circuit is open, so the call was not attempted."""
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after  # Seconds until the next trial call
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int,
+        reset_timeout: float,
+        ignored_exceptions: Tuple[Type[BaseException], ...] = ()
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        # Errors that are answers rather than upstream failures (e.g. page not found)
+        self.ignored_exceptions = ignored_exceptions
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_started_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now; in half-open state only one trial call at a time."""
+        state = self.state
+        if state == "closed":
+            return True
+        now = time.monotonic()
+        # A trial whose outcome was never reported (e.g. cancelled) doesn't block the next one forever
+        if state == "half_open" and (self._trial_started_at is None or now - self._trial_started_at >= self.reset_timeout):
+            self._trial_started_at = now
+            return True
+        CIRCUIT_REJECTED.inc(dependency=self.name)
+        return False
+
+    def retry_after(self) -> float:
+        """Seconds until the circuit lets a trial call through."""
+        if self._opened_at is None:
+            return 0.0
+        trial_at = self._opened_at + self.reset_timeout
+        if self._trial_started_at is not None:
+            # A trial is running; the next one is due once it expires
+            trial_at = max(trial_at, self._trial_started_at + self.reset_timeout)
+        return max(0.0, trial_at - time.monotonic())
+
+    def check(self) -> None:
+        """Raise CircuitOpenError unless a call may go ahead."""
+        if not self.allow():
+            raise CircuitOpenError(
+                f"{self.name} is unavailable (circuit open), try again later",
+                retry_after=self.retry_after()
+            )
+
+    def record_success(self) -> None:
+        if self._opened_at is not None:
+            logger.info(f"Circuit for {self.name} closed")
+        self._failures = 0
+        self._opened_at = None
+        self._trial_started_at = None
+
+    def record_failure(self, error: Optional[BaseException] = None) -> None:
+        if isinstance(error, (asyncio.CancelledError, CircuitOpenError) + self.ignored_exceptions):
+            return
+        self._failures += 1
+        self._trial_started_at = None
+        # A failed trial reopens the circuit; failures of calls already in flight when it opened don't extend it
+        if self.state == "half_open" or (self._opened_at is None and self._failures >= self.failure_threshold):
+            logger.warning(f"Circuit for {self.name} opened after {self._failures} consecutive failures: {error}")
+            CIRCUIT_OPENED.inc(dependency=self.name)
+            self._opened_at = time.monotonic()
+
+    async def call(self, factory: Callable[[], Awaitable[T]]) -> T:
+        """Run `factory()` through the breaker."""
+        self.check()
+        try:
+            result = await factory()
+        except BaseException as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+        return result
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+def get_breaker(name: str, ignored_exceptions: Tuple[Type[BaseException], ...] = ()) -> CircuitBreaker:
+    """Return the process-wide breaker for a dependency."""
+    if name not in _breakers:
+        _breakers[name] = CircuitBreaker(
+            name,
+            failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=settings.CIRCUIT_RESET_SECONDS,
+            ignored_exceptions=ignored_exceptions
+        )
+    return _breakers[name]
+
+def circuit_states() -> Dict[str, str]:
+    return {name: breaker.state for name, breaker in _breakers.items()}
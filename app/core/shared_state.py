@@ -0,0 +1,209 @@
+"""
+State shared between worker processes: caches, rate-limit budgets and
+single-flight claims (`add` a key to claim work, `delete` it when done).
+
+LocalStateStore keeps everything in-process and is the stand-in for a single
+worker (development, tests). DatabaseStateStore keeps it in the `shared_state`
+table so every gunicorn worker sees the same values.
+"""
+import asyncio
+import json
+from abc import ABC, abstractmethod
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.db.models import SharedStateEntry
+
+logger = logging.getLogger(__name__)
+
+class SharedStateStore(ABC):
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Any]:
+        """The value of `key` (a counter's current count), or None if it is unset or expired."""
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Set `key`, expiring after `ttl` seconds if given."""
+
+    @abstractmethod
+    async def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """Set `key` only if it is not already set. Returns True if it was added."""
+
+    @abstractmethod
+    async def delete(self, key: str, value: Any = None) -> None:
+        """Delete `key`, or only if it currently holds `value` when one is given."""
+
+    @abstractmethod
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Atomically add `amount` to a counter and return the new value."""
+
+class LocalStateStore(SharedStateStore):
+    """In-process stand-in, only shared within a single worker."""
+
+    def __init__(self):
+        # key -> (value, expires_at)
+        self._values: Dict[str, Tuple[Any, Optional[float]]] = {}
+
+    def _live(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        entry = self._values.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self._values[key]
+            return None
+        return entry
+
+    @staticmethod
+    def _expiry(ttl: Optional[float]) -> Optional[float]:
+        return time.monotonic() + ttl if ttl is not None else None
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._live(key)
+        return entry[0] if entry else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._values[key] = (value, self._expiry(ttl))
+
+    async def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        if self._live(key) is not None:
+            return False
+        self._values[key] = (value, self._expiry(ttl))
+        return True
+
+    async def delete(self, key: str, value: Any = None) -> None:
+        entry = self._live(key)
+        if entry is not None and (value is None or entry[0] == value):
+            del self._values[key]
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        entry = self._live(key)
+        if entry is None:
+            self._values[key] = (amount, self._expiry(ttl))
+            return amount
+        new_value = entry[0] + amount
+        self._values[key] = (new_value, entry[1])
+        return new_value
+
+class DatabaseStateStore(SharedStateStore):
+    """Shared state in the application database, visible to every worker."""
+
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+
+    @staticmethod
+    def _now() -> datetime:
+        return datetime.now(timezone.utc)
+
+    def _expiry(self, ttl: Optional[float]) -> Optional[datetime]:
+        return self._now() + timedelta(seconds=ttl) if ttl is not None else None
+
+    def _not_expired(self):
+        return or_(SharedStateEntry.expires_at.is_(None), SharedStateEntry.expires_at > self._now())
+
+    def _get(self, key: str) -> Optional[Any]:
+        with self.session_factory() as db:
+            row = db.execute(
+                select(SharedStateEntry.value, SharedStateEntry.counter)
+                .where(SharedStateEntry.key == key, self._not_expired())
+            ).one_or_none()
+        if row is None:
+            return None
+        # Counters (from incr) keep their count in `counter` and have no value
+        return json.loads(row.value) if row.value is not None else row.counter
+
+    def _set(self, key: str, value: Any, ttl: Optional[float]) -> None:
+        entry = SharedStateEntry(key=key, value=json.dumps(value), counter=0, expires_at=self._expiry(ttl))
+        for _ in range(3):
+            with self.session_factory() as db:
+                db.merge(entry)
+                try:
+                    db.commit()
+                    return
+                except IntegrityError:
+                    # Another worker inserted the key between our read and write
+                    db.rollback()
+        raise RuntimeError(f"Could not set shared key {key}")
+
+    def _add(self, key: str, value: Any, ttl: Optional[float]) -> bool:
+        with self.session_factory() as db:
+            # Expired entries don't count as present
+            db.execute(delete(SharedStateEntry).where(
+                SharedStateEntry.key == key, SharedStateEntry.expires_at <= self._now()
+            ))
+            db.add(SharedStateEntry(key=key, value=json.dumps(value), counter=0, expires_at=self._expiry(ttl)))
+            try:
+                db.commit()
+                return True
+            except IntegrityError:
+                db.rollback()
+                return False
+
+    def _delete(self, key: str, value: Any) -> None:
+        statement = delete(SharedStateEntry).where(SharedStateEntry.key == key)
+        if value is not None:
+            statement = statement.where(SharedStateEntry.value == json.dumps(value))
+        with self.session_factory() as db:
+            db.execute(statement)
+            db.commit()
+
+    def _incr(self, key: str, amount: int, ttl: Optional[float]) -> int:
+        for _ in range(3):
+            with self.session_factory() as db:
+                result = db.execute(
+                    update(SharedStateEntry)
+                    .where(SharedStateEntry.key == key, self._not_expired())
+                    .values(counter=SharedStateEntry.counter + amount)
+                )
+                if result.rowcount:
+                    db.commit()
+                    return db.execute(
+                        select(SharedStateEntry.counter).where(SharedStateEntry.key == key)
+                    ).scalar_one()
+
+                # Missing or expired: start a new window. Only an expired row is
+                # removed, one another worker just created makes the insert fail
+                db.execute(delete(SharedStateEntry).where(
+                    SharedStateEntry.key == key, SharedStateEntry.expires_at <= self._now()
+                ))
+                db.add(SharedStateEntry(key=key, counter=amount, expires_at=self._expiry(ttl)))
+                try:
+                    db.commit()
+                    return amount
+                except IntegrityError:
+                    # Another worker created it first, retry the update
+                    db.rollback()
+        raise RuntimeError(f"Could not increment shared counter {key}")
+
+    # The database calls are blocking, run them off the event loop
+    async def get(self, key: str) -> Optional[Any]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+    async def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        return await asyncio.to_thread(self._add, key, value, ttl)
+
+    async def delete(self, key: str, value: Any = None) -> None:
+        await asyncio.to_thread(self._delete, key, value)
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        return await asyncio.to_thread(self._incr, key, amount, ttl)
+
+_store: Optional[SharedStateStore] = None
+
+def get_shared_state() -> SharedStateStore:
+    """Return the process-wide store for the configured SHARED_STATE_BACKEND."""
+    global _store
+    if _store is None:
+        if settings.SHARED_STATE_BACKEND == "database":
+            _store = DatabaseStateStore()
+        elif settings.SHARED_STATE_BACKEND == "local":
+            _store = LocalStateStore()
+        else:
+            raise ValueError(f"Unknown SHARED_STATE_BACKEND: {settings.SHARED_STATE_BACKEND}")
+        logger.info(f"Using {type(_store).__name__} for shared state")
+    return _store
@@ -0,0 +1,180 @@
+"""
+LLM token and cost accounting, and token budgets.
+
+Every LLM call made through the gateway is recorded on the current
+UsageTracker (one per request, batch item, prefetch or refresh) with its
+stage, model, token counts and estimated cost; handlers persist it per query
+with `save_usage`. Before each call, its prompt size is checked against the
+per-request budget (LLM_TOKEN_BUDGET_PER_REQUEST) and reserved against the
+per-minute budget shared by all workers (LLM_TOKEN_BUDGET_PER_MINUTE).
+A call that doesn't fit raises TokenBudgetExceeded; agents then degrade
+(extractive summary, heuristic topic) or reject, per LLM_BUDGET_MODE.
+"""
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.metrics import LLM_COST
+from app.core.shared_state import get_shared_state
+from app.db import models
+from app.db.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+class TokenBudgetExceeded(Exception):
+    """An LLM call would exceed the per-request or per-minute token budget."""
+
+class LLMCallUsage(BaseModel):
+    stage: str
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    cost: float
+
+class UsageTracker:
+    """LLM calls made by one unit of work, and its token budget."""
+
+    def __init__(self, max_tokens: Optional[int] = None):
+        self.max_tokens = max_tokens or None
+        self.calls: List[LLMCallUsage] = []
+        self.reserved = 0  # Estimated prompt tokens of calls in flight
+        self._saved = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(call.prompt_tokens + call.completion_tokens for call in self.calls)
+
+    @property
+    def cost(self) -> float:
+        return sum(call.cost for call in self.calls)
+
+    def remaining(self) -> Optional[int]:
+        if self.max_tokens is None:
+            return None
+        return self.max_tokens - self.total_tokens - self.reserved
+
+    def has_unsaved(self) -> bool:
+        return len(self.calls) > self._saved
+
+    def unsaved(self) -> List[LLMCallUsage]:
+        calls = self.calls[self._saved:]
+        self._saved = len(self.calls)
+        return calls
+
+_tracker: ContextVar[Optional[UsageTracker]] = ContextVar("usage_tracker", default=None)
+
+def start_tracking(max_tokens: Optional[int] = None) -> UsageTracker:
+    """
+    Track LLM usage of the current task and the tasks it starts from here on.
+    Defaults to the per-request budget.
+    """
+    tracker = UsageTracker(settings.LLM_TOKEN_BUDGET_PER_REQUEST if max_tokens is None else max_tokens)
+    _tracker.set(tracker)
+    return tracker
+
+def current_tracker() -> Optional[UsageTracker]:
+    return _tracker.get()
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Estimated USD cost, from the LLM_PRICING entry with the longest prefix of `model`."""
+    prices = [(name, price) for name, price in settings.LLM_PRICING.items() if model.startswith(name)]
+    if not prices:
+        return 0.0
+    prompt_price, completion_price = max(prices, key=lambda item: len(item[0]))[1]
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+def _minute_key() -> str:
+    return f"llm:tokens:{int(time.time() // 60)}"
+
+# run id -> (tracker, per-minute key, estimated prompt tokens) of calls in flight
+_reservations: Dict[UUID, Tuple[Optional[UsageTracker], Optional[str], int]] = {}
+
+async def can_spend(tokens: int) -> bool:
+    """Whether an estimated `tokens` still fit both budgets (without reserving them)."""
+    tracker = current_tracker()
+    remaining = tracker.remaining() if tracker else None
+    if remaining is not None and tokens > remaining:
+        return False
+    if settings.LLM_TOKEN_BUDGET_PER_MINUTE > 0:
+        spent = await get_shared_state().get(_minute_key()) or 0
+        return spent + tokens <= settings.LLM_TOKEN_BUDGET_PER_MINUTE
+    return True
+
+async def reserve(run_id: UUID, tokens: int) -> None:
+    """Reserve the estimated prompt tokens of an LLM call, or raise TokenBudgetExceeded."""
+    tracker = current_tracker()
+    remaining = tracker.remaining() if tracker else None
+    if remaining is not None and tokens > remaining:
+        raise TokenBudgetExceeded(
+            f"Request token budget exceeded ({tracker.total_tokens} of {tracker.max_tokens} tokens used)"
+        )
+
+    key = None
+    if settings.LLM_TOKEN_BUDGET_PER_MINUTE > 0:
+        key = _minute_key()
+        state = get_shared_state()
+        spent = await state.incr(key, tokens, ttl=120)
+        if spent > settings.LLM_TOKEN_BUDGET_PER_MINUTE:
+            await state.incr(key, -tokens, ttl=120)
+            raise TokenBudgetExceeded(
+                f"Token budget of {settings.LLM_TOKEN_BUDGET_PER_MINUTE} tokens per minute exceeded"
+            )
+
+    if tracker:
+        tracker.reserved += tokens
+    _reservations[run_id] = (tracker, key, tokens)
+
+def reserved_tokens(run_id: UUID) -> int:
+    """Estimated prompt tokens reserved for a call in flight."""
+    return _reservations.get(run_id, (None, None, 0))[2]
+
+async def settle(run_id: UUID, call: Optional[LLMCallUsage] = None) -> None:
+    """Replace a call's reservation with its actual usage (or release it if the call failed)."""
+    tracker, key, reserved = _reservations.pop(run_id, (current_tracker(), None, 0))
+    if tracker:
+        tracker.reserved -= reserved
+    actual = call.prompt_tokens + call.completion_tokens if call else 0
+    if key is not None and actual != reserved:
+        # Completion tokens are only known now; they still count against the minute the call started in
+        await get_shared_state().incr(key, actual - reserved, ttl=120)
+    if call is None:
+        return
+    LLM_COST.inc(call.cost, stage=call.stage, model=call.model)
+    if tracker:
+        tracker.calls.append(call)
+
+def save_usage(db: Session, query_id: Optional[int], topic: Optional[str], tracker: Optional[UsageTracker] = None) -> None:
+    """Store the LLM calls recorded since the last save, attributed to a query and topic."""
+    tracker = tracker or current_tracker()
+    calls = tracker.unsaved() if tracker else []
+    if not calls:
+        return
+    db.add_all([
+        models.LLMUsage(query_id=query_id, topic=topic, **call.model_dump())
+        for call in calls
+    ])
+    db.commit()
+
+async def persist_usage(
+    tracker: UsageTracker,
+    query_id: Optional[int],
+    topic: Optional[str],
+    session_factory=SessionLocal
+) -> None:
+    """`save_usage` for background work without a session of its own."""
+    if not tracker.has_unsaved():
+        return
+
+    def save():
+        with session_factory() as db:
+            save_usage(db, query_id, topic, tracker)
+
+    try:
+        await asyncio.to_thread(save)
+    except Exception as e:
+        logger.error(f"Failed to store LLM usage: {str(e)}")
@@ -3,7 +3,9 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
 
-engine = create_engine(settings.DATABASE_URL)
+# SQLite (used for tests and benchmarks) needs to be shared with the threadpool
+connect_args = {"check_same_thread": False} if settings.DATABASE_URL.startswith("sqlite") else {}
+engine = create_engine(settings.DATABASE_URL, connect_args=connect_args)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -13,4 +15,17 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+def get_session_factory() -> sessionmaker:
+    """For responses that outlive the request (streams), which open sessions of their own."""
+    return SessionLocal
+
+def init_db(reset: bool = False):
+    """Create the database tables, dropping existing ones first if `reset` is set."""
+    # Import models so they are registered on Base.metadata
+    from app.db import models
+    
+    if reset:
+        Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
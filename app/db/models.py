@@ -1,5 +1,5 @@
 from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Float
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, literal_column
 from app.db.database import Base
 
 class Query(Base):
@@ -13,6 +13,9 @@ class Query(Base):
     selected_option = Column(String(255), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Bumped in SQL by every update, for cache validators: two updates within one
+    # second (SQLite's now() resolution) leave updated_at unchanged
+    version = Column(Integer, nullable=False, default=1, onupdate=literal_column("version + 1"))
 
 class SearchResult(Base):
     __tablename__ = "search_results"
@@ -23,4 +26,44 @@ class SearchResult(Base):
     title = Column(String(255))
     content = Column(Text)
     summary = Column(Text)
-    created_at = Column(DateTime(timezone=True), server_default=func.now()) 
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now()) 
+
+class LLMUsage(Base):
+    """Token usage and estimated cost of one LLM call."""
+    __tablename__ = "llm_usage"
+
+    id = Column(Integer, primary_key=True, index=True)
+    query_id = Column(Integer, nullable=True, index=True)  # None for background work (e.g. the refresher)
+    topic = Column(String(255), nullable=True, index=True)
+    stage = Column(String(50))
+    model = Column(String(100))
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    cost = Column(Float, default=0.0)  # Estimated USD, from LLM_PRICING
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+class Article(Base):
+    """Latest full-article summary per Wikipedia URL, kept current by the freshness refresher."""
+    __tablename__ = "articles"
+
+    id = Column(Integer, primary_key=True, index=True)
+    url = Column(String(255), unique=True, index=True, nullable=False)
+    title = Column(String(255))
+    content = Column(Text)
+    summary = Column(Text)
+    revision_id = Column(Integer, nullable=True)  # Revision the summary was made from
+    revision_size = Column(Integer, nullable=True)  # Size in bytes of that revision
+    access_count = Column(Integer, default=0)
+    last_accessed_at = Column(DateTime(timezone=True), nullable=True)
+    checked_at = Column(DateTime(timezone=True), nullable=True)  # Last revision check
+    refreshed_at = Column(DateTime(timezone=True), nullable=True)  # Last time the summary was (re)generated
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class SharedStateEntry(Base):
+    """Key/value entries shared by all workers (caches, counters and locks)."""
+    __tablename__ = "shared_state"
+
+    key = Column(String(255), primary_key=True)
+    value = Column(Text, nullable=True)  # JSON encoded
+    counter = Column(Integer, default=0)
+    expires_at = Column(DateTime(timezone=True), nullable=True, index=True)
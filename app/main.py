@@ -1,24 +1,42 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi.requests import Request
-from sqlalchemy.orm import Session
-from sqlalchemy import text
-from typing import List, Optional, Dict
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy import func, text
+from typing import Awaitable, Callable, List, Optional, Dict, Tuple
+from datetime import datetime, timedelta, timezone
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
 import uvicorn
 import os
 import logging
+import asyncio
 import uuid
+import time
+import json
+import math
 
 from app.core.config import settings
-from app.db.database import get_db, engine
+from app.core import metrics, diagnostics, usage
+from app.core.metrics import track_stage
+from app.core.http_cache import conditional_response, make_etag
+from app.core.usage import TokenBudgetExceeded, save_usage
+from app.core.dependencies import (
+    get_topic_extractor, get_wikipedia_searcher, get_summarizer, get_prefetcher, get_refresher, warm_up_agents,
+    close_agents
+)
+from app.db.database import get_db, get_session_factory, init_db
 from app.db import models
 from app.agents.topic_extractor import TopicExtractor, TopicExtraction
 from app.agents.wikipedia_search import WikipediaSearcher, WikipediaSearchResult
 from app.agents.summarizer import Summarizer, Summary
+from app.agents.prefetcher import SpeculativePrefetcher
+from app.agents.batch_summarizer import BatchSummarizer
+from app.agents.article_cache import as_utc, summarize_article
+from app.core.resilience import CircuitOpenError, circuit_states
 
 # Configure logging
 logging.basicConfig(
@@ -27,10 +45,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Create database tables
-models.Base.metadata.drop_all(bind=engine)  # Drop existing tables
-models.Base.metadata.create_all(bind=engine)  # Create new tables
-
 # Pydantic models for request/response
 class QueryRequest(BaseModel):
     query: str
@@ -38,18 +52,69 @@ class QueryRequest(BaseModel):
 class DisambiguationRequest(BaseModel):
     query_id: int
     user_selected_option: str
+    sections: Optional[List[str]] = None  # Summarize only these sections, e.g. ["Lead", "History"]
 
 class SummarizeRequest(BaseModel):
     query: str
+    sections: Optional[List[str]] = None  # Summarize only these sections, e.g. ["Lead", "History"]
 
 class SummarizeResponse(BaseModel):
     query: str
     summary: str
     source_url: str
+    sections: List[str] = []
+    degraded: bool = False  # Extractive summary because the token budget was exceeded or the LLM is unavailable
+
+class BatchSummarizeRequest(BaseModel):
+    queries: List[str]
+    sections: Optional[List[str]] = None  # Applied to every query in the batch
+
+async def run_refresher():
+    refresher = await asyncio.to_thread(get_refresher)
+    await refresher.run_forever()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run per-worker startup work; nothing heavy happens at import time."""
+    if settings.DB_INIT_ON_STARTUP:
+        await asyncio.to_thread(init_db, settings.DB_RESET_ON_STARTUP)
+    
+    background_tasks = []
+    warm_up = None
+    if settings.AGENT_WARMUP_ON_STARTUP:
+        # Build agents off the event loop so the server accepts requests right away
+        warm_up = asyncio.create_task(asyncio.to_thread(warm_up_agents))
+    if settings.EVENT_LOOP_LAG_INTERVAL > 0:
+        background_tasks.append(asyncio.create_task(
+            metrics.monitor_event_loop_lag(settings.EVENT_LOOP_LAG_INTERVAL)
+        ))
+    if settings.REFRESH_ENABLED:
+        background_tasks.append(asyncio.create_task(run_refresher()))
+    
+    # Debug-mode event loop block detector and endpoint profiler
+    if settings.LOOP_BLOCK_DETECTOR_ENABLED:
+        diagnostics.enable_loop_block_detector(settings.LOOP_BLOCK_THRESHOLD_MS)
+    if settings.PROFILED_ENDPOINTS:
+        diagnostics.enable_profiler(
+            settings.PROFILED_ENDPOINTS,
+            settings.PROFILE_SAMPLE_INTERVAL_MS,
+            settings.PROFILE_OUTPUT_DIR
+        )
+    
+    yield
+    
+    for task in background_tasks:
+        task.cancel()
+    if warm_up is not None:
+        # Cancelling doesn't stop the thread, which could build a new gateway after it is closed
+        await asyncio.gather(warm_up, return_exceptions=True)
+    # Don't leak the pooled LLM connections, e.g. on every gunicorn worker recycle
+    await close_agents()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
-    version=settings.VERSION
+    version=settings.VERSION,
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -61,53 +126,87 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Record request latency and expose per-stage timings as a Server-Timing header."""
+    request_id = str(uuid.uuid4())[:8]  # Generate a short request ID for tracking
+    spans = metrics.start_request(request_id)
+    usage.start_tracking()
+    start = time.perf_counter()
+    with diagnostics.profile_request(request.url.path, request_id):
+        response = await call_next(request)
+    duration = time.perf_counter() - start
+    
+    # Label by route template rather than raw path to keep cardinality bounded
+    route = request.scope.get("route")
+    metrics.REQUEST_LATENCY.observe(
+        duration,
+        method=request.method,
+        path=getattr(route, "path", "unmatched"),
+        status=str(response.status_code)
+    )
+    response.headers["Server-Timing"] = metrics.server_timing_header(spans, duration)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
 # Mount static files and templates
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
+app.mount("/static", StaticFiles(directory="app/static", check_dir=False), name="static")
 templates = Jinja2Templates(directory="app/templates")
 
-# Initialize agents
-topic_extractor = TopicExtractor()
-wikipedia_searcher = WikipediaSearcher()
-summarizer = Summarizer()
-
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
     """Render the home page."""
     return templates.TemplateResponse("index.html", {"request": request})
 
+def service_unavailable(e: CircuitOpenError) -> HTTPException:
+    """503 for a dependency whose circuit is open, telling clients when to retry."""
+    return HTTPException(
+        status_code=503,
+        detail=str(e),
+        headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+    )
+
 @app.post("/api/v1/process")
 async def process_query(
     request: QueryRequest,
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    topic_extractor: TopicExtractor = Depends(get_topic_extractor),
+    wikipedia_searcher: WikipediaSearcher = Depends(get_wikipedia_searcher),
+    prefetcher: SpeculativePrefetcher = Depends(get_prefetcher)
 ):
     """Process a user query through the agent pipeline."""
-    request_id = str(uuid.uuid4())[:8]  # Generate a short request ID for tracking
+    request_id = metrics.current_request_id()
     logger.info(f"[{request_id}] Starting new request processing")
     logger.info(f"[{request_id}] Query: {request.query}")
     
     try:
         # 1. Extract topic
         logger.info(f"[{request_id}] Starting topic extraction...")
-        topic_extraction = await topic_extractor.extract_topic(request.query)
+        with track_stage("topic_extraction"):
+            topic_extraction = await topic_extractor.extract_topic(request.query)
         logger.info(f"[{request_id}] Topic extracted: {topic_extraction.topic}")
         
         # Store query in database
         logger.info(f"[{request_id}] Storing query in database...")
-        db_query = models.Query(
-            original_query=request.query,
-            extracted_topic=topic_extraction.topic
-        )
-        db.add(db_query)
-        db.commit()
-        db.refresh(db_query)
+        with track_stage("db_write"):
+            db_query = models.Query(
+                original_query=request.query,
+                extracted_topic=topic_extraction.topic
+            )
+            db.add(db_query)
+            db.commit()
+            db.refresh(db_query)
         logger.info(f"[{request_id}] Query stored with ID: {db_query.id}")
         
         # 2. Search Wikipedia
         logger.info(f"[{request_id}] Searching Wikipedia for topic: {topic_extraction.topic}")
-        search_results = await wikipedia_searcher.search(topic_extraction.topic)
+        with track_stage("search"):
+            search_results = await wikipedia_searcher.search(topic_extraction.topic)
         
         if not search_results:
             logger.info(f"[{request_id}] No Wikipedia results found, prompting for clearer information")
+            save_usage(db, db_query.id, topic_extraction.topic)
             return {
                 "status": "needs_clarification",
                 "message": "I couldn't find any Wikipedia articles matching your query. Could you please provide more specific information about what you're looking for?",
@@ -131,6 +230,16 @@ async def process_query(
         
         logger.info(f"[{request_id}] Found {len(search_results_list)} Wikipedia articles")
         
+        save_usage(db, db_query.id, topic_extraction.topic)
+        
+        # Most users pick the top candidate, start on it once the response is sent
+        background_tasks.add_task(
+            prefetcher.schedule,
+            db_query.id,
+            search_results_list[0].url,
+            search_results_list[0].title
+        )
+        
         # Return search results for user confirmation
         return {
             "status": "needs_confirmation",
@@ -151,6 +260,12 @@ async def process_query(
             }
         }
         
+    except TokenBudgetExceeded as e:
+        logger.warning(f"[{request_id}] Rejected over the token budget: {str(e)}")
+        raise HTTPException(status_code=429, detail=str(e))
+    except CircuitOpenError as e:
+        logger.warning(f"[{request_id}] Dependency unavailable: {str(e)}")
+        raise service_unavailable(e)
     except Exception as e:
         # Get the current agent info
         current_agent = "Unknown"
@@ -179,10 +294,100 @@ async def process_query(
             }
         )
 
+async def summarize_selection(
+    db: Session,
+    db_query: models.Query,
+    url: str,
+    sections: Optional[List[str]],
+    wikipedia_searcher: WikipediaSearcher,
+    summarizer: Summarizer,
+    prefetcher: SpeculativePrefetcher,
+    on_token: Optional[Callable[[str], Awaitable[None]]] = None
+) -> Dict:
+    """Summarize the article the user picked for `db_query` and store the result."""
+    # Use the speculative result when it matches
+    # (it covers the whole article, so not when specific sections were asked for)
+    prefetched = None
+    if not sections:
+        prefetched = await prefetcher.claim(db_query.id, url)
+    else:
+        await prefetcher.cancel(db_query.id)
+    if prefetched:
+        db_query.selected_option = url
+        with track_stage("db_write"):
+            db_result = models.SearchResult(
+                query_id=db_query.id,
+                wikipedia_url=prefetched.url,
+                title=prefetched.title,
+                content=prefetched.content,
+                summary=prefetched.summary
+            )
+            db.add(db_result)
+            db.commit()
+        
+        return {
+            "status": "success",
+            "title": prefetched.title,
+            "url": prefetched.url,
+            "summary": prefetched.summary,
+            "sections": prefetched.sections,
+            "degraded": prefetched.degraded,
+            "selected_topic": db_query.extracted_topic,
+            "agent_info": {
+                "name": "Summarizer",
+                "status": "completed",
+                "current_operation": "summarization"
+            }
+        }
+    
+    # Save the selected option
+    db_query.selected_option = url
+    with track_stage("db_write"):
+        db.commit()
+    
+    # Otherwise fetch and summarize it (or reuse the cached summary)
+    article = await summarize_article(db, url, sections, wikipedia_searcher, summarizer, on_token)
+    if article is None:
+        raise HTTPException(status_code=404, detail="Could not retrieve article content")
+    title, content, summary = article
+    
+    # Store the result
+    with track_stage("db_write"):
+        save_usage(db, db_query.id, db_query.extracted_topic)
+        db_result = models.SearchResult(
+            query_id=db_query.id,
+            wikipedia_url=url,
+            title=title,
+            content=content,
+            summary=summary.summary
+        )
+        db.add(db_result)
+        db.commit()
+    
+    return {
+        "status": "success",
+        "title": title,
+        "url": url,
+        "summary": summary.summary,
+        "sections": summary.sections,
+        "degraded": summary.degraded,
+        "selected_topic": db_query.extracted_topic,
+        "agent_info": {
+            "name": "Summarizer",
+            "status": "completed",
+            "current_operation": "summarization"
+        }
+    }
+
 @app.post("/api/v1/confirm")
 async def confirm_search_result(
     request: DisambiguationRequest,
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    topic_extractor: TopicExtractor = Depends(get_topic_extractor),
+    wikipedia_searcher: WikipediaSearcher = Depends(get_wikipedia_searcher),
+    summarizer: Summarizer = Depends(get_summarizer),
+    prefetcher: SpeculativePrefetcher = Depends(get_prefetcher)
 ):
     """Handle user's confirmation of search result or refinement request."""
     try:
@@ -193,6 +398,9 @@ async def confirm_search_result(
         
         # If user wants to refine the search
         if not request.user_selected_option.startswith('http'):
+            # Whatever was prefetched for the old results is no longer relevant
+            await prefetcher.cancel(db_query.id)
+            
             # Combine the original query with the user's new input
             combined_query = f"{db_query.original_query} {request.user_selected_option}"
             
@@ -200,15 +408,19 @@ async def confirm_search_result(
             db_query.original_query = combined_query
             
             # Extract topic from the combined query
-            topic_extraction = await topic_extractor.extract_topic(combined_query)
+            with track_stage("topic_extraction"):
+                topic_extraction = await topic_extractor.extract_topic(combined_query)
             db_query.extracted_topic = topic_extraction.topic
-            db.commit()
+            with track_stage("db_write"):
+                db.commit()
             
             # Do another search
-            search_results = await wikipedia_searcher.search(topic_extraction.topic)
+            with track_stage("search"):
+                search_results = await wikipedia_searcher.search(topic_extraction.topic)
             
             if not search_results:
                 logger.info(f"No Wikipedia results found for refined query, prompting for clearer information")
+                save_usage(db, db_query.id, topic_extraction.topic)
                 return {
                     "status": "needs_clarification",
                     "message": "I still couldn't find any Wikipedia articles matching your query. Could you please try rephrasing or providing more specific details about what you're looking for?",
@@ -229,6 +441,14 @@ async def confirm_search_result(
             else:
                 search_results_list = [search_results]  # Single result case
             
+            save_usage(db, db_query.id, topic_extraction.topic)
+            background_tasks.add_task(
+                prefetcher.schedule,
+                db_query.id,
+                search_results_list[0].url,
+                search_results_list[0].title
+            )
+            
             return {
                 "status": "needs_confirmation",
                 "search_results": [
@@ -247,48 +467,23 @@ async def confirm_search_result(
                 }
             }
         
-        # If user selected a URL, proceed with scraping and summarization
-        search_results = await wikipedia_searcher.search(db_query.extracted_topic)
-        
-        if not search_results:
-            raise HTTPException(status_code=404, detail="No results found")
-        
-        # Save the selected option
-        db_query.selected_option = request.user_selected_option
-        db.commit()
-        
-        # Get content and summarize
-        content = await wikipedia_searcher.get_full_content(request.user_selected_option)
-        
-        if not content:
-            raise HTTPException(status_code=404, detail="Could not retrieve content")
-        
-        summary = await summarizer.summarize(content)
-        
-        # Store the result
-        db_result = models.SearchResult(
-            query_id=db_query.id,
-            wikipedia_url=request.user_selected_option,
-            title=search_results.title,
-            content=content,
-            summary=summary.summary
+        # If user selected a URL, summarize it
+        return await summarize_selection(
+            db,
+            db_query,
+            request.user_selected_option,
+            request.sections,
+            wikipedia_searcher,
+            summarizer,
+            prefetcher
         )
-        db.add(db_result)
-        db.commit()
-        
-        return {
-            "status": "success",
-            "title": search_results.title,
-            "url": request.user_selected_option,
-            "summary": summary.summary,
-            "selected_topic": db_query.extracted_topic,
-            "agent_info": {
-                "name": "Summarizer",
-                "status": "completed",
-                "current_operation": "summarization"
-            }
-        }
         
+    except TokenBudgetExceeded as e:
+        logger.warning(f"Rejected over the token budget: {str(e)}")
+        raise HTTPException(status_code=429, detail=str(e))
+    except CircuitOpenError as e:
+        logger.warning(f"Dependency unavailable: {str(e)}")
+        raise service_unavailable(e)
     except Exception as e:
         current_agent = "Unknown"
         current_operation = "Unknown"
@@ -313,48 +508,235 @@ async def confirm_search_result(
             }
         )
 
+@app.post("/api/v1/confirm/stream")
+async def confirm_search_result_stream(
+    request: DisambiguationRequest,
+    db: Session = Depends(get_db),
+    session_factory: sessionmaker = Depends(get_session_factory),
+    wikipedia_searcher: WikipediaSearcher = Depends(get_wikipedia_searcher),
+    summarizer: Summarizer = Depends(get_summarizer),
+    prefetcher: SpeculativePrefetcher = Depends(get_prefetcher)
+):
+    """
+    Summarize the selected article like /confirm, streaming NDJSON events so
+    the UI can render progressively: `token` events with summary text as it is
+    generated, then `done` with the same body /confirm returns, or `error`.
+    If the LLM fails part way, `done` has `"degraded": true` and its summary
+    replaces the streamed text.
+    Refinements (non-URL options) still go through /confirm.
+    """
+    request_id = metrics.current_request_id()
+    if not request.user_selected_option.startswith('http'):
+        raise HTTPException(status_code=400, detail="Only a selected article URL can be streamed")
+    if not db.query(models.Query.id).filter(models.Query.id == request.query_id).first():
+        raise HTTPException(status_code=404, detail="Query not found")
+    
+    async def stream_events():
+        queue: asyncio.Queue = asyncio.Queue()
+        
+        async def on_token(text: str):
+            await queue.put({"event": "token", "text": text})
+        
+        async def run():
+            try:
+                # The response outlives the request's dependencies, so use a session of our own
+                with session_factory() as stream_db:
+                    db_query = stream_db.query(models.Query).filter(models.Query.id == request.query_id).first()
+                    result = await summarize_selection(
+                        stream_db,
+                        db_query,
+                        request.user_selected_option,
+                        request.sections,
+                        wikipedia_searcher,
+                        summarizer,
+                        prefetcher,
+                        on_token=on_token
+                    )
+                await queue.put({"event": "done", **result})
+            except Exception as e:
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                logger.error(f"[{request_id}] Error in streaming confirm: {detail}")
+                error = {"event": "error", "detail": detail}
+                if isinstance(e, CircuitOpenError):
+                    error["retry_after"] = max(1, math.ceil(e.retry_after))
+                await queue.put(error)
+            finally:
+                await queue.put(None)
+        
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                yield json.dumps(event) + "\n"
+        finally:
+            # Stop summarizing if the client went away
+            task.cancel()
+    
+    return StreamingResponse(stream_events(), media_type="application/x-ndjson")
+
+@app.get("/api/v1/history")
+async def get_history(
+    request: Request,
+    limit: int = 20,
+    before: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Page through saved queries, newest first. Pass a page's `next_before` as
+    `before` to get the next one. Pages carry an ETag, so unchanged pages are
+    answered with 304 Not Modified.
+    """
+    limit = max(1, min(limit, settings.HISTORY_MAX_PAGE_SIZE))
+    statement = db.query(models.Query).order_by(models.Query.id.desc())
+    if before is not None:
+        statement = statement.filter(models.Query.id < before)
+    rows = statement.limit(limit + 1).all()
+    page, has_more = rows[:limit], len(rows) > limit
+    
+    etag = make_etag(limit, before, has_more, [(row.id, row.version) for row in page])
+    return conditional_response(request, etag, lambda: {
+        "items": [
+            {
+                "id": row.id,
+                "original_query": row.original_query,
+                "extracted_topic": row.extracted_topic,
+                "selected_option": row.selected_option,
+                "created_at": row.created_at,
+                "updated_at": row.updated_at
+            } for row in page
+        ],
+        "next_before": page[-1].id if has_more else None
+    })
+
+def table_validator(db: Session, model, updated_column=None, version_column=None) -> Tuple[Tuple, Optional[datetime]]:
+    """
+    Cheap validator for a whole table: its row count and highest id (rows are
+    only added or updated, never deleted), the sum of the row versions for
+    tables whose rows are updated (every update raises it, even within the
+    same second) and the latest change time, for Last-Modified.
+    """
+    changed_at = model.created_at if updated_column is None else func.coalesce(updated_column, model.created_at)
+    columns = [func.count(model.id), func.max(model.id), func.max(changed_at)]
+    if version_column is not None:
+        columns.append(func.sum(version_column))
+    count, max_id, last_modified, *versions = db.query(*columns).one()
+    return (count, max_id, *versions), last_modified
+
 @app.get("/api/v1/queries")
-async def get_queries(db: Session = Depends(get_db)):
+async def get_queries(request: Request, db: Session = Depends(get_db)):
     """Get all saved queries."""
-    queries = db.query(models.Query).all()
-    return queries
+    validator, last_modified = table_validator(db, models.Query, models.Query.updated_at, models.Query.version)
+    etag = make_etag("queries", validator, last_modified)
+    return conditional_response(request, etag, lambda: db.query(models.Query).all(), last_modified)
 
 @app.get("/api/v1/results")
-async def get_results(db: Session = Depends(get_db)):
+async def get_results(request: Request, db: Session = Depends(get_db)):
     """Get all saved search results."""
-    results = db.query(models.SearchResult).all()
-    return results
+    validator, last_modified = table_validator(db, models.SearchResult)
+    etag = make_etag("results", validator, last_modified)
+    return conditional_response(request, etag, lambda: db.query(models.SearchResult).all(), last_modified)
 
 @app.get("/api/v1/query/{query_id}")
-async def get_query(query_id: int, db: Session = Depends(get_db)):
+async def get_query(query_id: int, request: Request, db: Session = Depends(get_db)):
     """Get a specific query and its results."""
     query = db.query(models.Query).filter(models.Query.id == query_id).first()
     if not query:
         raise HTTPException(status_code=404, detail="Query not found")
     
-    # Get associated results
-    results = db.query(models.SearchResult).filter(models.SearchResult.query_id == query_id).all()
+    # Results are only ever added, so their count and newest id identify them
+    result_count, result_max_id, result_modified = (
+        db.query(func.count(models.SearchResult.id), func.max(models.SearchResult.id), func.max(models.SearchResult.created_at))
+        .filter(models.SearchResult.query_id == query_id)
+        .one()
+    )
+    query_modified = query.updated_at or query.created_at
+    last_modified = max((as_utc(t) for t in (query_modified, result_modified) if t is not None), default=None)
+    etag = make_etag("query", query.id, query.version, result_count, result_max_id)
+    
+    def build_content():
+        results = db.query(models.SearchResult).filter(models.SearchResult.query_id == query_id).all()
+        return {
+            "query": {
+                "id": query.id,
+                "original_query": query.original_query,
+                "extracted_topic": query.extracted_topic,
+                "is_ambiguous": query.is_ambiguous,
+                "confidence": query.confidence,
+                "selected_option": query.selected_option,
+                "created_at": query.created_at,
+                "updated_at": query.updated_at
+            },
+            "results": [
+                {
+                    "id": result.id,
+                    "wikipedia_url": result.wikipedia_url,
+                    "title": result.title,
+                    "summary": result.summary,
+                    "created_at": result.created_at
+                } for result in results
+            ]
+        }
+    
+    return conditional_response(request, etag, build_content, last_modified)
+
+def usage_breakdown(db: Session, filters: List, group_column=None, limit: Optional[int] = None) -> List[Dict]:
+    """LLM calls, tokens and estimated cost matching `filters`, in total or per `group_column`, most expensive first."""
+    total_tokens = func.sum(models.LLMUsage.prompt_tokens + models.LLMUsage.completion_tokens)
+    columns = [
+        func.count(models.LLMUsage.id),
+        func.sum(models.LLMUsage.prompt_tokens),
+        func.sum(models.LLMUsage.completion_tokens),
+        func.sum(models.LLMUsage.cost)
+    ]
+    statement = db.query(*([group_column] if group_column is not None else []), *columns).filter(*filters)
+    if group_column is not None:
+        statement = statement.group_by(group_column).order_by(func.sum(models.LLMUsage.cost).desc(), total_tokens.desc())
+    if limit is not None:
+        statement = statement.limit(limit)
+    
+    breakdown = []
+    for *group, calls, prompt_tokens, completion_tokens, cost in statement.all():
+        entry = {
+            "calls": calls,
+            "prompt_tokens": prompt_tokens or 0,
+            "completion_tokens": completion_tokens or 0,
+            "total_tokens": (prompt_tokens or 0) + (completion_tokens or 0),
+            "cost": round(cost or 0.0, 6)
+        }
+        if group_column is not None:
+            entry = {group_column.key: group[0], **entry}
+        breakdown.append(entry)
+    return breakdown
+
+@app.get("/api/v1/usage")
+async def get_usage(hours: float = 24, topics: int = 20, db: Session = Depends(get_db)):
+    """
+    LLM token usage and estimated cost over the last `hours`: in total, by
+    stage, by model, and for the `topics` most expensive topics.
+    """
+    since = datetime.now(timezone.utc) - timedelta(hours=hours)
+    filters = [models.LLMUsage.created_at >= since]
+    return {
+        "since": since,
+        "total": usage_breakdown(db, filters)[0],
+        "by_stage": usage_breakdown(db, filters, models.LLMUsage.stage),
+        "by_model": usage_breakdown(db, filters, models.LLMUsage.model),
+        "by_topic": usage_breakdown(db, filters, models.LLMUsage.topic, limit=max(1, topics))
+    }
+
+@app.get("/api/v1/query/{query_id}/usage")
+async def get_query_usage(query_id: int, db: Session = Depends(get_db)):
+    """LLM token usage and estimated cost of one query, in total and by stage."""
+    if not db.query(models.Query.id).filter(models.Query.id == query_id).first():
+        raise HTTPException(status_code=404, detail="Query not found")
     
+    filters = [models.LLMUsage.query_id == query_id]
     return {
-        "query": {
-            "id": query.id,
-            "original_query": query.original_query,
-            "extracted_topic": query.extracted_topic,
-            "is_ambiguous": query.is_ambiguous,
-            "confidence": query.confidence,
-            "selected_option": query.selected_option,
-            "created_at": query.created_at,
-            "updated_at": query.updated_at
-        },
-        "results": [
-            {
-                "id": result.id,
-                "wikipedia_url": result.wikipedia_url,
-                "title": result.title,
-                "summary": result.summary,
-                "created_at": result.created_at
-            } for result in results
-        ]
+        "query_id": query_id,
+        "total": usage_breakdown(db, filters)[0],
+        "by_stage": usage_breakdown(db, filters, models.LLMUsage.stage)
     }
 
 @app.get("/api/v1/health")
@@ -373,6 +755,8 @@ async def health_check(db: Session = Depends(get_db)):
                 "database": "connected",
                 "api": "operational"
             },
+            # Dependencies failing fast in this worker show as "open"
+            "circuits": circuit_states(),
             "version": settings.VERSION
         }
     except Exception as e:
@@ -385,38 +769,62 @@ async def health_check(db: Session = Depends(get_db)):
             }
         )
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Expose request, stage, LLM token and cache metrics in Prometheus text format."""
+    return PlainTextResponse(
+        metrics.registry.render(),
+        media_type="text/plain; version=0.0.4"
+    )
+
+@app.get("/api/v1/debug/blocking")
+async def get_blocking_events():
+    """List recent callbacks that blocked the event loop (debug mode only)."""
+    if diagnostics.loop_block_detector is None:
+        raise HTTPException(status_code=404, detail="Event loop block detector is not enabled")
+    return {
+        "threshold_ms": diagnostics.loop_block_detector.threshold * 1000,
+        "events": list(diagnostics.loop_block_detector.events)
+    }
+
 @app.post("/api/v1/summarize", response_model=SummarizeResponse)
 async def summarize_wikipedia(
     request: SummarizeRequest,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    topic_extractor: TopicExtractor = Depends(get_topic_extractor),
+    wikipedia_searcher: WikipediaSearcher = Depends(get_wikipedia_searcher),
+    summarizer: Summarizer = Depends(get_summarizer)
 ):
     """
     Process a query, search Wikipedia, and return a summary in one step.
     If topic extraction fails, falls back to direct Wikipedia search.
     """
-    request_id = str(uuid.uuid4())[:8]
+    request_id = metrics.current_request_id()
     logger.info(f"[{request_id}] Starting summarize request")
     
     try:
         # 1. Try topic extraction first
         logger.info(f"[{request_id}] Starting topic extraction...")
-        topic_extraction = await topic_extractor.extract_topic(request.query)
+        with track_stage("topic_extraction"):
+            topic_extraction = await topic_extractor.extract_topic(request.query)
         extracted_topic = topic_extraction.topic
         logger.info(f"[{request_id}] Topic extracted: {extracted_topic}")
 
         # Store query in database
         logger.info(f"[{request_id}] Storing query in database...")
-        db_query = models.Query(
-            original_query=request.query,
-            extracted_topic=extracted_topic
-        )
-        db.add(db_query)
-        db.commit()
-        db.refresh(db_query)
+        with track_stage("db_write"):
+            db_query = models.Query(
+                original_query=request.query,
+                extracted_topic=extracted_topic
+            )
+            db.add(db_query)
+            db.commit()
+            db.refresh(db_query)
         
         # 2. Search Wikipedia
         logger.info(f"[{request_id}] Searching Wikipedia for topic: {extracted_topic}")
-        search_results = await wikipedia_searcher.search(extracted_topic)
+        with track_stage("search"):
+            search_results = await wikipedia_searcher.search(extracted_topic)
         
         if not search_results:
             raise HTTPException(
@@ -432,39 +840,46 @@ async def summarize_wikipedia(
         
         # Save the selected option
         db_query.selected_option = best_result.url
-        db.commit()
-        
-        # 3. Get content and summarize
-        logger.info(f"[{request_id}] Getting content from: {best_result.url}")
-        content = await wikipedia_searcher.get_full_content(best_result.url)
+        with track_stage("db_write"):
+            db.commit()
         
-        if not content:
+        # 3. Get content and summarize (or reuse the cached summary)
+        logger.info(f"[{request_id}] Summarizing: {best_result.url}")
+        article = await summarize_article(db, best_result.url, request.sections, wikipedia_searcher, summarizer)
+        if article is None:
             raise HTTPException(
                 status_code=404,
                 detail="Could not retrieve article content"
             )
-        
-        # 4. Generate summary
-        logger.info(f"[{request_id}] Generating summary...")
-        summary = await summarizer.summarize(content)
+        _, content, summary = article
         
         # Store the result
-        db_result = models.SearchResult(
-            query_id=db_query.id,
-            wikipedia_url=best_result.url,
-            title=best_result.title,
-            content=content,
-            summary=summary.summary
-        )
-        db.add(db_result)
-        db.commit()
+        with track_stage("db_write"):
+            save_usage(db, db_query.id, extracted_topic)
+            db_result = models.SearchResult(
+                query_id=db_query.id,
+                wikipedia_url=best_result.url,
+                title=best_result.title,
+                content=content,
+                summary=summary.summary
+            )
+            db.add(db_result)
+            db.commit()
         
         return SummarizeResponse(
             query=request.query,
             summary=summary.summary,
             source_url=best_result.url,
+            sections=summary.sections,
+            degraded=summary.degraded
         )
         
+    except TokenBudgetExceeded as e:
+        logger.warning(f"[{request_id}] Rejected over the token budget: {str(e)}")
+        raise HTTPException(status_code=429, detail=str(e))
+    except CircuitOpenError as e:
+        logger.warning(f"[{request_id}] Dependency unavailable: {str(e)}")
+        raise service_unavailable(e)
     except Exception as e:
         logger.error(f"[{request_id}] Error in summarize endpoint: {str(e)}")
         raise HTTPException(
@@ -472,5 +887,69 @@ async def summarize_wikipedia(
             detail=str(e)
         )
 
+@app.post("/api/v1/summarize/batch")
+async def summarize_batch(
+    request: BatchSummarizeRequest,
+    session_factory: sessionmaker = Depends(get_session_factory),
+    topic_extractor: TopicExtractor = Depends(get_topic_extractor),
+    wikipedia_searcher: WikipediaSearcher = Depends(get_wikipedia_searcher),
+    summarizer: Summarizer = Depends(get_summarizer)
+):
+    """
+    Summarize many queries in one request. Duplicate queries, topics and
+    articles are processed once, and results are streamed back as NDJSON, one
+    line per query in completion order (use `index` to match them up).
+    """
+    request_id = metrics.current_request_id()
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="No queries provided")
+    if len(request.queries) > settings.BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A batch can have at most {settings.BATCH_MAX_QUERIES} queries"
+        )
+    
+    logger.info(f"[{request_id}] Starting batch summarize request with {len(request.queries)} queries")
+    batch = BatchSummarizer(
+        topic_extractor,
+        wikipedia_searcher,
+        summarizer,
+        concurrency=settings.BATCH_CONCURRENCY,
+        sections=request.sections,
+        session_factory=session_factory
+    )
+    
+    async def stream_results():
+        # The response outlives the request's dependencies, so use a session of our own
+        with session_factory() as db:
+            async for result in batch.run(request.queries):
+                content = result.pop("content", None)
+                tracker = result.pop("usage", None)
+                if result["status"] != "success":
+                    save_usage(db, None, result.get("topic"), tracker)
+                else:
+                    with track_stage("db_write"):
+                        db_query = models.Query(
+                            original_query=result["query"],
+                            extracted_topic=result["topic"],
+                            selected_option=result["source_url"]
+                        )
+                        db.add(db_query)
+                        db.flush()
+                        db.add(models.SearchResult(
+                            query_id=db_query.id,
+                            wikipedia_url=result["source_url"],
+                            title=result["title"],
+                            content=content,
+                            summary=result["summary"]
+                        ))
+                        db.commit()
+                        save_usage(db, db_query.id, result["topic"], tracker)
+                    result["query_id"] = db_query.id
+                yield json.dumps(result) + "\n"
+        logger.info(f"[{request_id}] Batch summarize request completed")
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
 if __name__ == "__main__":
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
@@ -0,0 +1,97 @@
+"""
+Minimal MediaWiki API server for offline benchmarks.
+
+Implements just the `action=query` calls made by the `wikipedia` package: search,
+page info, extracts and revisions. Every title exists and resolves to a
+deterministic article of `--paragraphs` paragraphs split into sections.
+
+    python -m benchmarks.fake_mediawiki --port 9200 --paragraphs 40
+"""
+import argparse
+import asyncio
+import zlib
+from typing import Dict
+from fastapi import FastAPI, Request
+import uvicorn
+
+WORDS = (
+    "history science culture research theory system network energy language society "
+    "development structure process analysis model community economy technology region period"
+).split()
+
+def _page_id(title: str) -> str:
+    return str(zlib.crc32(title.encode("utf-8")) % 10_000_000)
+
+def _normalize(title: str) -> str:
+    return title.replace("_", " ").strip()
+
+def _paragraph(title: str, index: int) -> str:
+    sentences = []
+    for s in range(6):
+        words = [WORDS[(index * 7 + s * 3 + w) % len(WORDS)] for w in range(14)]
+        sentences.append(f"{title} " + " ".join(words) + ".")
+    return " ".join(sentences)
+
+def article_text(title: str, paragraphs: int, intro_only: bool = False) -> str:
+    """Plain-text extract laid out like a real article: lead, sections, references."""
+    lead = _paragraph(title, 0)
+    if intro_only:
+        return lead
+
+    parts = [lead]
+    for i in range(1, paragraphs):
+        if i % 4 == 1:
+            parts.append(f"\n\n== Section {i // 4 + 1} ==")
+        parts.append(_paragraph(title, i))
+    parts.append("\n\n== References ==")
+    parts.append("\n".join(f"^ Reference {i} for {title}." for i in range(20)))
+    parts.append("\n\n== External links ==")
+    parts.append(f"Official website of {title}")
+    return "\n".join(parts)
+
+def create_app(latency: float, paragraphs: int, revision: int) -> FastAPI:
+    app = FastAPI(title="Fake MediaWiki")
+
+    def page_entry(title: str, params: Dict[str, str]) -> Dict:
+        props = params.get("prop", "").split("|")
+        entry = {"pageid": int(_page_id(title)), "ns": 0, "title": title}
+        if "info" in props:
+            entry["fullurl"] = f"https://en.wikipedia.org/wiki/{title.replace(' ', '_')}"
+        if "extracts" in props:
+            entry["extract"] = article_text(title, paragraphs, intro_only="exintro" in params)
+        if "revisions" in props:
+            size = len(article_text(title, paragraphs))
+            entry["revisions"] = [{"revid": revision, "parentid": revision - 1, "size": size}]
+        return entry
+
+    @app.get("/w/api.php")
+    async def api(request: Request):
+        params = dict(request.query_params)
+        await asyncio.sleep(latency)
+
+        if params.get("list") == "search":
+            query = params.get("srsearch", "")
+            limit = int(params.get("srlimit", 10))
+            titles = [query] + [f"{query} ({i})" for i in range(1, limit)]
+            return {"query": {"search": [{"ns": 0, "title": title} for title in titles[:limit]]}}
+
+        titles = [_normalize(title) for title in params.get("titles", "").split("|") if title]
+        pages = {_page_id(title): page_entry(title, params) for title in titles}
+        return {"batchcomplete": "", "query": {"pages": pages}}
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--latency", type=float, default=0.05, help="Latency per API call in seconds")
+    parser.add_argument("--paragraphs", type=int, default=40, help="Paragraphs per article")
+    parser.add_argument("--revision", type=int, default=1000, help="Revision id reported for every page")
+    args = parser.parse_args()
+
+    app = create_app(args.latency, args.paragraphs, args.revision)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
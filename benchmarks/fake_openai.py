@@ -0,0 +1,111 @@
+"""
+Minimal OpenAI-compatible chat completions server for offline benchmarks.
+
+Responses are deterministic. Latency is `--latency` seconds plus the time it takes
+to "generate" the completion at `--token-rate` tokens per second.
+
+    python -m benchmarks.fake_openai --port 9100 --latency 0.2 --token-rate 200
+"""
+import argparse
+import asyncio
+import json
+import time
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import uvicorn
+
+def _prompt_text(messages) -> str:
+    return "\n".join(str(message.get("content", "")) for message in messages)
+
+def _completion_text(messages, completion_tokens: int) -> str:
+    """Pick a response shaped like what each agent's prompt expects."""
+    prompt = _prompt_text(messages)
+    user_message = str(messages[-1].get("content", "")) if messages else ""
+
+    if "topic extraction expert" in prompt:
+        return json.dumps({"topic": user_message.strip()})
+    if "Wikipedia search expert" in prompt:
+        topic = user_message.replace("Topic:", "").strip()
+        return json.dumps({
+            "title": topic,
+            "summary": f"{topic} is a benchmark article.",
+            "url": f"https://en.wikipedia.org/wiki/{topic.replace(' ', '_')}"
+        })
+    # Everything else is a summarization prompt
+    return " ".join(f"summary{i % 50}" for i in range(completion_tokens))
+
+def create_app(latency: float, token_rate: float, completion_tokens: int) -> FastAPI:
+    app = FastAPI(title="Fake OpenAI")
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        content = _completion_text(messages, completion_tokens)
+        prompt_tokens = len(_prompt_text(messages)) // 4
+        output_tokens = len(content.split())
+        model = body.get("model", "fake-model")
+
+        await asyncio.sleep(latency)
+
+        if body.get("stream"):
+            async def stream():
+                for i, word in enumerate(content.split(" ")):
+                    await asyncio.sleep(1 / token_rate)
+                    delta = {"content": word if i == 0 else " " + word}
+                    if i == 0:
+                        delta["role"] = "assistant"
+                    chunk = {
+                        "id": "chatcmpl-fake",
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": None}]
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                final = {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+                }
+                yield f"data: {json.dumps(final)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(stream(), media_type="text/event-stream")
+
+        await asyncio.sleep(output_tokens / token_rate)
+        return JSONResponse({
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": output_tokens,
+                "total_tokens": prompt_tokens + output_tokens
+            }
+        })
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.2, help="Base latency per call in seconds")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="Completion tokens per second")
+    parser.add_argument("--completion-tokens", type=int, default=80, help="Words per summary completion")
+    args = parser.parse_args()
+
+    app = create_app(args.latency, args.token_rate, args.completion_tokens)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""
+Load and latency benchmark for the API.
+
+Starts the app against local fake OpenAI and MediaWiki servers, so it runs
+offline and results are reproducible. Each scenario is driven at every
+concurrency level and reports throughput, p50/p95/p99 latency and the
+server's event loop lag (scraped from /metrics). Each run starts with a few
+untimed warm-up requests (--warmup), so lazy imports, agent construction
+and connection setup aren't billed to the first measured requests.
+
+Absolute numbers depend on the machine, so every run also calibrates: at
+each concurrency level it streams completions straight from the fake OpenAI
+server, which costs the same simulated latency and HTTP/JSON work on any
+machine but none of the app's own. Results store p95 and throughput as
+ratios to that calibration run as well as in seconds, and --compare checks
+the ratios, so a baseline recorded on one machine holds on another; the
+absolute figures are only compared against baselines without calibration.
+
+    python -m benchmarks.run
+    python -m benchmarks.run --concurrency 1,8,32 --requests 64
+    python -m benchmarks.run --save-baseline benchmarks/baselines/default.json
+    python -m benchmarks.run --compare benchmarks/baselines/default.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+import httpx
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("process", "confirm", "summarize")
+_query_counter = itertools.count()
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _start(args: List[str], env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable] + args,
+        cwd=ROOT_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+def _wait_until_ready(url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not become ready")
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+def _parse_loop_lag(metrics_text: str) -> Dict[str, float]:
+    """Read the event_loop_lag_seconds histogram into {le: cumulative count}."""
+    buckets = {}
+    for line in metrics_text.splitlines():
+        if line.startswith("event_loop_lag_seconds_bucket"):
+            le = line.split('le="')[1].split('"')[0]
+            buckets[le] = float(line.rsplit(" ", 1)[1])
+    return buckets
+
+def _loop_lag_quantile(before: Dict[str, float], after: Dict[str, float], q: float) -> float:
+    """Estimate a quantile of loop lag observed between two scrapes (bucket upper bound)."""
+    deltas = [(le, after.get(le, 0) - before.get(le, 0)) for le in after]
+    total = dict(deltas).get("+Inf", 0)
+    if total <= 0:
+        return 0.0
+    for le, count in sorted(deltas, key=lambda item: float(item[0])):
+        if count >= q * total:
+            return float(le)
+    return float("inf")
+
+async def _timed_request(client: httpx.AsyncClient, scenario: str) -> Tuple[httpx.Response, float]:
+    """Send one request for `scenario`, returning the response and its latency."""
+    query = f"Benchmark topic {next(_query_counter)}"
+
+    if scenario == "confirm":
+        # Create the query untimed, then time only the confirmation
+        process = (await client.post("/api/v1/process", json={"query": query})).json()
+        started = time.perf_counter()
+        response = await client.post("/api/v1/confirm", json={
+            "query_id": process["query_id"],
+            "user_selected_option": process["search_results"][0]["url"]
+        })
+        return response, time.perf_counter() - started
+
+    started = time.perf_counter()
+    response = await client.post(f"/api/v1/{scenario}", json={"query": query})
+    return response, time.perf_counter() - started
+
+async def warm_up(client: httpx.AsyncClient, scenario: str, concurrency: int, total: int) -> None:
+    """Send `total` untimed requests for `scenario`; their results are discarded."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            try:
+                await _timed_request(client, scenario)
+            except (httpx.HTTPError, KeyError):
+                pass
+
+    await asyncio.gather(*[one() for _ in range(total)])
+
+async def calibrate(openai_url: str, concurrency: int, total: int, warmup: int = 0) -> Dict:
+    """Time `total` streamed completions straight from the fake OpenAI server."""
+    latencies: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+    request = {"model": "calibration", "stream": True, "messages": [{"role": "user", "content": "Summarize this."}]}
+
+    async with httpx.AsyncClient(base_url=openai_url, timeout=300.0) as client:
+        async def one(timed: bool):
+            async with semaphore:
+                started = time.perf_counter()
+                async with client.stream("POST", "/v1/chat/completions", json=request) as response:
+                    async for line in response.aiter_lines():
+                        if line.startswith("data: ") and line != "data: [DONE]":
+                            json.loads(line[len("data: "):])
+                if timed:
+                    latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*[one(False) for _ in range(warmup)])
+        wall_start = time.perf_counter()
+        await asyncio.gather(*[one(True) for _ in range(total)])
+        wall = time.perf_counter() - wall_start
+
+    return {"concurrency": concurrency, "throughput": total / wall, "p95": percentile(latencies, 95)}
+
+def add_ratios(result: Dict, calibration: Dict) -> Dict:
+    """Express p95 and throughput relative to the calibration run at the same concurrency."""
+    result["p95_ratio"] = result["p95"] / calibration["p95"]
+    result["throughput_ratio"] = result["throughput"] / calibration["throughput"]
+    return result
+
+async def run_scenario(base_url: str, scenario: str, concurrency: int, total: int, warmup: int = 0) -> Dict:
+    latencies: List[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=300.0) as client:
+        await warm_up(client, scenario, concurrency, warmup)
+        lag_before = _parse_loop_lag((await client.get("/metrics")).text)
+
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                try:
+                    response, latency = await _timed_request(client, scenario)
+                except (httpx.HTTPError, KeyError):
+                    errors += 1
+                    return
+                if response.status_code != 200:
+                    errors += 1
+                latencies.append(latency)
+
+        wall_start = time.perf_counter()
+        await asyncio.gather(*[one() for _ in range(total)])
+        wall = time.perf_counter() - wall_start
+
+        lag_after = _parse_loop_lag((await client.get("/metrics")).text)
+
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "throughput": total / wall,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "loop_lag_p99": _loop_lag_quantile(lag_before, lag_after, 0.99)
+    }
+
+def compare(results: List[Dict], baseline: Dict, tolerance: float) -> List[str]:
+    """
+    Return a description of every result that regressed beyond `tolerance`.
+    Calibrated results are compared by their ratios, older baselines by
+    their absolute figures.
+    """
+    regressions = []
+    previous = {(r["scenario"], r["concurrency"]): r for r in baseline["results"]}
+    for result in results:
+        old = previous.get((result["scenario"], result["concurrency"]))
+        if old is None:
+            continue
+        name = f"{result['scenario']}@{result['concurrency']}"
+        if "p95_ratio" in old and "p95_ratio" in result:
+            p95, throughput, p95_unit, throughput_unit = "p95_ratio", "throughput_ratio", "x", "x"
+        else:
+            p95, throughput, p95_unit, throughput_unit = "p95", "throughput", "s", " req/s"
+        if result[p95] > old[p95] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {old[p95]:.3f}{p95_unit} -> {result[p95]:.3f}{p95_unit}")
+        if result[throughput] < old[throughput] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {old[throughput]:.2f}{throughput_unit} -> {result[throughput]:.2f}{throughput_unit}"
+            )
+        if result["errors"] > old["errors"]:
+            regressions.append(f"{name}: errors {old['errors']} -> {result['errors']}")
+    return regressions
+
+def _print_table(results: List[Dict]) -> None:
+    print(
+        f"{'scenario':<10} {'conc':>5} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'lag p99':>8} {'errors':>6}"
+        f" {'req/s x':>8} {'p95 x':>8}"
+    )
+    for r in results:
+        print(
+            f"{r['scenario']:<10} {r['concurrency']:>5} {r['throughput']:>8.2f} {r['p50']:>8.3f} "
+            f"{r['p95']:>8.3f} {r['p99']:>8.3f} {r['loop_lag_p99']:>8.3f} {r['errors']:>6}"
+            f" {r['throughput_ratio']:>8.3f} {r['p95_ratio']:>8.3f}"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=32, help="Requests per scenario and concurrency level")
+    parser.add_argument("--warmup", type=int, default=8, help="Untimed requests before each scenario and concurrency level")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--llm-token-rate", type=float, default=200.0)
+    parser.add_argument("--llm-completion-tokens", type=int, default=80)
+    parser.add_argument("--wiki-latency", type=float, default=0.05)
+    parser.add_argument("--article-paragraphs", type=int, default=40)
+    parser.add_argument("--app-env", action="append", default=[], help="Extra KEY=VALUE settings for the app")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--save-baseline", help="Save results as a baseline JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    config = {
+        "llm_latency": args.llm_latency,
+        "llm_token_rate": args.llm_token_rate,
+        "llm_completion_tokens": args.llm_completion_tokens,
+        "wiki_latency": args.wiki_latency,
+        "article_paragraphs": args.article_paragraphs,
+        "requests": args.requests,
+        "warmup": args.warmup
+    }
+    openai_port, wiki_port, app_port = _free_port(), _free_port(), _free_port()
+    processes = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        try:
+            processes.append(_start([
+                "-m", "benchmarks.fake_openai", "--port", str(openai_port),
+                "--latency", str(args.llm_latency), "--token-rate", str(args.llm_token_rate),
+                "--completion-tokens", str(args.llm_completion_tokens)
+            ]))
+            processes.append(_start([
+                "-m", "benchmarks.fake_mediawiki", "--port", str(wiki_port),
+                "--latency", str(args.wiki_latency), "--paragraphs", str(args.article_paragraphs)
+            ]))
+
+            env = dict(os.environ)
+            env.update({
+                "OPENAI_API_KEY": "benchmark",
+                "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+                "WIKIPEDIA_API_URL": f"http://127.0.0.1:{wiki_port}/w/api.php",
+                "DATABASE_URL": f"sqlite:///{os.path.join(tmp_dir, 'benchmark.db')}",
+                "EVENT_LOOP_LAG_INTERVAL": "0.05"
+            })
+            env.update(dict(item.split("=", 1) for item in args.app_env))
+            processes.append(_start([
+                "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(app_port)
+            ], env=env))
+
+            base_url = f"http://127.0.0.1:{app_port}"
+            _wait_until_ready(f"http://127.0.0.1:{openai_port}/docs")
+            _wait_until_ready(f"http://127.0.0.1:{wiki_port}/docs")
+            _wait_until_ready(f"{base_url}/api/v1/health")
+
+            concurrency_levels = [int(c) for c in args.concurrency.split(",")]
+            calibration = {
+                concurrency: asyncio.run(calibrate(
+                    f"http://127.0.0.1:{openai_port}", concurrency, args.requests, args.warmup
+                ))
+                for concurrency in concurrency_levels
+            }
+            results = []
+            for scenario in args.scenarios.split(","):
+                for concurrency in concurrency_levels:
+                    result = asyncio.run(run_scenario(base_url, scenario, concurrency, args.requests, args.warmup))
+                    results.append(add_ratios(result, calibration[concurrency]))
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.wait()
+
+    _print_table(results)
+    report = {"config": config, "calibration": list(calibration.values()), "results": results}
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print("Warning: baseline was recorded with a different configuration")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regressions against baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Gunicorn settings for the production server profile.
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+Worker count defaults to 2 x CPUs + 1, capped by MAX_WORKERS; set
+WEB_CONCURRENCY to override it.
+"""
+import multiprocessing
+import os
+
+# Workers must share caches, budgets and locks, which the in-process store can't do
+os.environ.setdefault("SHARED_STATE_BACKEND", "database")
+# The schema is set up once in the master (on_starting), not by every worker
+os.environ.setdefault("DB_INIT_ON_STARTUP", "false")
+# ...and kept across deploys: the article cache, usage records and shared state are data
+os.environ.setdefault("DB_RESET_ON_STARTUP", "false")
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+worker_class = "uvicorn_worker.UvicornWorker"
+
+# The pipeline is mostly waiting on OpenAI and Wikipedia, so oversubscribe the CPUs
+workers = int(os.getenv(
+    "WEB_CONCURRENCY",
+    min(multiprocessing.cpu_count() * 2 + 1, int(os.getenv("MAX_WORKERS", "8")))
+))
+
+# Summarizing long articles can take well over the default 30s
+timeout = int(os.getenv("WORKER_TIMEOUT", "180"))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers periodically to bound memory growth
+max_requests = 1000
+max_requests_jitter = 100
+
+# Import the app once in the master so startup work runs once and workers share memory
+preload_app = True
+
+accesslog = "-"
+
+def on_starting(server):
+    from app.core.config import settings
+    from app.db.database import init_db
+    init_db(reset=settings.DB_RESET_ON_STARTUP)
+
+def post_fork(server, worker):
+    # Pooled connections opened in the master must not be shared by forked workers
+    from app.db.database import engine
+    engine.dispose(close=False)
@@ -3,8 +3,9 @@ from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from app.main import app
-from app.db.database import Base, get_db
+from app.db.database import Base, get_db, get_session_factory
 from app.core.config import settings
+from app.core.shared_state import DatabaseStateStore, LocalStateStore
 
 # Create an in-memory SQLite database for testing
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -35,9 +36,19 @@ def client(db):
             db.close()
     
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_session_factory] = lambda: TestingSessionLocal
     
     with TestClient(app) as test_client:
         yield test_client
     
     # Clear the dependency override
-    app.dependency_overrides.clear() 
\ No newline at end of file
+    app.dependency_overrides.clear()
+
+@pytest.fixture(params=["local", "database"])
+def state_store(request, tmp_path):
+    """Each shared state backend, the database one on its own SQLite file."""
+    if request.param == "local":
+        return LocalStateStore()
+    state_engine = create_engine(f"sqlite:///{tmp_path / 'state.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=state_engine)
+    return DatabaseStateStore(sessionmaker(bind=state_engine))
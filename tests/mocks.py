@@ -1,7 +1,12 @@
+import asyncio
+import re
+from typing import Dict, List
 from unittest.mock import AsyncMock, MagicMock
 from langchain.chat_models import ChatOpenAI
 from langchain.schema import AIMessage
 from app.core.config import settings
+from app.agents.summarizer import Summary
+from app.agents.wikipedia_search import WikipediaArticle, WikipediaSearchResult
 
 class MockChatOpenAI(ChatOpenAI):
     """Mock ChatOpenAI for testing."""
@@ -18,4 +23,58 @@ def get_mock_llm():
         model=settings.OPENAI_MODEL,
         temperature=0,
         api_key=settings.OPENAI_API_KEY
-    ) 
\ No newline at end of file
+    )
+
+class FakeSearcher:
+    """
+    Stand-in for WikipediaSearcher. Every topic except "Missing" has an
+    article titled after it, with content "Content of <title>" at the
+    revision set in `revisions` (1 by default).
+    """
+    def __init__(self):
+        # title -> {"revision_id": ..., "size": ...}
+        self.revisions: Dict[str, Dict[str, int]] = {}
+        self.searches = 0
+        self.fetches = 0
+        self.revision_requests: List[List[str]] = []
+
+    async def search(self, topic):
+        self.searches += 1
+        if topic == "Missing":
+            return None
+        return WikipediaSearchResult(title=topic, summary="", url=f"https://en.wikipedia.org/wiki/{topic}")
+
+    async def get_article(self, url):
+        self.fetches += 1
+        title = url.split("/")[-1]
+        return WikipediaArticle(
+            title=title,
+            url=url,
+            content=f"Content of {title}",
+            revision_id=self.revisions.get(title, {}).get("revision_id", 1)
+        )
+
+    async def get_full_content(self, url):
+        return (await self.get_article(url)).content
+
+    async def get_revisions(self, titles):
+        self.revision_requests.append(list(titles))
+        return {title: self.revisions[title] for title in titles if title in self.revisions}
+
+class FakeSummarizer:
+    """Stand-in for Summarizer: the summary is "Summary: <content>", streamed word by word."""
+    def __init__(self):
+        self.summarized: List[str] = []
+
+    @property
+    def calls(self) -> int:
+        return len(self.summarized)
+
+    async def summarize(self, content, sections=None, on_token=None):
+        self.summarized.append(content)
+        await asyncio.sleep(0.01)
+        summary = f"Summary: {content}"
+        if on_token:
+            for token in re.findall(r"\S+\s*", summary):
+                await on_token(token)
+        return Summary(summary=summary)
@@ -1,6 +1,11 @@
+import json
 import pytest
 from fastapi.testclient import TestClient
+from app.main import app
 from app.core.config import settings
+from app.core.dependencies import get_wikipedia_searcher, get_summarizer, get_prefetcher
+from app.db import models
+from tests.mocks import FakeSearcher, FakeSummarizer
 
 @pytest.mark.asyncio
 async def test_home_page(client: TestClient):
@@ -104,4 +109,141 @@ async def test_get_query_by_id(client: TestClient):
     assert "results" in data
     assert data["query"]["id"] == query_id
     assert "original_query" in data["query"]
-    assert "extracted_topic" in data["query"] 
\ No newline at end of file
+    assert "extracted_topic" in data["query"]
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(client: TestClient):
+    """Test the Prometheus metrics endpoint and Server-Timing header."""
+    health_response = client.get("/api/v1/health")
+    assert "total;dur=" in health_response.headers["server-timing"]
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert "text/plain" in response.headers["content-type"]
+    assert 'http_request_duration_seconds_count{method="GET",path="/api/v1/health",status="200"}' in response.text
+    assert "# TYPE pipeline_stage_duration_seconds histogram" in response.text
+
+@pytest.mark.asyncio
+async def test_history_pages_with_etag(client: TestClient, db):
+    """Test that history is paginated and unchanged pages return 304."""
+    for i in range(5):
+        db.add(models.Query(original_query=f"query {i}", extracted_topic=f"topic {i}"))
+    db.commit()
+
+    first = client.get("/api/v1/history?limit=2")
+    assert first.status_code == 200
+    page = first.json()
+    assert [item["original_query"] for item in page["items"]] == ["query 4", "query 3"]
+    assert page["next_before"] is not None
+
+    second = client.get(f"/api/v1/history?limit=2&before={page['next_before']}")
+    assert [item["original_query"] for item in second.json()["items"]] == ["query 2", "query 1"]
+
+    cached = client.get("/api/v1/history?limit=2", headers={"If-None-Match": first.headers["etag"]})
+    assert cached.status_code == 304
+
+    db.add(models.Query(original_query="query 5", extracted_topic="topic 5"))
+    db.commit()
+    changed = client.get("/api/v1/history?limit=2", headers={"If-None-Match": first.headers["etag"]})
+    assert changed.status_code == 200
+
+@pytest.mark.asyncio
+async def test_read_endpoints_revalidate_and_compress(client: TestClient, db):
+    """Test that /queries and /results answer 304 while unchanged and compress large bodies."""
+    for i in range(30):
+        db.add(models.Query(original_query=f"saved query {i}", extracted_topic=f"saved topic {i}"))
+    db.add(models.SearchResult(query_id=1, title="Python", wikipedia_url="https://en.wikipedia.org/wiki/Python"))
+    db.commit()
+
+    queries = client.get("/api/v1/queries", headers={"Accept-Encoding": "gzip"})
+    assert queries.status_code == 200
+    assert queries.headers["content-encoding"] == "gzip"
+    assert len(queries.json()) == 30
+    assert queries.headers["cache-control"] == "private, no-cache"
+    assert client.get("/api/v1/queries", headers={"If-None-Match": queries.headers["etag"]}).status_code == 304
+    assert client.get(
+        "/api/v1/queries", headers={"If-Modified-Since": queries.headers["last-modified"]}
+    ).status_code == 304
+
+    results = client.get("/api/v1/results")
+    assert "content-encoding" not in results.headers  # Too small to be worth compressing
+    assert client.get("/api/v1/results", headers={"If-None-Match": results.headers["etag"]}).status_code == 304
+
+    db.add(models.SearchResult(query_id=2, title="Java", wikipedia_url="https://en.wikipedia.org/wiki/Java"))
+    db.commit()
+    changed = client.get("/api/v1/results", headers={"If-None-Match": results.headers["etag"]})
+    assert changed.status_code == 200
+    assert len(changed.json()) == 2
+
+@pytest.mark.asyncio
+async def test_query_details_revalidate(client: TestClient, db):
+    """Test that query details change their ETag when the query gets a result."""
+    db_query = models.Query(original_query="Tell me about Rust", extracted_topic="Rust")
+    db.add(db_query)
+    db.commit()
+
+    first = client.get(f"/api/v1/query/{db_query.id}")
+    assert first.json()["results"] == []
+    assert "last-modified" in first.headers
+    assert client.get(f"/api/v1/query/{db_query.id}", headers={"If-None-Match": first.headers["etag"]}).status_code == 304
+
+    db.add(models.SearchResult(query_id=db_query.id, title="Rust", summary="A language."))
+    db.commit()
+    second = client.get(f"/api/v1/query/{db_query.id}", headers={"If-None-Match": first.headers["etag"]})
+    assert second.status_code == 200
+    assert second.json()["results"][0]["summary"] == "A language."
+
+@pytest.mark.asyncio
+async def test_updates_within_a_second_revalidate(client: TestClient, db):
+    """Test that every update changes the ETags, even when updated_at can't tell them apart."""
+    db_query = models.Query(original_query="Tell me about Mercury", extracted_topic="Mercury", is_ambiguous=True)
+    db.add(db_query)
+    db.commit()
+    query_id = db_query.id
+
+    for option in ["Mercury (planet)", "Mercury (element)"]:
+        listing = client.get("/api/v1/queries")
+        details = client.get(f"/api/v1/query/{query_id}")
+        db.get(models.Query, query_id).selected_option = option
+        db.commit()
+
+        changed = client.get("/api/v1/queries", headers={"If-None-Match": listing.headers["etag"]})
+        assert changed.status_code == 200
+        assert changed.json()[0]["selected_option"] == option
+        changed = client.get(f"/api/v1/query/{query_id}", headers={"If-None-Match": details.headers["etag"]})
+        assert changed.status_code == 200
+        assert changed.json()["query"]["selected_option"] == option
+
+class FakePrefetcher:
+    async def claim(self, query_id, url):
+        return None
+
+    async def cancel(self, query_id):
+        pass
+
+@pytest.mark.asyncio
+async def test_confirm_stream(client: TestClient, db):
+    """Test that the streaming confirm endpoint sends tokens and then the final result."""
+    db_query = models.Query(original_query="python", extracted_topic="Python")
+    db.add(db_query)
+    db.commit()
+    overrides = {
+        get_wikipedia_searcher: FakeSearcher,
+        get_summarizer: FakeSummarizer,
+        get_prefetcher: FakePrefetcher
+    }
+    app.dependency_overrides.update(overrides)
+    try:
+        response = client.post("/api/v1/confirm/stream", json={
+            "query_id": db_query.id,
+            "user_selected_option": "https://en.wikipedia.org/wiki/Python"
+        })
+    finally:
+        for dependency in overrides:
+            app.dependency_overrides.pop(dependency)
+
+    assert response.status_code == 200
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert "".join(e["text"] for e in events if e["event"] == "token") == "Summary: Content of Python"
+    assert events[-1]["event"] == "done"
+    assert events[-1]["summary"] == "Summary: Content of Python"
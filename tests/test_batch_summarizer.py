@@ -0,0 +1,58 @@
+import asyncio
+import json
+import pytest
+from app.main import app
+from app.core.dependencies import get_topic_extractor, get_wikipedia_searcher, get_summarizer
+from app.agents.batch_summarizer import BatchSummarizer
+from app.agents.topic_extractor import TopicExtraction
+from app.db import models
+from tests.conftest import TestingSessionLocal
+from tests.mocks import FakeSearcher, FakeSummarizer
+
+class FakeTopicExtractor:
+    def __init__(self):
+        self.calls = 0
+
+    async def extract_topic(self, query):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        # "python language" and "Python programming" both map to one topic
+        return TopicExtraction(topic=query.split()[0].capitalize())
+
+@pytest.mark.asyncio
+async def test_batch_deduplicates_queries_topics_and_articles(db):
+    """Test that shared work in a batch is done only once."""
+    extractor, searcher, summarizer = FakeTopicExtractor(), FakeSearcher(), FakeSummarizer()
+    batch = BatchSummarizer(extractor, searcher, summarizer, concurrency=2, session_factory=TestingSessionLocal)
+    queries = ["python language", "Python language", "python programming", "rust", "missing"]
+
+    results = [result async for result in batch.run(queries)]
+
+    assert sorted(result["index"] for result in results) == list(range(len(queries)))
+    assert extractor.calls == 4
+    assert searcher.searches == 3
+    assert searcher.fetches == 2
+    assert summarizer.calls == 2
+    by_index = {result["index"]: result for result in results}
+    assert by_index[0]["summary"] == by_index[2]["summary"]
+    assert by_index[4]["status"] == "error"
+
+def test_batch_endpoint_streams_ndjson(client, db):
+    """Test that the batch endpoint streams one JSON line per query and stores them in the request's database."""
+    app.dependency_overrides[get_topic_extractor] = FakeTopicExtractor
+    app.dependency_overrides[get_wikipedia_searcher] = FakeSearcher
+    app.dependency_overrides[get_summarizer] = FakeSummarizer
+    try:
+        response = client.post("/api/v1/summarize/batch", json={"queries": ["python", "rust"]})
+    finally:
+        for dependency in (get_topic_extractor, get_wikipedia_searcher, get_summarizer):
+            app.dependency_overrides.pop(dependency)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert {line["query"] for line in lines} == {"python", "rust"}
+    assert all(line["status"] == "success" and line["query_id"] for line in lines)
+    assert all("content" not in line for line in lines)
+    stored = db.query(models.Query).filter(models.Query.id.in_([line["query_id"] for line in lines])).all()
+    assert {query.original_query for query in stored} == {"python", "rust"}
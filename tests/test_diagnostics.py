@@ -0,0 +1,42 @@
+import asyncio
+import time
+import pytest
+from app.core import metrics
+from app.core.diagnostics import LoopBlockDetector, SamplingProfiler
+
+def blocking_handler():
+    time.sleep(0.2)
+
+@pytest.mark.asyncio
+async def test_loop_block_detector_reports_stack_and_request_id():
+    """Test that a blocking call is flagged with its stack and request id."""
+    detector = LoopBlockDetector(threshold=0.05)
+    detector.install()
+    try:
+        async def request():
+            metrics.start_request("req12345")
+            blocking_handler()
+
+        await asyncio.create_task(request())
+        await asyncio.sleep(0)
+    finally:
+        detector.uninstall()
+
+    assert len(detector.events) == 1
+    event = detector.events[0]
+    assert event["request_id"] == "req12345"
+    assert event["duration_ms"] >= 200
+    assert "blocking_handler" in event["stack"]
+
+@pytest.mark.asyncio
+async def test_sampling_profiler_writes_folded_stacks(tmp_path):
+    """Test that profiling a request writes flamegraph-compatible collapsed stacks."""
+    profiler = SamplingProfiler(interval=0.005, output_dir=str(tmp_path))
+    with profiler.profile("summarize-test"):
+        blocking_handler()
+
+    lines = (tmp_path / "summarize-test.folded").read_text().splitlines()
+    assert lines
+    stack, count = lines[0].rsplit(" ", 1)
+    assert "test_diagnostics:blocking_handler" in stack
+    assert int(count) > 0
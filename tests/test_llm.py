@@ -0,0 +1,120 @@
+import asyncio
+from typing import Any, List, Optional
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from app.main import app
+from app.core import llm, usage
+from app.core.config import settings
+from app.core.llm_callbacks import llm_usage_callback
+from app.core.shared_state import LocalStateStore
+from app.core.extractive import extractive_summary
+from app.agents.topic_extractor import TopicExtractor
+from app.agents.summarizer import Summarizer
+
+@pytest.fixture
+def local_backend(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_BACKEND", "local")
+    monkeypatch.setattr(llm, "_gateway", None)
+
+class SlowThenFastModel(BaseChatModel):
+    """Answers the first call after `first_delay` and later calls immediately."""
+
+    first_delay: float
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "slow-then-fast"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any):
+        raise NotImplementedError
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any):
+        self.calls += 1
+        call = self.calls
+        if call == 1:
+            await asyncio.sleep(self.first_delay)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=f"call {call}"))])
+
+def test_extractive_summary_is_deterministic():
+    """Test that the extractive summary keeps whole sentences within the word limit."""
+    text = (
+        "== History ==\n"
+        "Python is a programming language. Python was created by Guido van Rossum. "
+        "The weather was nice that day. Python emphasizes code readability."
+    )
+    summary = extractive_summary(text, max_words=12)
+
+    assert summary == extractive_summary(text, max_words=12)
+    assert len(summary.split()) <= 12
+    assert "History" not in summary
+    assert summary.startswith("Python is a programming language.")
+
+@pytest.mark.asyncio
+async def test_local_backend_runs_pipeline_offline(local_backend):
+    """Test that topic extraction and summarization work with the local backend."""
+    topic = await TopicExtractor().extract_topic("What is the theory of relativity?")
+    assert topic.topic == "Theory of relativity"
+
+    content = "\n\n".join(f"Relativity is a theory number {i}. It describes gravity." for i in range(50))
+    summary = await Summarizer().summarize(content)
+    assert summary.summary
+    assert len(summary.summary.split()) <= 300
+
+def test_gateway_uses_per_stage_models(monkeypatch):
+    """Test that stages fall back to OPENAI_MODEL unless they have their own model."""
+    monkeypatch.setattr(settings, "LLM_MODEL_TOPIC", "cheap-model")
+    gateway = llm.LLMGateway()
+
+    assert gateway.model_name("topic") == "cheap-model"
+    assert gateway.model_name("combine") == settings.OPENAI_MODEL
+
+def test_shutdown_closes_llm_connections(monkeypatch):
+    """Test that the app's shutdown closes the gateway's pooled HTTP clients."""
+    monkeypatch.setattr(settings, "LLM_BACKEND", "openai")
+    monkeypatch.setattr(llm, "_gateway", None)
+
+    with TestClient(app):
+        gateway = llm.get_llm_gateway()
+        gateway.chat_model("topic")
+
+    assert gateway._http_client.is_closed
+    assert gateway._http_async_client.is_closed
+    assert llm._gateway is None
+
+@pytest.mark.asyncio
+async def test_hedged_call_returns_first_to_finish():
+    """Test that a slow call is hedged and the faster duplicate wins."""
+    inner = SlowThenFastModel(first_delay=1.0)
+    model = llm.HedgedChatModel(model=inner, stage="topic", min_delay=0.01, min_samples=1)
+    model._latencies.append(0.01)
+
+    result = await model.ainvoke([HumanMessage(content="hi")])
+
+    assert result.content == "call 2"
+    assert inner.calls == 2
+
+@pytest.mark.asyncio
+async def test_hedged_attempts_are_both_charged(monkeypatch):
+    """Test that a hedge is reserved against the budgets and the losing attempt is recorded too."""
+    state = LocalStateStore()
+    monkeypatch.setattr(usage, "get_shared_state", lambda: state)
+    monkeypatch.setattr(usage, "_minute_key", lambda: "llm:tokens:test")
+    monkeypatch.setattr(settings, "LLM_TOKEN_BUDGET_PER_MINUTE", 10 ** 6)
+    inner = SlowThenFastModel(first_delay=1.0)
+    model = llm.HedgedChatModel(
+        model=inner, stage="topic", min_delay=0.01, min_samples=1, callbacks=[llm_usage_callback]
+    )
+    model._latencies.append(0.01)
+    tracker = usage.start_tracking()
+
+    await model.ainvoke([HumanMessage(content="What is the theory of relativity?")])
+
+    assert inner.calls == 2
+    assert len(tracker.calls) == 2
+    assert all(call.prompt_tokens > 0 for call in tracker.calls)
+    assert tracker.reserved == 0
+    assert await state.get("llm:tokens:test") == tracker.total_tokens
@@ -0,0 +1,110 @@
+import asyncio
+import pytest
+from app.core.config import settings
+from app.agents.prefetcher import SpeculativePrefetcher
+from app.agents.summarizer import Summary
+from app.core.shared_state import LocalStateStore
+from app.db import models
+from app.agents.article_cache import utcnow
+from tests.conftest import TestingSessionLocal
+from tests.mocks import FakeSearcher, FakeSummarizer
+
+@pytest.fixture
+def prefetcher(db, monkeypatch):
+    monkeypatch.setattr(settings, "SPECULATIVE_PREFETCH_ENABLED", True)
+    return SpeculativePrefetcher(FakeSearcher(), FakeSummarizer(), LocalStateStore(), TestingSessionLocal)
+
+@pytest.mark.asyncio
+async def test_claim_returns_prefetched_summary(prefetcher):
+    """Test that picking the prefetched candidate reuses its summary."""
+    url = "https://en.wikipedia.org/wiki/Artificial_intelligence"
+    assert await prefetcher.schedule(1, url, "Artificial intelligence")
+
+    prefetched = await prefetcher.claim(1, url)
+    assert prefetched is not None
+    assert prefetched.title == "Artificial intelligence"
+    assert prefetched.summary == "Summary: Content of Artificial_intelligence"
+
+@pytest.mark.asyncio
+async def test_claim_other_candidate_cancels_prefetch(prefetcher):
+    """Test that picking another candidate cancels the prefetch."""
+    await prefetcher.schedule(1, "https://en.wikipedia.org/wiki/A", "A")
+    task = prefetcher._tasks[1][2]
+
+    assert await prefetcher.claim(1, "https://en.wikipedia.org/wiki/B") is None
+    await asyncio.sleep(0)
+    assert task.cancelled()
+
+@pytest.mark.asyncio
+async def test_prefetch_respects_cost_cap(prefetcher, monkeypatch):
+    """Test that articles above the cost cap are not summarized speculatively."""
+    monkeypatch.setattr(settings, "SPECULATIVE_MAX_CONTENT_LENGTH", 5)
+    url = "https://en.wikipedia.org/wiki/A"
+    await prefetcher.schedule(1, url, "A")
+
+    assert await prefetcher.claim(1, url) is None
+    assert prefetcher.summarizer.calls == 0
+
+@pytest.mark.asyncio
+async def test_unclaimed_finished_prefetches_are_not_pending(prefetcher, monkeypatch):
+    """Test that finished prefetches nobody claimed on this worker don't count against the pending limit."""
+    monkeypatch.setattr(settings, "SPECULATIVE_MAX_PENDING", 2)
+    for query_id in range(1, 4):
+        assert await prefetcher.schedule(query_id, f"https://en.wikipedia.org/wiki/T{query_id}", f"T{query_id}")
+        await prefetcher._tasks[query_id][2]
+
+    assert prefetcher._tasks == {}
+    assert (await prefetcher.claim(3, "https://en.wikipedia.org/wiki/T3")).summary == "Summary: Content of T3"
+
+@pytest.mark.asyncio
+async def test_prefetch_disabled_by_default(prefetcher, monkeypatch):
+    """Test that nothing is scheduled unless speculative mode is enabled."""
+    monkeypatch.setattr(settings, "SPECULATIVE_PREFETCH_ENABLED", False)
+    assert not await prefetcher.schedule(1, "https://en.wikipedia.org/wiki/A", "A")
+    assert await prefetcher.claim(1, "https://en.wikipedia.org/wiki/A") is None
+
+@pytest.mark.asyncio
+async def test_claim_on_another_worker(prefetcher):
+    """Test that a prefetch finished on one worker can be claimed on another."""
+    url = "https://en.wikipedia.org/wiki/A"
+    other_worker = SpeculativePrefetcher(FakeSearcher(), FakeSummarizer(), prefetcher.state, TestingSessionLocal)
+
+    await prefetcher.schedule(1, url, "A")
+    await prefetcher._tasks[1][2]
+
+    prefetched = await other_worker.claim(1, url)
+    assert prefetched is not None
+    assert prefetched.summary == "Summary: Content of A"
+
+@pytest.mark.asyncio
+async def test_prefetch_uses_article_cache(prefetcher, db):
+    """Test that a cached article is not summarized again and a new summary is cached."""
+    cached_url = "https://en.wikipedia.org/wiki/A"
+    db.add(models.Article(
+        url=cached_url, title="A", content="Content of A", summary="Cached summary of A", checked_at=utcnow()
+    ))
+    db.commit()
+
+    await prefetcher.schedule(1, cached_url, "A")
+    assert (await prefetcher.claim(1, cached_url)).summary == "Cached summary of A"
+    assert prefetcher.summarizer.calls == 0
+
+    new_url = "https://en.wikipedia.org/wiki/B"
+    await prefetcher.schedule(2, new_url, "B")
+    await prefetcher.claim(2, new_url)
+    db.expire_all()
+    assert db.query(models.Article).filter(models.Article.url == new_url).one().summary == "Summary: Content of B"
+
+@pytest.mark.asyncio
+async def test_degraded_prefetch_is_discarded(prefetcher):
+    """Test that an extractive fallback summary is neither published nor served as the prefetch."""
+    async def degraded_summary(content, sections=None, on_token=None):
+        return Summary(summary="Extractive", degraded=True)
+
+    prefetcher.summarizer.summarize = degraded_summary
+    url = "https://en.wikipedia.org/wiki/A"
+    await prefetcher.schedule(1, url, "A")
+    await prefetcher._tasks[1][2]
+
+    assert await prefetcher.state.get(prefetcher._result_key(1)) is None
+    assert await prefetcher.claim(1, url) is None
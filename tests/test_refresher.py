@@ -0,0 +1,84 @@
+import pytest
+from app.core.config import settings
+from app.core.shared_state import LocalStateStore
+from app.db import models
+from app.agents.refresher import FreshnessRefresher
+from tests.conftest import TestingSessionLocal
+from tests.mocks import FakeSearcher, FakeSummarizer
+
+def add_article(db, title, revision_id, revision_size, access_count):
+    db.add(models.Article(
+        url=f"https://en.wikipedia.org/wiki/{title}",
+        title=title,
+        content=f"Old content of {title}",
+        summary=f"Old summary of {title}",
+        revision_id=revision_id,
+        revision_size=revision_size,
+        access_count=access_count
+    ))
+    db.commit()
+
+@pytest.fixture
+def refresher_setup(db, monkeypatch):
+    monkeypatch.setattr(settings, "REFRESH_BATCH_SIZE", 2)
+    monkeypatch.setattr(settings, "REFRESH_MIN_DIFF_BYTES", 100)
+    add_article(db, "Unchanged", 1, 5000, 10)
+    add_article(db, "SmallEdit", 1, 5000, 20)
+    add_article(db, "BigEdit", 1, 5000, 5)
+    add_article(db, "HotBigEdit", 1, 5000, 50)
+    searcher = FakeSearcher()
+    searcher.revisions = {
+        "Unchanged": {"revision_id": 1, "size": 5000},
+        "SmallEdit": {"revision_id": 2, "size": 5050},
+        "BigEdit": {"revision_id": 2, "size": 8000},
+        "HotBigEdit": {"revision_id": 2, "size": 2000}
+    }
+    summarizer = FakeSummarizer()
+    refresher = FreshnessRefresher(searcher, summarizer, TestingSessionLocal, LocalStateStore())
+    return refresher, searcher, summarizer
+
+@pytest.mark.asyncio
+async def test_refresh_resummarizes_only_meaningful_changes(refresher_setup, db):
+    """Test that revisions are checked in batches and only big edits are re-summarized."""
+    refresher, searcher, summarizer = refresher_setup
+
+    stats = await refresher.refresh_once()
+
+    assert [len(batch) for batch in searcher.revision_requests] == [2, 2]
+    assert stats == {"checked": 4, "changed": 2, "refreshed": 2, "over_budget": 0}
+    # Most accessed first
+    assert summarizer.summarized == ["Content of HotBigEdit", "Content of BigEdit"]
+
+    db.expire_all()
+    big_edit = db.query(models.Article).filter(models.Article.title == "BigEdit").one()
+    assert big_edit.summary == "Summary: Content of BigEdit"
+    assert big_edit.revision_id == 2 and big_edit.revision_size == 8000
+    small_edit = db.query(models.Article).filter(models.Article.title == "SmallEdit").one()
+    assert small_edit.summary == "Old summary of SmallEdit"
+    assert small_edit.checked_at is not None
+
+@pytest.mark.asyncio
+async def test_refresh_stays_within_token_budget(refresher_setup, db, monkeypatch):
+    """Test that re-summarization stops once the hourly token budget is spent."""
+    refresher, _, summarizer = refresher_setup
+    # Enough for HotBigEdit (2000 bytes ~ 500 tokens) but not BigEdit (8000 bytes ~ 2000 tokens)
+    monkeypatch.setattr(settings, "REFRESH_TOKEN_BUDGET_PER_HOUR", 1000)
+
+    stats = await refresher.refresh_once()
+
+    assert stats["refreshed"] == 1
+    assert stats["over_budget"] == 1
+    assert summarizer.summarized == ["Content of HotBigEdit"]
+    # Left for later, so it isn't served as fresh meanwhile
+    db.expire_all()
+    big_edit = db.query(models.Article).filter(models.Article.title == "BigEdit").one()
+    assert big_edit.checked_at is None
+
+@pytest.mark.asyncio
+async def test_one_worker_runs_each_cycle(refresher_setup):
+    """Test that a second worker skips a cycle that is already running elsewhere."""
+    refresher, searcher, summarizer = refresher_setup
+    other_worker = FreshnessRefresher(searcher, summarizer, TestingSessionLocal, refresher.state)
+
+    await refresher.refresh_once()
+    assert await other_worker.refresh_once() == {"checked": 0, "changed": 0, "refreshed": 0, "over_budget": 0}
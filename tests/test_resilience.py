@@ -0,0 +1,325 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import httpx
+import openai
+import pytest
+import requests
+import wikipedia
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableLambda
+from app.main import app
+from app.core import llm, resilience, usage
+from app.core.config import settings
+from app.core.dependencies import get_topic_extractor, get_wikipedia_searcher, get_summarizer
+from app.core.resilience import CircuitBreaker, CircuitOpenError, get_breaker
+from app.core.shared_state import LocalStateStore
+from app.db import models
+from app.agents import article_cache
+from app.agents.summarizer import Summarizer
+from app.agents.topic_extractor import TopicExtractor
+from app.agents.wikipedia_search import WikipediaArticle, WikipediaDeadlineExceeded, WikipediaSearcher
+from tests.conftest import TestingSessionLocal
+from tests.mocks import FakeSearcher, FakeSummarizer
+
+CONTENT = "\n\n".join(f"Relativity is a theory number {i}. It describes gravity and spacetime." for i in range(50))
+URL = "https://en.wikipedia.org/wiki/Relativity"
+
+@pytest.fixture(autouse=True)
+def fresh_breakers(monkeypatch):
+    monkeypatch.setattr(resilience, "_breakers", {})
+    monkeypatch.setattr(settings, "LLM_BACKEND", "local")
+    monkeypatch.setattr(llm, "_gateway", None)
+
+def open_circuit(name):
+    breaker = get_breaker(name)
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure(httpx.ConnectError("upstream down"))
+    return breaker
+
+@pytest.mark.asyncio
+async def test_breaker_fails_fast_then_recovers():
+    """Test that the circuit opens after repeated failures, rejects calls, and a successful trial closes it."""
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.05, ignored_exceptions=(KeyError,))
+    calls = []
+
+    async def fail():
+        calls.append("fail")
+        raise RuntimeError("down")
+
+    async def succeed():
+        calls.append("ok")
+        return "ok"
+
+    # Answers like "not found" don't count as failures
+    breaker.record_failure(KeyError("missing"))
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            await breaker.call(fail)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        await breaker.call(succeed)
+    assert calls == ["fail", "fail"]
+
+    await asyncio.sleep(0.06)
+    assert breaker.state == "half_open"
+    assert await breaker.call(succeed) == "ok"
+    assert breaker.state == "closed"
+
+@pytest.mark.asyncio
+async def test_deadline_does_not_open_the_circuit(monkeypatch):
+    """Test that calls stopped at WIKIPEDIA_TIMEOUT_SECONDS fail without counting against Wikipedia's circuit."""
+    sent = []
+    monkeypatch.setattr(requests, "get", lambda *args, **kwargs: sent.append(args))
+    monkeypatch.setattr(settings, "WIKIPEDIA_TIMEOUT_SECONDS", 0)
+    searcher = WikipediaSearcher()
+
+    for _ in range(settings.CIRCUIT_FAILURE_THRESHOLD + 1):
+        with pytest.raises(WikipediaDeadlineExceeded):
+            await searcher.get_revisions(["Relativity"])
+    assert searcher.breaker.state == "closed"
+    assert sent == []
+
+@pytest.mark.asyncio
+@pytest.mark.filterwarnings("error::RuntimeWarning")
+async def test_open_llm_circuit_degrades_agents():
+    """Test that with the LLM circuit open, topics are heuristic and summaries extractive, without waiting on the LLM."""
+    open_circuit("llm")
+    tracker = usage.start_tracking()
+
+    topic = await TopicExtractor().extract_topic("What is the theory of relativity?")
+    summary = await Summarizer().summarize(CONTENT)
+
+    assert topic.topic == "Theory of relativity"
+    assert summary.degraded
+    assert summary.summary.startswith("Relativity is a theory")
+    assert tracker.calls == []
+
+@pytest.mark.asyncio
+async def test_programming_errors_are_not_degraded(monkeypatch):
+    """Test that only an unavailable LLM degrades; other errors propagate instead of becoming extractive results."""
+    def broken(*args, **kwargs):
+        raise KeyError("chunk")
+
+    extractor = TopicExtractor()
+    extractor.llm = RunnableLambda(broken)
+    summarizer = Summarizer()
+    monkeypatch.setattr(summarizer, "_summarize_chunks", broken)
+
+    with pytest.raises(KeyError):
+        await extractor.extract_topic("What is the theory of relativity?")
+    with pytest.raises(KeyError):
+        await summarizer.summarize(CONTENT)
+
+@pytest.mark.asyncio
+async def test_partial_stream_is_not_followed_by_extractive_text(monkeypatch):
+    """Test that when the LLM fails mid-stream, the extractive summary replaces it without being streamed."""
+    async def fails_mid_stream(chunks, on_token=None):
+        await on_token("Relativity was ")
+        raise httpx.ConnectError("connection reset")
+
+    summarizer = Summarizer()
+    monkeypatch.setattr(summarizer, "_summarize_chunks", fails_mid_stream)
+    tokens = []
+
+    async def on_token(text):
+        tokens.append(text)
+
+    summary = await summarizer.summarize(CONTENT, on_token=on_token)
+
+    assert tokens == ["Relativity was "]
+    assert summary.degraded
+    assert summary.summary.startswith("Relativity is a theory")
+
+@pytest.mark.asyncio
+async def test_rejected_requests_do_not_open_the_llm_circuit():
+    """Test that errors about the request itself don't count against the LLM circuit, but provider errors do."""
+    class FailingModel(BaseChatModel):
+        error: Exception
+
+        @property
+        def _llm_type(self) -> str:
+            return "failing"
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            raise self.error
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            raise self.error
+
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    too_long = openai.BadRequestError(
+        "context_length_exceeded", response=httpx.Response(400, request=request), body=None
+    )
+    overloaded = openai.InternalServerError("overloaded", response=httpx.Response(503, request=request), body=None)
+    breaker = get_breaker("llm")
+
+    for error in (too_long, KeyError("bug")):
+        model = llm.CircuitBreakerChatModel(model=FailingModel(error=error))
+        for _ in range(breaker.failure_threshold):
+            with pytest.raises(type(error)):
+                await model.ainvoke([HumanMessage(content="hi")])
+        assert breaker.state == "closed"
+
+    model = llm.CircuitBreakerChatModel(model=FailingModel(error=overloaded))
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(openai.InternalServerError):
+            await model.ainvoke([HumanMessage(content="hi")])
+    assert breaker.state == "open"
+
+@pytest.mark.asyncio
+async def test_search_does_not_invent_articles(monkeypatch):
+    """Test that a topic with no article returns None instead of asking the LLM, unless the fallback is enabled."""
+    def no_page(*args, **kwargs):
+        raise wikipedia.exceptions.PageError("Nonexistent topic")
+
+    monkeypatch.setattr(wikipedia, "page", no_page)
+    monkeypatch.setattr(wikipedia, "search", lambda *args, **kwargs: [])
+    searcher = WikipediaSearcher()
+
+    assert await searcher.search("Nonexistent topic") is None
+    assert searcher.breaker.state == "closed"
+
+    monkeypatch.setattr(settings, "WIKIPEDIA_LLM_FALLBACK_ENABLED", True)
+    result = await searcher.search("Nonexistent topic")
+    assert result.title == "Nonexistent topic"
+
+@pytest.mark.asyncio
+async def test_ambiguous_disambiguation_option_falls_back_to_search(monkeypatch):
+    """Test that a disambiguation page whose first option can't be loaded falls back to the fuzzy search."""
+    def page(title, **kwargs):
+        if title == "Mercury":
+            raise wikipedia.exceptions.DisambiguationError("Mercury", ["Mercury (disambiguation)"])
+        raise wikipedia.exceptions.PageError(title)
+
+    monkeypatch.setattr(wikipedia, "page", page)
+    monkeypatch.setattr(wikipedia, "search", lambda *args, **kwargs: [])
+    searcher = WikipediaSearcher()
+
+    assert await searcher.search("Mercury") is None
+    assert searcher.breaker.state == "closed"
+
+@pytest.mark.asyncio
+async def test_search_fails_fast_while_wikipedia_is_down(monkeypatch):
+    """Test that once Wikipedia's circuit is open, searches fail without calling Wikipedia."""
+    attempts = []
+
+    def unreachable(*args, **kwargs):
+        attempts.append(args)
+        raise requests.ConnectionError("connection refused")
+
+    monkeypatch.setattr(wikipedia, "page", unreachable)
+    searcher = WikipediaSearcher()
+    for _ in range(settings.CIRCUIT_FAILURE_THRESHOLD):
+        with pytest.raises(Exception, match="Failed to search Wikipedia"):
+            await searcher.search("Relativity")
+
+    with pytest.raises(CircuitOpenError):
+        await searcher.search("Relativity")
+    assert len(attempts) == settings.CIRCUIT_FAILURE_THRESHOLD
+
+class DownSearcher(FakeSearcher):
+    async def search(self, topic):
+        raise CircuitOpenError("wikipedia is unavailable (circuit open), try again later", retry_after=12.5)
+
+    async def get_article(self, url):
+        raise CircuitOpenError("wikipedia is unavailable (circuit open), try again later", retry_after=12.5)
+
+@pytest.mark.asyncio
+async def test_open_circuit_returns_503(client, db):
+    """Test that endpoints answer 503 with Retry-After while Wikipedia's circuit is open and nothing is cached."""
+    db_query = models.Query(original_query="relativity", extracted_topic="Relativity")
+    db.add(db_query)
+    db.commit()
+    query_id = db_query.id
+    overrides = {
+        get_topic_extractor: TopicExtractor,
+        get_wikipedia_searcher: DownSearcher,
+        get_summarizer: FakeSummarizer
+    }
+    app.dependency_overrides.update(overrides)
+    try:
+        process_response = client.post("/api/v1/process", json={"query": "What is relativity?"})
+        confirm_response = client.post("/api/v1/confirm", json={
+            "query_id": query_id,
+            "user_selected_option": URL
+        })
+    finally:
+        for dependency in overrides:
+            app.dependency_overrides.pop(dependency)
+
+    for response in (process_response, confirm_response):
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "13"
+
+@pytest.mark.asyncio
+async def test_no_transaction_is_held_while_summarizing(db):
+    """Test that the session's connection is released before the slow fetch and summarization."""
+    class CheckingSearcher(FakeSearcher):
+        async def get_article(self, url):
+            assert not db.in_transaction()
+            return await super().get_article(url)
+
+    add_cached_article(db, settings.ARTICLE_CACHE_MAX_AGE_SECONDS + settings.ARTICLE_CACHE_STALE_SECONDS + 60)
+    _, _, summary = await article_cache.summarize_article(db, URL, None, CheckingSearcher(), FakeSummarizer())
+
+    assert summary.summary == "Summary: Content of Relativity"
+
+class UnavailableSearcher:
+    async def get_article(self, url):
+        return None
+
+def add_cached_article(db, age_seconds):
+    db.add(models.Article(
+        url=URL,
+        title="Relativity",
+        content=CONTENT,
+        summary="Cached summary of relativity.",
+        revision_id=1,
+        checked_at=datetime.now(timezone.utc) - timedelta(seconds=age_seconds)
+    ))
+    db.commit()
+
+@pytest.mark.asyncio
+async def test_stale_summary_is_served_and_revalidated(db, monkeypatch):
+    """Test that a summary past its max age but within the stale window is served and re-checked in the background."""
+    scheduled = []
+    monkeypatch.setattr(article_cache, "schedule_revalidation", lambda url, *args: scheduled.append(url))
+    add_cached_article(db, settings.ARTICLE_CACHE_MAX_AGE_SECONDS + 60)
+
+    title, _, summary = await article_cache.summarize_article(db, URL, None, UnavailableSearcher(), Summarizer())
+
+    assert title == "Relativity"
+    assert summary.summary == "Cached summary of relativity."
+    assert scheduled == [URL]
+
+@pytest.mark.asyncio
+async def test_stale_summary_is_served_when_wikipedia_is_down(db):
+    """Test that a summary of any age is served when the article can't be fetched."""
+    add_cached_article(db, settings.ARTICLE_CACHE_MAX_AGE_SECONDS + settings.ARTICLE_CACHE_STALE_SECONDS + 60)
+
+    _, _, summary = await article_cache.summarize_article(db, URL, None, UnavailableSearcher(), Summarizer())
+
+    assert summary.summary == "Cached summary of relativity."
+    other_url = "https://en.wikipedia.org/wiki/Other"
+    assert await article_cache.summarize_article(db, other_url, None, UnavailableSearcher(), Summarizer()) is None
+
+@pytest.mark.asyncio
+async def test_revalidation_marks_unchanged_article_checked(db, monkeypatch):
+    """Test that revalidating an unchanged article refreshes its check time without re-summarizing it."""
+    monkeypatch.setattr(article_cache, "get_shared_state", lambda: LocalStateStore())
+    add_cached_article(db, settings.ARTICLE_CACHE_MAX_AGE_SECONDS + 60)
+
+    class UnchangedSearcher:
+        async def get_article(self, url):
+            return WikipediaArticle(title="Relativity", url=url, content=CONTENT, revision_id=1)
+
+    class FailingSummarizer:
+        async def summarize(self, content, sections=None):
+            raise AssertionError("An unchanged article should not be re-summarized")
+
+    await article_cache.revalidate_article(URL, UnchangedSearcher(), FailingSummarizer(), TestingSessionLocal)
+
+    db.expire_all()
+    article = db.query(models.Article).filter(models.Article.url == URL).first()
+    assert article_cache.is_fresh(article, settings.ARTICLE_CACHE_MAX_AGE_SECONDS)
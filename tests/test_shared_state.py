@@ -0,0 +1,34 @@
+import asyncio
+import pytest
+from app.core.shared_state import SharedStateStore
+
+@pytest.mark.asyncio
+async def test_get_set_and_expiry(state_store):
+    """Test that values round-trip and expire after their TTL."""
+    await state_store.set("cache:a", {"summary": "text"})
+    await state_store.set("cache:b", "short lived", ttl=0.05)
+    assert await state_store.get("cache:a") == {"summary": "text"}
+    assert await state_store.get("cache:b") == "short lived"
+
+    await asyncio.sleep(0.1)
+    assert await state_store.get("cache:b") is None
+    assert await state_store.get("missing") is None
+
+@pytest.mark.asyncio
+async def test_incr_counts_within_window(state_store):
+    """Test that counters accumulate and restart after the window expires."""
+    assert await state_store.incr("budget", 10, ttl=0.1) == 10
+    assert await state_store.incr("budget", 5, ttl=0.1) == 15
+    assert await state_store.get("budget") == 15
+
+    await asyncio.sleep(0.15)
+    assert await state_store.incr("budget", 1, ttl=0.1) == 1
+
+def test_incomplete_backend_fails_on_instantiation():
+    """Test that a backend missing an operation can't be created, rather than failing on first use."""
+    class GetOnlyStore(SharedStateStore):
+        async def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        GetOnlyStore()
@@ -0,0 +1,123 @@
+import asyncio
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from app.agents.summarizer import Summarizer
+from app.agents.wikipedia_search import parse_sections, select_sections
+from app.core import metrics
+from app.core.config import settings
+
+@pytest.mark.asyncio
+async def test_summarize_runs_map_and_combine():
+    """Test that the summarizer maps every chunk and combines the results."""
+    summarizer = Summarizer()
+    content = "\n\n".join(f"Paragraph {i}. " + "word " * 300 for i in range(3))
+    chunks = summarizer.text_splitter.split_text(content)
+    summarizer.map_llm = summarizer.combine_llm = FakeListChatModel(
+        responses=[f"chunk summary {i}" for i in range(len(chunks))] + ["final summary"]
+    )
+
+    spans = metrics.start_request("test")
+    summary = await summarizer.summarize(content)
+
+    assert summary.summary == "final summary"
+    assert [stage for stage, _ in spans] == ["split", "map", "combine"]
+
+@pytest.mark.asyncio
+async def test_long_content_is_reduced_as_a_tree(monkeypatch):
+    """Test that summaries too large for one combine call are merged level by level."""
+    monkeypatch.setattr(settings, "SUMMARY_REDUCE_MAX_TOKENS", 20)
+    summarizer = Summarizer()
+    content = "\n\n".join(f"Paragraph {i}. " + "word " * 300 for i in range(8))
+    summarizer.map_llm = summarizer.combine_llm = FakeListChatModel(responses=["x " * 30])
+
+    spans = metrics.start_request("test")
+    summary = await summarizer.summarize(content)
+
+    stages = [stage for stage, _ in spans]
+    assert stages[:2] == ["split", "map"]
+    assert stages.count("reduce") >= 2
+    assert stages[-1] == "combine"
+    assert summary.summary
+
+class ConcurrencyCountingModel(BaseChatModel):
+    """Answers every call after a short pause, recording the most calls in flight at once."""
+
+    in_flight: int = 0
+    max_in_flight: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "concurrency-counting"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise NotImplementedError
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="summary"))])
+
+@pytest.mark.asyncio
+async def test_map_calls_are_bounded(monkeypatch):
+    """Test that one summarization has at most SUMMARY_MAX_CONCURRENCY LLM calls in flight."""
+    monkeypatch.setattr(settings, "SUMMARY_MAX_CONCURRENCY", 2)
+    summarizer = Summarizer()
+    content = "\n\n".join(f"Paragraph {i}. " + "word " * 300 for i in range(8))
+    summarizer.map_llm = summarizer.combine_llm = ConcurrencyCountingModel()
+
+    await summarizer.summarize(content)
+
+    assert summarizer.map_llm.max_in_flight == 2
+
+def test_batches_always_shrink():
+    """Test that batching never leaves a summary on its own, so every level makes progress."""
+    summarizer = Summarizer()
+    batches = summarizer.batch_summaries(["a" * 400] * 5, max_tokens=50)
+
+    assert sum(len(batch) for batch in batches) == 5
+    assert all(len(batch) >= 2 for batch in batches)
+
+ARTICLE = """Python is a programming language.
+
+== History ==
+Python was conceived in the late 1980s.
+
+=== Early years ===
+The first release came in 1991.
+
+== Syntax ==
+Python uses indentation.
+
+== References ==
+1. A citation.
+
+== External links ==
+Official website"""
+
+def test_chunks_follow_sections_and_skip_low_value_ones():
+    """Test that chunks keep section headings and leave out References and External links."""
+    summarizer = Summarizer()
+    summarizer.chunk_size = 60
+    sections = select_sections(parse_sections(ARTICLE))
+    chunks = summarizer.chunk_sections(sections)
+
+    assert chunks[0] == "Python is a programming language."
+    assert any(chunk.startswith("History\n") for chunk in chunks)
+    assert not any("citation" in chunk or "Official website" in chunk for chunk in chunks)
+
+@pytest.mark.asyncio
+async def test_summarize_selected_sections():
+    """Test that only the requested sections (and their subsections) are summarized."""
+    summarizer = Summarizer()
+    summarizer.map_llm = summarizer.combine_llm = FakeListChatModel(responses=["summary"])
+
+    summary = await summarizer.summarize(ARTICLE, sections=["lead", "History"])
+    assert summary.sections == ["Lead", "History", "Early years"]
+
+    with pytest.raises(ValueError):
+        await summarizer.summarize(ARTICLE, sections=["Reception"])
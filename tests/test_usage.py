@@ -0,0 +1,112 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.core import llm, usage
+from app.core.config import settings
+from app.core.metrics import track_stage
+from app.core.shared_state import LocalStateStore
+from app.db import models
+from app.agents.topic_extractor import TopicExtractor
+from app.agents.summarizer import Summarizer
+
+CONTENT = "\n\n".join(f"Relativity is a theory number {i}. It describes gravity and spacetime." for i in range(50))
+
+@pytest.fixture
+def local_backend(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_BACKEND", "local")
+    monkeypatch.setattr(llm, "_gateway", None)
+    state = LocalStateStore()
+    monkeypatch.setattr(usage, "get_shared_state", lambda: state)
+    monkeypatch.setattr(usage, "_minute_key", lambda: "llm:tokens:test")
+
+def test_estimate_cost_uses_longest_model_prefix():
+    """Test that a dated model name is priced by its most specific LLM_PRICING entry."""
+    mini = settings.LLM_PRICING["gpt-4o-mini"]
+    assert usage.estimate_cost("gpt-4o-mini-2024-07-18", 1000, 1000) == pytest.approx(mini[0] + mini[1])
+    assert usage.estimate_cost("local", 1000, 1000) == 0.0
+
+@pytest.mark.asyncio
+async def test_usage_is_recorded_per_stage(local_backend, db):
+    """Test that every LLM call is recorded with its stage and stored per query."""
+    tracker = usage.start_tracking()
+    with track_stage("topic_extraction"):
+        await TopicExtractor().extract_topic("What is the theory of relativity?")
+    summary = await Summarizer().summarize(CONTENT)
+
+    assert not summary.degraded
+    stages = {call.stage for call in tracker.calls}
+    assert {"topic_extraction", "map", "combine"} <= stages
+    assert all(call.model == "local" and call.prompt_tokens > 0 for call in tracker.calls)
+
+    usage.save_usage(db, 1, "Theory of relativity")
+    rows = db.query(models.LLMUsage).all()
+    assert len(rows) == len(tracker.calls)
+    assert all(row.query_id == 1 and row.topic == "Theory of relativity" for row in rows)
+    # Already saved calls aren't stored twice
+    usage.save_usage(db, 1, "Theory of relativity")
+    assert db.query(models.LLMUsage).count() == len(tracker.calls)
+
+@pytest.mark.asyncio
+async def test_request_budget_degrades_to_extractive(local_backend, monkeypatch):
+    """Test that a request over its token budget gets a heuristic topic and an extractive summary."""
+    monkeypatch.setattr(settings, "LLM_TOKEN_BUDGET_PER_REQUEST", 10)
+    tracker = usage.start_tracking()
+
+    topic = await TopicExtractor().extract_topic("What is the theory of relativity?")
+    summary = await Summarizer().summarize(CONTENT)
+
+    assert topic.topic == "Theory of relativity"
+    assert summary.degraded
+    assert summary.summary.startswith("Relativity is a theory")
+    assert tracker.calls == []
+
+@pytest.mark.asyncio
+async def test_budget_rejects_in_reject_mode(local_backend, monkeypatch):
+    """Test that LLM_BUDGET_MODE=reject raises instead of degrading."""
+    monkeypatch.setattr(settings, "LLM_TOKEN_BUDGET_PER_REQUEST", 10)
+    monkeypatch.setattr(settings, "LLM_BUDGET_MODE", "reject")
+    usage.start_tracking()
+
+    with pytest.raises(usage.TokenBudgetExceeded):
+        await Summarizer().summarize(CONTENT)
+
+@pytest.mark.asyncio
+async def test_minute_budget_is_shared(local_backend, state_store, monkeypatch):
+    """Test that once the per-minute budget is spent, later requests degrade, with either state backend."""
+    monkeypatch.setattr(usage, "get_shared_state", lambda: state_store)
+    summarizer = Summarizer()
+    monkeypatch.setattr(settings, "LLM_TOKEN_BUDGET_PER_MINUTE", 10 ** 9)
+    first_tracker = usage.start_tracking()
+    await summarizer.summarize(CONTENT)
+    monkeypatch.setattr(settings, "LLM_TOKEN_BUDGET_PER_MINUTE", first_tracker.total_tokens + 100)
+
+    usage.start_tracking()
+    summary = await summarizer.summarize(CONTENT)
+
+    assert summary.degraded
+
+@pytest.mark.asyncio
+async def test_usage_api_aggregates(client: TestClient, db):
+    """Test that usage is reported in total, by stage and topic, and per query."""
+    db_query = models.Query(original_query="Tell me about Python", extracted_topic="Python")
+    db.add(db_query)
+    db.commit()
+    query_id = db_query.id
+    db.add_all([
+        models.LLMUsage(query_id=query_id, topic="Python", stage="map", model="gpt-4o-mini",
+                        prompt_tokens=1000, completion_tokens=100, cost=0.2),
+        models.LLMUsage(query_id=query_id, topic="Python", stage="combine", model="gpt-4o-mini",
+                        prompt_tokens=200, completion_tokens=300, cost=0.3),
+        models.LLMUsage(query_id=None, topic="Rust", stage="map", model="gpt-4o-mini",
+                        prompt_tokens=100, completion_tokens=10, cost=0.1)
+    ])
+    db.commit()
+
+    report = client.get("/api/v1/usage").json()
+    assert report["total"]["calls"] == 3
+    assert report["total"]["total_tokens"] == 1710
+    assert [entry["topic"] for entry in report["by_topic"]] == ["Python", "Rust"]
+    assert {entry["stage"]: entry["calls"] for entry in report["by_stage"]} == {"map": 2, "combine": 1}
+
+    query_report = client.get(f"/api/v1/query/{query_id}/usage").json()
+    assert query_report["total"]["cost"] == pytest.approx(0.5)
+    assert client.get("/api/v1/query/999/usage").status_code == 404